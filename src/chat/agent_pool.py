@@ -0,0 +1,150 @@
+# agent_pool.py
+
+import logging
+import threading
+from functools import partial
+from typing import Any, Callable, Dict
+
+from phi.agent import AgentMemory
+from phi.memory.db.postgres import PgMemoryDb
+from phi.storage.agent.postgres import PgAgentStorage
+from phi.tools.duckduckgo import DuckDuckGo
+
+from chat import knowledge
+from chat.custom_knowledge_base import scope_filters
+from chat.token_limit_agent import TokenLimitAgent
+from config import POSTGRES_CONNECTION, MAX_HISTORY
+from utils.llm_helper import get_llm_model, TIER_FAST, TIER_STRONG
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    """
+    Process-wide pool of the expensive parts of a chat agent: the model with its HTTP
+    clients, the SQLAlchemy engines behind PgMemoryDb and PgAgentStorage, and the tools.
+
+    They are built once and shared; each run only gets a cheap TokenLimitAgent bound to its
+    session_id and user_id, a fresh AgentMemory on the shared memory db, and a shallow copy
+    of the model template (so per-run state such as tools and metrics is not shared, while
+    the connection pools of its clients are).
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.agents = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name in self._resources:
+                self.hits += 1
+                return self._resources[name]
+            self.misses += 1
+            self._resources[name] = factory()
+            logger.info(f"Agent pool built shared {name}.")
+            return self._resources[name]
+
+    @staticmethod
+    def _build_model(tier: str):
+        model = get_llm_model(tier)
+        # get_client() builds a new client on every call unless one is set on the model
+        if hasattr(model, 'get_client'):
+            model.client = model.get_client()
+        if hasattr(model, 'get_async_client'):
+            model.async_client = model.get_async_client()
+        return model
+
+    def get_model(self, tier: str = TIER_FAST):
+        """
+        Return a per-run copy of the model template of a tier that shares its clients.
+        """
+        template = self._get(f'model_{tier}', lambda: self._build_model(tier))
+        return template.model_copy(update={
+            'tools': None,
+            'functions': None,
+            'function_call_stack': None,
+            'metrics': {},
+            'session_id': None,
+        })
+
+    def get_memory_db(self) -> PgMemoryDb:
+        return self._get('memory_db', lambda: PgMemoryDb(table_name="agent_memory", db_url=POSTGRES_CONNECTION))
+
+    def get_storage(self) -> PgAgentStorage:
+        return self._get('storage', lambda: PgAgentStorage(table_name="agent_sessions", db_url=POSTGRES_CONNECTION))
+
+    def get_tools(self) -> list:
+        # Toolkits are stateless; add_tool only sets a back-reference to the agent, which DuckDuckGo never reads
+        return self._get('tools', lambda: [DuckDuckGo()])
+
+    def warmup(self):
+        """
+        Build the shared resources ahead of the first message. Blocking; call it from a thread.
+        """
+        self.get_model(TIER_FAST)
+        self.get_model(TIER_STRONG)
+        self.get_memory_db()
+        self.get_storage()
+        self.get_tools()
+
+    def get_agent(self, user_id: str, chat_id: str, description: str, search_knowledge: bool = True,
+                  tier: str = TIER_FAST) -> TokenLimitAgent:
+        """
+        Build the chat agent for one run from the pooled resources.
+
+        Args:
+            user_id (str): Telegram user ID.
+            chat_id (str): Telegram chat ID.
+            description (str): The agent description.
+            search_knowledge (bool): Give the model the knowledge base search tool.
+            tier (str): Model tier, TIER_FAST or TIER_STRONG.
+
+        Returns:
+            TokenLimitAgent: An agent ready to run.
+        """
+        self.agents += 1
+        return TokenLimitAgent(
+            name="Chat Agent",
+            model=self.get_model(tier),
+            session_id=f"{user_id}_{chat_id}",  # Unique per chat
+            user_id=user_id,
+            memory=AgentMemory(
+                 db=self.get_memory_db(),
+                 create_user_memories=True,
+                 create_session_summary=True,
+                 # Updated in the background by chat.memory_pipeline, not at the end of the run
+                 update_user_memories_after_run=False,
+                 update_session_summary_after_run=False,
+                 num_memories=10,
+            ),
+            storage=self.get_storage(),
+            num_history_responses=MAX_HISTORY,
+            description=description,
+            add_datetime_to_instructions=True,
+            add_history_to_messages=True,
+            read_chat_history=True,
+            knowledge=knowledge.knowledge_base,
+            # The knowledge search tool only sees the documents of this conversation's scope
+            retriever=partial(knowledge.knowledge_base.retrieve, **scope_filters(user_id, chat_id)),
+            search_knowledge=search_knowledge,
+            tools=self.get_tools(),
+            telemetry=False,
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'agents': self.agents,
+            'shared_resources': sorted(self._resources),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reuse_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+# Shared by every chat handled in this process
+agent_pool = AgentPool()
@@ -0,0 +1,224 @@
+# agent_runner.py
+
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from phi.agent import Agent, RunResponse
+
+from config import AGENT_MAX_CONCURRENCY, AGENT_RUN_TIMEOUT
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class AgentRunner:
+    """
+    Runs the synchronous Agent.run on a dedicated, bounded thread pool so a long
+    generation never blocks the event loop serving webhooks, crawls and sends.
+
+    Agent.run also does blocking storage reads/writes and synchronous tool calls
+    (knowledge search, DuckDuckGo), which is why a thread pool is used rather than
+    Agent.arun.
+
+    Runs are always streamed on their thread, so a run whose caller gave up stops at the
+    next chunk, before it writes the session to storage. The caller is only released
+    once the thread has returned: the chat's next message can never run on the same
+    session while an abandoned run is still going.
+    """
+
+    def __init__(self, max_concurrency: int = AGENT_MAX_CONCURRENCY, timeout: float = AGENT_RUN_TIMEOUT):
+        """
+        Args:
+            max_concurrency (int): Maximum number of agent runs executing at once.
+            timeout (float): Default timeout in seconds for each run.
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _run(self, agent: Agent, message: Any, abandoned: threading.Event) -> Optional[RunResponse]:
+        # Runs still waiting for a thread when their caller gave up are skipped entirely
+        if abandoned.is_set():
+            return None
+        with self._lock:
+            self.running += 1
+        chunks = agent.run(message, stream=True)
+        try:
+            for _ in chunks:
+                if abandoned.is_set():
+                    return None
+            # The final run response holds the whole content once the stream is consumed
+            return agent.run_response
+        finally:
+            # Closing the generator ends the model stream; the session is only written at its end
+            chunks.close()
+            with self._lock:
+                self.running -= 1
+
+    async def _abandon(self, future: asyncio.Future, abandoned: threading.Event):
+        """
+        Ask the run to stop and wait until its thread has returned.
+        """
+        abandoned.set()
+        await asyncio.wait([future])
+
+    async def run(self, agent: Agent, message: Any, timeout: Optional[float] = None) -> RunResponse:
+        """
+        Run the agent on the pool.
+
+        A run that times out or whose caller is cancelled is abandoned: if it has not
+        started it never will, and if it is already on a thread it stops at its next
+        chunk without saving the session. This returns (or raises) only once the thread is done.
+
+        Args:
+            agent (Agent): The agent to run.
+            message (Any): The message passed to Agent.run.
+            timeout (Optional[float]): Timeout in seconds, defaults to the runner's timeout.
+
+        Returns:
+            RunResponse: The agent response.
+
+        Raises:
+            asyncio.TimeoutError: If the run did not finish in time.
+        """
+        timeout = timeout or self.timeout
+        abandoned = threading.Event()
+        # Copy the context so the run's tool and retrieval spans join the caller's trace
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, context.run, self._run, agent, message, abandoned
+        )
+        try:
+            response = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f"Agent run for session {agent.session_id} timed out after {timeout}s.")
+            await self._abandon(future, abandoned)
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            logger.warning(f"Agent run for session {agent.session_id} cancelled.")
+            await self._abandon(future, abandoned)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return response
+
+    def _stream(self, agent: Agent, message: Any, abandoned: threading.Event, loop: asyncio.AbstractEventLoop,
+                queue: asyncio.Queue):
+        if abandoned.is_set():
+            return
+        with self._lock:
+            self.running += 1
+        try:
+            for chunk in agent.run(message, stream=True):
+                # Stop generating once the caller gave up; closing the generator ends the model stream
+                if abandoned.is_set():
+                    break
+                if chunk.content:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.content)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def stream(
+        self,
+        agent: Agent,
+        message: Any,
+        on_text: Callable[[str], Awaitable[None]],
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Run the agent with streaming on the pool, calling on_text with the text generated so far
+        whenever new tokens arrive. A timed-out or cancelled stream is abandoned like in run().
+
+        Args:
+            agent (Agent): The agent to run.
+            message (Any): The message passed to Agent.run.
+            on_text (Callable): Coroutine function receiving the accumulated text.
+            timeout (Optional[float]): Timeout in seconds, defaults to the runner's timeout.
+
+        Returns:
+            str: The complete response text.
+
+        Raises:
+            asyncio.TimeoutError: If the run did not finish in time.
+        """
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        abandoned = threading.Event()
+        done = object()
+
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._executor, context.run, self._stream, agent, message, abandoned, loop, queue)
+        future.add_done_callback(lambda _: queue.put_nowait(done))
+
+        async def consume() -> str:
+            text = ''
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                text += item
+                # Coalesce whatever else already arrived into a single update
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item is done:
+                        await future  # Re-raise errors from the run
+                        return text
+                    text += item
+                await on_text(text)
+            await future
+            return text
+
+        try:
+            text = await asyncio.wait_for(consume(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f"Agent stream for session {agent.session_id} timed out after {timeout}s.")
+            await self._abandon(future, abandoned)
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            logger.warning(f"Agent stream for session {agent.session_id} cancelled.")
+            await self._abandon(future, abandoned)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return text
+
+    def shutdown(self):
+        """
+        Drop runs that have not started; running ones are not waited for.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+        }
+
+
+# Shared by every chat handled in this process
+agent_runner = AgentRunner()
@@ -10,6 +10,7 @@ import io
 import hashlib
 from pydantic import BaseModel
 from phi.document import Document
+from phi.embedder.base import Embedder
 from phi.knowledge.agent import AgentKnowledge
 from phi.vectordb.pgvector import PgVector
 from bs4 import BeautifulSoup
@@ -20,19 +21,99 @@ from pdfminer.high_level import extract_text
 
 from utils.llm_helper import get_embedder
 from utils.url_helper import is_valid_url, normalize_url
+from utils.response_cache import response_cache
+from utils.pg_pool import retrieval_pool, set_config_statement
+from utils.tracing import span
+from config import KNOWLEDGE_SCOPE, KNOWLEDGE_HYBRID, KNOWLEDGE_TS_CONFIG, KNOWLEDGE_RRF_K, KNOWLEDGE_HYBRID_CANDIDATES
+from chat.vector_index import vector_index
 
 MAX_CHUNK_SIZE = 9000  # bytes
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+_plan_checks = set()  # running background plan checks
+
+def clean_query(query: str) -> str:
+    """Strip the '@username: ' prefix the router puts in front of messages."""
+    return query.split(": ", 1)[-1] if ": " in query else query
+
+
+def scope_filters(user_id: Any, chat_id: Any) -> Dict[str, str]:
+    """
+    Retrieval filters of a conversation: the user's own documents, or with KNOWLEDGE_SCOPE=chat
+    every document shared in the chat.
+    """
+    if KNOWLEDGE_SCOPE == "chat":
+        return {'chat_id': str(chat_id)} if chat_id is not None else {}
+    return {'owner_id': str(user_id)} if user_id is not None else {}
+
+
+def scope_conditions(owner_id: Optional[str], chat_id: Optional[str], params: Dict[str, Any]) -> List[str]:
+    """
+    SQL conditions of a retrieval scope, with their values added to params. Documents without
+    an owner or chat (every document indexed before scoping) are shared with all scopes.
+    """
+    conditions = []
+    if owner_id is not None:
+        conditions.append("(owner_id = :owner_id OR (owner_id IS NULL AND chat_id IS NULL))")
+        params["owner_id"] = str(owner_id)
+    if chat_id is not None:
+        conditions.append("(chat_id = :chat_id OR (owner_id IS NULL AND chat_id IS NULL))")
+        params["chat_id"] = str(chat_id)
+    return conditions
+
+
+def knowledge_scope(filters: Dict[str, str]) -> str:
+    """
+    Response cache scope of a set of retrieval filters, e.g. 'owner_id=42'.
+    """
+    return ",".join(f"{key}={value}" for key, value in sorted(filters.items())) or "global"
+
+
+def format_knowledge_context(chunks: List[Dict[str, Any]]) -> str:
+    """
+    Build the knowledge block sent to the model: one entry per distinct chunk content,
+    each stamped with where it came from and how close it matched.
+
+    Args:
+        chunks (List[Dict[str, Any]]): Results of CustomKnowledgeBase.search_chunks.
+
+    Returns:
+        str: The context block, or an empty string if there are no chunks.
+    """
+    entries = []
+    seen = set()
+    for chunk in chunks:
+        content = (chunk.get("content") or "").strip()
+        key = chunk.get("content_hash") or md5(content.encode()).hexdigest()
+        if not content or key in seen:
+            continue
+        seen.add(key)
+
+        meta_data = chunk.get("meta_data") or {}
+        provenance = [f"document '{chunk.get('name', '')}'"]
+        if meta_data.get("source"):
+            provenance.append(f"source {meta_data['source']}")
+        if meta_data.get("chunk") and meta_data.get("total_chunks"):
+            provenance.append(f"part {meta_data['chunk']}/{meta_data['total_chunks']}")
+        if chunk.get("distance") is not None:
+            provenance.append(f"distance {chunk['distance']:.3f}")
+        entries.append(f"[{len(entries) + 1}] {', '.join(provenance)}\n{content}")
+
+    return "\n\n".join(entries)
+
+
 class CustomKnowledgeBase(AgentKnowledge):
     """
     Custom Knowledge Base that extends CombinedKnowledgeBase to include dynamic document addition.
     """
 
-    def __init__(self, sources: List[AgentKnowledge], vector_db: PgVector):
-        super().__init__(sources=sources, vector_db=vector_db)
+    # Embeds document chunks; the vector_db's embedder (behind the embedding cache) embeds queries
+    ingest_embedder: Optional[Embedder] = None
+
+    def __init__(self, sources: List[AgentKnowledge], vector_db: PgVector, ingest_embedder: Optional[Embedder] = None):
+        super().__init__(sources=sources, vector_db=vector_db, ingest_embedder=ingest_embedder)
 
     @property
     def document_lists(self) -> Iterator[List[Document]]:
@@ -41,43 +122,194 @@ class CustomKnowledgeBase(AgentKnowledge):
             logger.debug(f"Loading documents from {kb.__class__.__name__}")
             yield from kb.document_lists
 
+    def search_chunks(self, query: str, limit: int = 5, query_embedding: Optional[List[float]] = None,
+                      owner_id: Optional[str] = None, chat_id: Optional[str] = None,
+                      document_types: Optional[List[str]] = None, ef_search: Optional[int] = None,
+                      probes: Optional[int] = None, hybrid: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Embed the query and return the closest chunks with their provenance.
+
+        The scope filters are part of the SQL, so with the owner/chat indexes a query only
+        reads the chunks of that scope. Without any filter the whole table is searched.
+        Filtered queries scan the HNSW index iteratively (see VectorIndexManager), so a small
+        scope still fills the limit.
+
+        Args:
+            query (str): The user message, optionally prefixed with '@username: '.
+            limit (int): Maximum number of chunks to return.
+            query_embedding (Optional[List[float]]): Embedding of the cleaned query, if the caller already has it.
+            owner_id (Optional[str]): Only chunks of documents this Telegram user added.
+            chat_id (Optional[str]): Only chunks of documents added in this chat.
+            document_types (Optional[List[str]]): Only these document types, e.g. ['pdf', 'url'].
+            ef_search (Optional[int]): HNSW candidate list size, defaults to VECTOR_EF_SEARCH. Higher is
+                better recall at more latency.
+            probes (Optional[int]): IVFFlat lists probed, defaults to VECTOR_PROBES.
+            hybrid (Optional[bool]): Fuse full-text and vector matches, defaults to KNOWLEDGE_HYBRID.
+
+        Returns:
+            List[Dict[str, Any]]: Chunks with 'id', 'name', 'content', 'meta_data', 'content_hash'
+            and 'distance' (None for chunks only found by full-text search), best first.
+        """
+        cleaned = clean_query(query)
+        if query_embedding is None:
+            logger.info(f"Cleaned query: {cleaned}")
+            query_embedding = self.vector_db.embedder.get_embedding(cleaned)
+
+        sql, params = self._search_query(query_embedding, limit, owner_id, chat_id, document_types,
+                                         query_text=cleaned if (KNOWLEDGE_HYBRID if hybrid is None else hybrid) else None)
+        filtered = owner_id is not None or chat_id is not None or bool(document_types)
+        with span('retrieval.sql', limit=limit), self.vector_db.Session() as sess, sess.begin():
+            sess.execute(*set_config_statement(vector_index.query_settings(ef_search, probes, filtered=filtered)))
+            rows = sess.execute(text(sql), params).mappings().all()
+        return [dict(row) for row in rows]
+
+    async def asearch_chunks(self, query: str, limit: int = 5, query_embedding: Optional[List[float]] = None,
+                             owner_id: Optional[str] = None, chat_id: Optional[str] = None,
+                             document_types: Optional[List[str]] = None, ef_search: Optional[int] = None,
+                             probes: Optional[int] = None, hybrid: Optional[bool] = None,
+                             timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Async search_chunks for the event loop: the query runs on the shared async connection
+        pool instead of blocking a thread on a synchronous session.
+
+        Args:
+            query (str): The user message, optionally prefixed with '@username: '.
+            limit (int): Maximum number of chunks to return.
+            query_embedding (Optional[List[float]]): Embedding of the cleaned query, if the caller already has it.
+            owner_id (Optional[str]): Only chunks of documents this Telegram user added.
+            chat_id (Optional[str]): Only chunks of documents added in this chat.
+            document_types (Optional[List[str]]): Only these document types.
+            ef_search (Optional[int]): HNSW candidate list size for this query; the pool's connections
+                default to VECTOR_EF_SEARCH.
+            probes (Optional[int]): IVFFlat lists probed for this query, defaults to VECTOR_PROBES.
+            hybrid (Optional[bool]): Fuse full-text and vector matches, defaults to KNOWLEDGE_HYBRID.
+            timeout (Optional[float]): Seconds the query may run, defaults to RETRIEVAL_QUERY_TIMEOUT.
+
+        Returns:
+            List[Dict[str, Any]]: Chunks as returned by search_chunks.
+        """
+        cleaned = clean_query(query)
+        if query_embedding is None:
+            query_embedding = await asyncio.to_thread(self.vector_db.embedder.get_embedding, cleaned)
+
+        sql, params = self._search_query(query_embedding, limit, owner_id, chat_id, document_types,
+                                         query_text=cleaned if (KNOWLEDGE_HYBRID if hybrid is None else hybrid) else None)
+        # The pool's connections use the default settings; only a query that differs pays a round trip for its own
+        filtered = owner_id is not None or chat_id is not None or bool(document_types)
+        settings = vector_index.query_settings(ef_search, probes, filtered=filtered)
+        if settings == vector_index.query_settings():
+            settings = None
+        rows = await retrieval_pool.fetch(sql, params, timeout=timeout, settings=settings)
+
+        if vector_index.should_check_plan():
+            task = asyncio.create_task(self._check_plan(sql, params))
+            _plan_checks.add(task)
+            task.add_done_callback(_plan_checks.discard)
+        return rows
+
+    async def _check_plan(self, sql: str, params: Dict[str, Any]):
+        # EXPLAIN without ANALYZE only plans the query
+        try:
+            rows = await retrieval_pool.fetch(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            vector_index.record_plan(rows[0]['QUERY PLAN'][0]['Plan'])
+        except Exception as e:
+            logger.warning(f"Checking the similarity search plan failed: {e}")
+
+    def _search_query(self, query_embedding: List[float], limit: int, owner_id: Optional[str],
+                      chat_id: Optional[str], document_types: Optional[List[str]], query_text: Optional[str] = None):
+        """
+        Build the similarity query. With query_text it is a hybrid query: the vector and full-text
+        candidates are ranked separately and fused with reciprocal rank fusion, in one statement.
+        """
+        params: Dict[str, Any] = {"embedding": json.dumps(query_embedding), "limit": limit}
+        conditions = scope_conditions(owner_id, chat_id, params)
+        if document_types:
+            conditions.append("document_type = ANY(:document_types)")
+            params["document_types"] = list(document_types)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # The operator must match the index's operator class for the index to be used
+        operator = vector_index.operator
+        table = f"{self.vector_db.schema}.{self.vector_db.table_name}"
+        if not query_text:
+            sql = f"""
+                SELECT id, name, content, meta_data, content_hash,
+                       embedding {operator} CAST(:embedding AS vector) AS distance
+                FROM {table}
+                {where}
+                ORDER BY embedding {operator} CAST(:embedding AS vector)
+                LIMIT :limit
+            """
+            return sql, params
+
+        # Any query term may match: the query's lexemes are OR-ed into a tsquery (plainto_tsquery would AND
+        # them), taken as they are from to_tsvector so they are not normalized twice; ts_rank_cd orders by how well
+        params.update(query_text=query_text, ts_config=KNOWLEDGE_TS_CONFIG, rrf_k=KNOWLEDGE_RRF_K,
+                      candidates=max(limit, KNOWLEDGE_HYBRID_CANDIDATES))
+        lexical_where = " AND ".join(conditions + ["content_tsv @@ tsq.query"])
+        sql = f"""
+            WITH tsq AS (
+                SELECT CAST(string_agg(quote_literal(lexeme), ' | ') AS tsquery) AS query
+                FROM unnest(to_tsvector(CAST(:ts_config AS regconfig), :query_text))
+            ),
+            semantic AS (
+                SELECT id, embedding {operator} CAST(:embedding AS vector) AS distance
+                FROM {table}
+                {where}
+                ORDER BY embedding {operator} CAST(:embedding AS vector)
+                LIMIT :candidates
+            ),
+            semantic_ranked AS (
+                SELECT id, distance, ROW_NUMBER() OVER (ORDER BY distance) AS rank FROM semantic
+            ),
+            lexical AS (
+                SELECT id, ts_rank_cd(content_tsv, tsq.query) AS text_rank
+                FROM {table}, tsq
+                WHERE {lexical_where}
+                ORDER BY text_rank DESC
+                LIMIT :candidates
+            ),
+            lexical_ranked AS (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY text_rank DESC) AS rank FROM lexical
+            ),
+            fused AS (
+                SELECT COALESCE(s.id, l.id) AS id, s.distance,
+                       COALESCE(1.0 / (:rrf_k + s.rank), 0) + COALESCE(1.0 / (:rrf_k + l.rank), 0) AS score
+                FROM semantic_ranked s
+                FULL OUTER JOIN lexical_ranked l ON s.id = l.id
+            )
+            SELECT d.id, d.name, d.content, d.meta_data, d.content_hash, f.distance, f.score
+            FROM fused f
+            JOIN {table} d ON d.id = f.id
+            ORDER BY f.score DESC
+            LIMIT :limit
+        """
+        return sql, params
+
+    def retrieve(self, agent=None, query: str = "", num_documents: Optional[int] = None,
+                 owner_id: Optional[str] = None, chat_id: Optional[str] = None, **kwargs) -> Optional[List[Dict[str, Any]]]:
+        """
+        Agent retriever for the knowledge search tool, bound to a scope with functools.partial,
+        so the model can only search the documents of its own conversation.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The chunks as references, or None if nothing was found.
+        """
+        chunks = self.search_chunks(query, num_documents or 5, owner_id=owner_id, chat_id=chat_id)
+        return [
+            {'name': chunk['name'], 'content': chunk['content'], 'meta_data': chunk['meta_data']} for chunk in chunks
+        ] or None
+
     def get_relevant_knowledge(self, query: str) -> str:
         """Get relevant knowledge from the vector database based on the query."""
         try:
-            # Clean the query
-            clean_query = query.split(": ", 1)[-1] if ": " in query else query
-            logger.info(f"Original query: {query}")
-            logger.info(f"Cleaned query: {clean_query}")
-            
-            # Get embedding and perform SQL search
-            import psycopg2
-            conn = psycopg2.connect(self.vector_db.db_url)
-            cur = conn.cursor()
-            
-            query_embedding = self.vector_db.embedder.get_embedding(clean_query)
-            
-            # Get full content using SQL similarity search
-            cur.execute("""
-                SELECT name, content
-                FROM ai.documents
-                ORDER BY embedding <-> %s::vector
-                LIMIT 5;
-            """, (query_embedding,))
-            sql_results = cur.fetchall()
-            
-            if not sql_results:
+            chunks = self.search_chunks(query)
+            if not chunks:
                 logger.info("No results from SQL search")
                 return ""
-            
-            # Format the results
-            relevant_content = []
-            for name, content in sql_results:
-                relevant_content.append(f"From document '{name}': {content}")
-            
-            combined_content = "\n\n".join(relevant_content)
+            combined_content = format_knowledge_context(chunks)
             logger.info(f"Found relevant content length: {len(combined_content)}")
             return combined_content
-                
+
         except Exception as e:
             logger.info(f"Error retrieving knowledge from vector DB: {str(e)}", exc_info=True)
             return ""
@@ -134,14 +366,19 @@ class CustomKnowledgeBase(AgentKnowledge):
         """
         return content.replace("\x00", "\ufffd")
 
-    async def add_document(self, document: Dict[str, Any], document_type: Optional[str] = None):
+    async def add_document(self, document: Dict[str, Any], document_type: Optional[str] = None,
+                           owner_id: Optional[str] = None, chat_id: Optional[str] = None):
         """
         Asynchronously add a document to the CombinedKnowledgeBase.
 
         Args:
             document (Dict[str, Any]): The document to add, containing 'title', 'content', and 'meta_data'.
             document_type (Optional[str]): The type/source of the document (e.g., 'pdf', 'url', 'txt').
+            owner_id (Optional[str]): Telegram user who added the document.
+            chat_id (Optional[str]): Chat the document was added in.
         """
+        owner_id = str(owner_id) if owner_id is not None else None
+        chat_id = str(chat_id) if chat_id is not None else None
         try:
             title = document.get("title", "")
             content = document.get("content", "")
@@ -163,8 +400,10 @@ class CustomKnowledgeBase(AgentKnowledge):
             docs = []
             source_hash = self.compute_content_hash(meta_data.get("source", ""))
             content_hash = self.compute_content_hash(content)
+            # The same source added in another scope is a separate set of chunks
+            id_prefix = "" if owner_id is None and chat_id is None else f"{self.compute_content_hash(f'{owner_id}:{chat_id}')[:12]}_"
             for idx, chunk in enumerate(chunks):
-                chunk_id = f"{source_hash}_{content_hash}_chunk_{idx}"  # Unique ID based on source_hash, content hash and chunk index
+                chunk_id = f"{id_prefix}{source_hash}_{content_hash}_chunk_{idx}"  # Unique ID based on scope, source_hash, content hash and chunk index
                 chunk_meta_data = meta_data.copy()
                 chunk_meta_data['chunk'] = idx + 1
                 chunk_meta_data['total_chunks'] = len(chunks)
@@ -177,7 +416,7 @@ class CustomKnowledgeBase(AgentKnowledge):
 
                 # Manually generate embedding with retry logic
                 try:
-                    embedder = self.vector_db.embedder
+                    embedder = self.ingest_embedder or self.vector_db.embedder
                     embedding = await self.get_embedding_with_retries(embedder, chunk)
                     if not embedding:
                         logger.error(f"Embedding not generated for chunk {idx} of document '{title}'. Skipping.")
@@ -204,13 +443,20 @@ class CustomKnowledgeBase(AgentKnowledge):
                 logger.error("No valid document chunks to insert after embedding generation.")
                 return
 
+            # The full-text column only exists once the hybrid search schema is applied
+            tsv_column = ", content_tsv" if KNOWLEDGE_HYBRID else ""
+            tsv_value = ", to_tsvector(CAST(:ts_config AS regconfig), :tsv_text)" if KNOWLEDGE_HYBRID else ""
+            tsv_update = ", content_tsv = EXCLUDED.content_tsv" if KNOWLEDGE_HYBRID else ""
+
             # Prepare SQL statement with ON CONFLICT clause, including 'document_type'
             insert_query = f"""
             INSERT INTO {self.vector_db.schema}.{self.vector_db.table_name} (
-                id, name, meta_data, filters, content, embedding, usage, content_hash, document_type
+                id, name, meta_data, filters, content, embedding, usage, content_hash, document_type, owner_id, chat_id
+                {tsv_column}
             )
             VALUES (
-                :id, :name, :meta_data, :filters, :content, :embedding, :usage, :content_hash, :document_type
+                :id, :name, :meta_data, :filters, :content, :embedding, :usage, :content_hash, :document_type,
+                :owner_id, :chat_id {tsv_value}
             )
             ON CONFLICT (id) 
             DO UPDATE SET 
@@ -221,12 +467,19 @@ class CustomKnowledgeBase(AgentKnowledge):
                 embedding = EXCLUDED.embedding,
                 usage = EXCLUDED.usage,
                 content_hash = EXCLUDED.content_hash,
-                document_type = EXCLUDED.document_type;
+                document_type = EXCLUDED.document_type,
+                owner_id = EXCLUDED.owner_id,
+                chat_id = EXCLUDED.chat_id{tsv_update};
             """
 
             # Insert documents using a synchronous helper function
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, self._insert_documents_sync, insert_query, docs, document_type)
+            await loop.run_in_executor(
+                None, self._insert_documents_sync, insert_query, docs, document_type, owner_id, chat_id
+            )
+
+            # Cached answers of this scope were generated without this document
+            await response_cache.invalidate(knowledge_scope(scope_filters(owner_id, chat_id)))
 
             logger.debug(f"Indexed {len(docs)} chunks of document in pgvector: {title}")
 
@@ -234,52 +487,51 @@ class CustomKnowledgeBase(AgentKnowledge):
             logger.error(f"Error indexing document '{document.get('title', '')}': {e}")
             raise e
 
-    def _insert_documents_sync(self, insert_query: str, docs: List[Document], document_type: str):
+    def _insert_documents_sync(self, insert_query: str, docs: List[Document], document_type: str,
+                               owner_id: Optional[str] = None, chat_id: Optional[str] = None):
         """
-        Synchronously insert documents into the database.
+        Synchronously insert documents into the database, in one transaction. Errors are raised,
+        so a document is either added completely or reported as failed.
 
         Args:
             insert_query (str): The SQL insert query with ON CONFLICT clause.
             docs (List[Document]): The list of Document instances to insert.
             document_type (str): The type of the document being inserted.
+            owner_id (Optional[str]): Telegram user who added the documents.
+            chat_id (Optional[str]): Chat the documents were added in.
         """
-        try:
-            with self.vector_db.Session() as sess:
-                with sess.begin():
-                    overall_result = None
-                    for doc in docs:
-                        try:
-                            filters = doc.meta_data.get('filters', {})
-                            result = sess.execute(
-                                text(insert_query),
-                                {
-                                    "id": doc.id,
-                                    "name": doc.name,
-                                    "meta_data": json.dumps(doc.meta_data),
-                                    "filters": json.dumps(filters) if filters else '{}',
-                                    "content": doc.content,
-                                    "embedding": json.dumps(doc.embedding),
-                                    "usage": json.dumps(doc.meta_data.get('usage', {})),
-                                    "content_hash": self.compute_content_hash(doc.content),
-                                    "document_type": document_type
-                                }
-                            )
-                            
-                            # Keep track of the last insert result, or aggregate results
-                            overall_result = result
-
-                            if result.rowcount > 0:
-                                logger.info(f"Successfully inserted document with ID: {doc.id}")
-                            else:
-                                logger.warning(f"No rows affected for document ID: {doc.id}")
-                            
-                        except Exception as e:
-                            logger.error(f"Error inserting document ID {doc.id}: {e}")
-                            continue
-
-                    return overall_result  # Or return something meaningful after the loop
-        except Exception as e:
-            logger.error(f"Error during document insertion: {e}")
+        with self.vector_db.Session() as sess:
+            with sess.begin():
+                overall_result = None
+                for doc in docs:
+                    filters = doc.meta_data.get('filters', {})
+                    params = {
+                        "id": doc.id,
+                        "name": doc.name,
+                        "meta_data": json.dumps(doc.meta_data),
+                        "filters": json.dumps(filters) if filters else '{}',
+                        "content": doc.content,
+                        "embedding": json.dumps(doc.embedding),
+                        "usage": json.dumps(doc.meta_data.get('usage', {})),
+                        "content_hash": self.compute_content_hash(doc.content),
+                        "document_type": document_type,
+                        "owner_id": owner_id,
+                        "chat_id": chat_id,
+                    }
+                    if KNOWLEDGE_HYBRID:
+                        # Full-text index of the chunk, its title included, for hybrid search
+                        params.update(ts_config=KNOWLEDGE_TS_CONFIG, tsv_text=f"{doc.name}\n{doc.content}")
+                    result = sess.execute(text(insert_query), params)
+
+                    # Keep track of the last insert result, or aggregate results
+                    overall_result = result
+
+                    if result.rowcount > 0:
+                        logger.info(f"Successfully inserted document with ID: {doc.id}")
+                    else:
+                        logger.warning(f"No rows affected for document ID: {doc.id}")
+
+                return overall_result  # Or return something meaningful after the loop
 
     async def get_embedding_with_retries(self, embedder, text, retries=3, delay=2):
         """
@@ -311,13 +563,16 @@ class CustomKnowledgeBase(AgentKnowledge):
         logger.error(f"All {retries} attempts failed for embedding generation.")
         return None
 
-    async def handle_url(self, url: str, crawled_content: Any):
+    async def handle_url(self, url: str, crawled_content: Any, owner_id: Optional[str] = None,
+                         chat_id: Optional[str] = None):
         """
         Handle crawled URLs by adding their content to the CombinedKnowledgeBase in PostgreSQL.
 
         Args:
             url (str): The URL that was crawled.
             crawled_content (Any): The content retrieved from crawling the URL.
+            owner_id (Optional[str]): Telegram user who shared the URL.
+            chat_id (Optional[str]): Chat the URL was shared in.
         """
         if not is_valid_url(url):
             logger.warning(f"Invalid URL format: {url}")
@@ -343,10 +598,11 @@ class CustomKnowledgeBase(AgentKnowledge):
                 "content": crawled_content,
                 "meta_data": metadata
             }
-            await self.add_document(document, document_type="url")
+            await self.add_document(document, document_type="url", owner_id=owner_id, chat_id=chat_id)
             logger.info(f"Indexed URL in pgvector: {normalized_url}")
         except Exception as e:
             logger.error(f"Error indexing URL {url}: {e}")
+            raise
 
     async def extract_metadata(self, url: str, content: str) -> Dict[str, Any]:
         """
@@ -390,17 +646,21 @@ class CustomKnowledgeBase(AgentKnowledge):
 
         return metadata
 
-    async def is_source_indexed(self, source: str) -> bool:
+    async def is_source_indexed(self, source: str, owner_id: Optional[str] = None, chat_id: Optional[str] = None) -> bool:
         """
-        Check if a source is already indexed.
+        Check if a source is already indexed, within a scope if one is given.
 
         Args:
             source (str): The source URL or file path.
+            owner_id (Optional[str]): Only count documents this Telegram user added.
+            chat_id (Optional[str]): Only count documents added in this chat.
 
         Returns:
             bool: True if the source is already indexed, False otherwise.
         """
-        query = f"SELECT EXISTS(SELECT 1 FROM {self.vector_db.schema}.{self.vector_db.table_name} WHERE meta_data->>'source' = :source)"
+        params = {"source": source}
+        conditions = ["meta_data->>'source' = :source"] + scope_conditions(owner_id, chat_id, params)
+        query = f"SELECT EXISTS(SELECT 1 FROM {self.vector_db.schema}.{self.vector_db.table_name} WHERE {' AND '.join(conditions)})"
         
         logger.debug(f"Checking if source is indexed: {source}")
 
@@ -410,7 +670,7 @@ class CustomKnowledgeBase(AgentKnowledge):
                 None,
                 self._execute_exists_query,
                 query,
-                source
+                params
             )
             logger.debug(f"Duplicate source check result for '{source}': {exists}")
             return exists
@@ -418,20 +678,21 @@ class CustomKnowledgeBase(AgentKnowledge):
             logger.error(f"Error checking duplicate source for '{source}': {e}")
             return False
 
-    def _execute_exists_query(self, query: str, source: str) -> bool:
+    def _execute_exists_query(self, query: str, params: Dict[str, Any]) -> bool:
         """
         Execute the duplicate check query synchronously.
 
         Args:
             query (str): The SQL query to execute.
-            source (str): The source parameter for the query.
+            params (Dict[str, Any]): The source and scope parameters for the query.
 
         Returns:
             bool: Result of the duplicate check.
         """
+        source = params["source"]
         try:
             with self.vector_db.Session() as sess, sess.begin():
-                result = sess.execute(text(query), {"source": source}).scalar()
+                result = sess.execute(text(query), params).scalar()
                 logger.debug(f"Query Result for source '{source}': {result}")
                 return result if result is not None else False
         except Exception as e:
@@ -443,14 +704,15 @@ class CustomKnowledgeBase(AgentKnowledge):
         Handle TXT files by downloading and indexing their content.
 
         Args:
-            file_info (dict): Information about the TXT file, including 'file_url', 'file_name', etc.
+            file_info (dict): Information about the TXT file, including 'file_url', 'file_name', and the
+                'owner_id' and 'chat_id' it was sent by and in.
         """
         if file_info.get('mime_type') != 'text/plain':
             logger.warning(f"Unsupported MIME type for TXT handling: {file_info.get('mime_type')}")
             return
 
         source = file_info['file_url']
-        if await self.is_source_indexed(source):
+        if await self.is_source_indexed(source, **scope_filters(file_info.get('owner_id'), file_info.get('chat_id'))):
             logger.info(f"Duplicate source detected, skipping: {source}")
             return
 
@@ -486,25 +748,28 @@ class CustomKnowledgeBase(AgentKnowledge):
             }
 
             # Add document with 'txt' as document_type
-            await self.add_document(document, document_type="txt")
+            await self.add_document(document, document_type="txt",
+                                    owner_id=file_info.get('owner_id'), chat_id=file_info.get('chat_id'))
             logger.info(f"Indexed TXT file: {file_info['file_name']}")
 
         except Exception as e:
             logger.error(f"Error indexing TXT file {file_info.get('file_name', '')}: {e}")
+            raise
 
     async def handle_pdf_file(self, file_info: dict):
         """
         Handle PDF files by downloading, extracting text, and indexing their content.
 
         Args:
-            file_info (dict): Information about the PDF file, including 'file_url', 'file_name', etc.
+            file_info (dict): Information about the PDF file, including 'file_url', 'file_name', and the
+                'owner_id' and 'chat_id' it was sent by and in.
         """
         if file_info.get('mime_type') != 'application/pdf':
             logger.warning(f"Unsupported MIME type for PDF handling: {file_info.get('mime_type')}")
             return
 
         source = file_info['file_url']
-        if await self.is_source_indexed(source):
+        if await self.is_source_indexed(source, **scope_filters(file_info.get('owner_id'), file_info.get('chat_id'))):
             logger.info(f"Duplicate source detected, skipping: {source}")
             return
 
@@ -552,13 +817,15 @@ class CustomKnowledgeBase(AgentKnowledge):
                 }
 
                 # Add document with 'pdf' as document_type
-                await self.add_document(document, document_type="pdf")
+                await self.add_document(document, document_type="pdf",
+                                        owner_id=file_info.get('owner_id'), chat_id=file_info.get('chat_id'))
                 logger.info(f"Indexed chunk {i + 1}/{len(chunks)} of PDF file: {file_info['file_name']}")
 
             logger.info(f"Successfully processed entire PDF file: {file_info['file_name']}")
 
         except Exception as e:
             logger.error(f"Error indexing PDF file {file_info.get('file_name', '')}: {str(e)}", exc_info=True)
+            raise
 
 
 
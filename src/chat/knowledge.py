@@ -1,49 +1,81 @@
 # knowledge.py
 
 import logging
+from typing import Optional
 
 from phi.vectordb.pgvector import PgVector
 
 from utils.llm_helper import get_embedder
 from .custom_knowledge_base import CustomKnowledgeBase
+from .vector_index import vector_index
 from config import POSTGRES_CONNECTION
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Initialize a unified PgVector for all documents
+# Built on first use instead of at import time, so startup never waits on the
+# embedding provider or Postgres. `knowledge.knowledge_base`, `knowledge.vector_db`
+# and `knowledge.embedder` still work through the module __getattr__ below.
+_knowledge_base: Optional[CustomKnowledgeBase] = None
 
-try:
-    embedder = get_embedder()
-   
-except Exception as e:
-    logger.error(f"Embedder initialization/test failed: {str(e)}")
-    raise
 
+def get_knowledge_base() -> CustomKnowledgeBase:
+    """
+    Return the process-wide knowledge base, creating the embedder and PgVector on first call.
+    Creating them does not call the provider or open a database connection.
+    """
+    global _knowledge_base
+    if _knowledge_base is not None:
+        return _knowledge_base
+
+    try:
+        embedder = get_embedder()
+        # Document chunks are embedded once: they bypass the cache so they do not evict the queries
+        ingest_embedder = get_embedder(cached=False)
+    except Exception as e:
+        logger.error(f"Embedder initialization failed: {str(e)}")
+        raise
 
-# Initialize PgVector with explicit error handling
-try:
     vector_db = PgVector(
         table_name="documents",
         db_url=POSTGRES_CONNECTION,
         embedder=embedder
     )
-    logger.info(f"Vector DB initialized successfully with table: {vector_db.table_name}")
-    
-    # Test vector search functionality
+    logger.info(f"Vector DB initialized with table: {vector_db.table_name}")
+
+    _knowledge_base = CustomKnowledgeBase(
+        sources=[],
+        vector_db=vector_db,
+        ingest_embedder=ingest_embedder,
+    )
+    logger.info("Knowledge base initialized successfully")
+    return _knowledge_base
+
+
+def warmup():
+    """
+    Run a test vector search so the embedding provider and database are known to work.
+    Blocking; call it from a thread.
+    """
+    vector_db = get_knowledge_base().vector_db
     test_results = vector_db.search(
         query="test query",
         limit=1
     )
     logger.info(f"Vector search test {'successful' if test_results is not None else 'failed'}")
-    
-except Exception as e:
-    logger.error(f"Vector DB initialization/test failed: {str(e)}")
-    raise
-
-# Initialize knowledge base
-knowledge_base = CustomKnowledgeBase(
-    sources=[],
-    vector_db=vector_db,
-)
-logger.info("Knowledge base initialized successfully")
\ No newline at end of file
+
+    # Similarity searches without a matching ANN index scan the whole table
+    try:
+        vector_index.check()
+    except Exception as e:
+        logger.warning(f"Checking the vector index failed: {e}")
+
+
+def __getattr__(name):
+    if name == "knowledge_base":
+        return get_knowledge_base()
+    if name == "vector_db":
+        return get_knowledge_base().vector_db
+    if name == "embedder":
+        return get_knowledge_base().vector_db.embedder
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
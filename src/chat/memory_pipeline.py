@@ -0,0 +1,124 @@
+# memory_pipeline.py
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
+
+from phi.agent import Agent
+
+from config import MEMORY_MAX_CONCURRENCY, MEMORY_SUMMARY_TURNS, MEMORY_IDLE_SECONDS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class MemoryPipeline:
+    """
+    Updates user memories and session summaries in the background instead of at the end
+    of every agent run, where they cost extra model calls before the reply is sent.
+
+    Turns are collected per session and processed together after `summary_turns` turns
+    or once the session has been idle for `idle_seconds`: one memory update for all the
+    user messages of the batch and one new session summary. The work runs on its own
+    small thread pool, so it never competes with replies for agent threads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MEMORY_MAX_CONCURRENCY,
+        summary_turns: int = MEMORY_SUMMARY_TURNS,
+        idle_seconds: float = MEMORY_IDLE_SECONDS,
+    ):
+        """
+        Args:
+            max_concurrency (int): Sessions processed at once.
+            summary_turns (int): Turns after which a session is processed right away.
+            idle_seconds (float): Idle time after which a session is processed.
+        """
+        self.summary_turns = summary_turns
+        self.idle_seconds = idle_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="memory")
+
+        self._sessions: Dict[str, dict] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.turns = 0
+        self.batches = 0
+        self.failed = 0
+
+    def record_turn(self, agent: Agent, message: str):
+        """
+        Queue the memory and summary work of a finished run.
+
+        Args:
+            agent (Agent): The agent after its run; its memory holds the session messages.
+            message (str): The user message of the turn.
+        """
+        self.turns += 1
+        state = self._sessions.setdefault(agent.session_id, {'messages': [], 'timer': None})
+        state['agent'] = agent  # The latest run has the most complete session
+        state['messages'].append(message)
+        if state['timer'] is not None:
+            state['timer'].cancel()
+
+        if len(state['messages']) >= self.summary_turns:
+            self._flush(agent.session_id)
+        else:
+            state['timer'] = asyncio.get_running_loop().call_later(self.idle_seconds, self._flush, agent.session_id)
+
+    def _flush(self, session_id: str):
+        state = self._sessions.pop(session_id, None)
+        if state is None:
+            return
+        if state['timer'] is not None:
+            state['timer'].cancel()
+        task = asyncio.create_task(self._process(state['agent'], state['messages']))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, agent: Agent, messages: List[str]):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._process_sync, agent, messages)
+            self.batches += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Memory update failed for session {agent.session_id}: {e}")
+
+    def _process_sync(self, agent: Agent, messages: List[str]):
+        memory = agent.memory
+        if memory.create_user_memories:
+            memory.update_memory(input="\n".join(messages))
+
+        if memory.create_session_summary and agent.storage is not None:
+            summary = memory.update_summary()
+            if summary is not None:
+                # Only replace the summary: newer runs may have written the session meanwhile
+                session = agent.storage.read(session_id=agent.session_id)
+                if session is not None:
+                    session.memory = {**(session.memory or {}), 'summary': summary.to_dict()}
+                    agent.storage.upsert(session=session)
+        logger.info(f"Updated memories and summary for session {agent.session_id} ({len(messages)} turns).")
+
+    async def close(self, timeout: float = 30):
+        """
+        Process every pending session, waiting at most `timeout` seconds.
+        """
+        for session_id in list(self._sessions):
+            self._flush(session_id)
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            'turns': self.turns,
+            'pending_sessions': len(self._sessions),
+            'running': len(self._tasks),
+            'batches': self.batches,
+            'failed': self.failed,
+        }
+
+
+# Shared by every chat handled in this process
+memory_pipeline = MemoryPipeline()
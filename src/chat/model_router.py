@@ -0,0 +1,205 @@
+# model_router.py
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from config import (
+    MODEL_ROUTING_ENABLED, MODEL_LONG_MESSAGE, MODEL_TIER_MAX_INFLIGHT, MODEL_OVERLOAD_COOLDOWN,
+    MODEL_STICKY_SECONDS,
+)
+from utils.llm_helper import TIER_FAST, TIER_STRONG
+from utils.lru import LRUCache
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# A drafting verb with the document it works on within a few words ("write the budget section",
+# "improve our proposal"); the nouns alone ("when is the application deadline?") are questions
+DRAFTING_PATTERN = re.compile(
+    r"\b(draft|write|rewrite|redraft|revise|improve|expand|polish)\b(\W+\w+){0,4}?\W+"
+    r"(application|proposal|budget|milestones?|roadmap|pitch|cover letter|executive summary|section|"
+    r"paragraph|summary|answer|description|letter|draft)\b",
+    re.IGNORECASE,
+)
+SMALL_TALK_PATTERN = re.compile(
+    r"^\s*(hi|hello|hey|gm|thanks?|thank you|thx|ok(ay)?|cool|great|nice|yes|no|sure|bye)\b[\s!.?]*$",
+    re.IGNORECASE,
+)
+OVERLOAD_STATUS_CODES = {429, 503, 529}
+
+
+def user_text(msg: str) -> str:
+    """
+    The user's own words of a pipeline message: without the '@username: ' prefix
+    and the quoted message it replies to.
+    """
+    text = re.sub(r'^@\w+:\s*', '', msg)
+    return text.split(" REPLYING TO: ", 1)[0]
+
+
+def is_overload_error(error: Exception) -> bool:
+    """
+    Whether a model error means the provider is rate limiting or overloaded.
+    """
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    return status in OVERLOAD_STATUS_CODES or 'RateLimit' in type(error).__name__
+
+
+class ModelRouter:
+    """
+    Picks the model tier for each turn with cheap heuristics, so the strong model is only
+    paid for (in cost and latency) where it matters: drafting, attachments and long inputs.
+    Short questions, small talk and clarifications go to the fast tier.
+
+    A tier is overloaded while it has max_inflight runs, or for overload_cooldown seconds
+    after the provider rate limited it; turns then go to the other tier. A turn that fails
+    with a rate limit error is retried once on the other tier (retry_tier).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = MODEL_ROUTING_ENABLED,
+        long_message: int = MODEL_LONG_MESSAGE,
+        max_inflight: int = MODEL_TIER_MAX_INFLIGHT,
+        overload_cooldown: float = MODEL_OVERLOAD_COOLDOWN,
+        sticky_seconds: float = MODEL_STICKY_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            enabled (bool): When False every turn uses the fast tier.
+            long_message (int): Message length in characters from which the strong tier is used.
+            max_inflight (int): Concurrent runs per tier before it counts as overloaded.
+            overload_cooldown (float): Seconds a rate limited tier is avoided.
+            sticky_seconds (float): Seconds after a drafting turn during which follow-ups in the
+                chat stay on the strong tier.
+            clock (Callable): Monotonic time source.
+        """
+        self.enabled = enabled
+        self.long_message = long_message
+        self.max_inflight = max_inflight
+        self.overload_cooldown = overload_cooldown
+        self.sticky_seconds = sticky_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, int] = {TIER_FAST: 0, TIER_STRONG: 0}
+        self._overloaded_until: Dict[str, float] = {TIER_FAST: 0.0, TIER_STRONG: 0.0}
+        self._drafting_chats = LRUCache(max_size=10000)  # chat_id -> time of the last drafting turn
+
+        self.turns: Dict[str, int] = {TIER_FAST: 0, TIER_STRONG: 0}
+        self.reasons: Dict[str, int] = {}
+        self.fallbacks = 0
+        self.retries = 0
+        self.overload_errors = 0
+
+    def classify(self, msg: str, chat_id: str, has_attachment: bool = False) -> Tuple[str, str]:
+        """
+        Classify a turn.
+
+        Args:
+            msg (str): The pipeline message, as passed to next_action.
+            chat_id (str): Telegram chat ID, for the conversation state.
+            has_attachment (bool): Whether the turn came with a file or URLs.
+
+        Returns:
+            Tuple[str, str]: The tier and the reason it was chosen.
+        """
+        if not self.enabled:
+            return TIER_FAST, 'routing_disabled'
+        if has_attachment:
+            return TIER_STRONG, 'attachment'
+
+        text = user_text(msg)
+        if SMALL_TALK_PATTERN.match(text):
+            return TIER_FAST, 'small_talk'
+        if DRAFTING_PATTERN.search(text):
+            self._drafting_chats.put(chat_id, self.clock())
+            return TIER_STRONG, 'drafting'
+        # The length includes a quoted reply: revising a long message needs the strong model
+        if len(msg) >= self.long_message:
+            return TIER_STRONG, 'long_message'
+        drafted_at = self._drafting_chats.get(chat_id)
+        if drafted_at is not None and self.clock() - drafted_at < self.sticky_seconds:
+            return TIER_STRONG, 'drafting_follow_up'
+        return TIER_FAST, 'short_message'
+
+    def is_overloaded(self, tier: str) -> bool:
+        with self._lock:
+            return self._inflight[tier] >= self.max_inflight or self.clock() < self._overloaded_until[tier]
+
+    def choose(self, msg: str, chat_id: str, has_attachment: bool = False) -> str:
+        """
+        Classify a turn and fall back to the other tier if the preferred one is overloaded.
+
+        Returns:
+            str: TIER_FAST or TIER_STRONG.
+        """
+        tier, reason = self.classify(msg, chat_id, has_attachment=has_attachment)
+        other = TIER_STRONG if tier == TIER_FAST else TIER_FAST
+        if self.enabled and self.is_overloaded(tier) and not self.is_overloaded(other):
+            logger.warning(f"Model tier {tier} is overloaded, using {other} for chat {chat_id}.")
+            self.fallbacks += 1
+            tier = other
+        self.turns[tier] += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        logger.info(f"Routing chat {chat_id} to the {tier} model tier ({reason}).")
+        return tier
+
+    def retry_tier(self, tier: str, error: Exception) -> Optional[str]:
+        """
+        The tier to retry a turn on after it failed on the given tier.
+
+        Args:
+            tier (str): The tier the turn failed on.
+            error (Exception): The error of the failed run.
+
+        Returns:
+            Optional[str]: The other tier if the error was a rate limit and the other tier
+                is not overloaded, None if the turn should not be retried.
+        """
+        other = TIER_STRONG if tier == TIER_FAST else TIER_FAST
+        if not self.enabled or not is_overload_error(error) or self.is_overloaded(other):
+            return None
+        logger.warning(f"Model tier {tier} is rate limited, retrying the turn on {other}.")
+        self.retries += 1  # The turn itself was already counted by choose()
+        return other
+
+    @contextmanager
+    def track(self, tier: str):
+        """
+        Count a run against its tier; rate limit errors put the tier in cooldown.
+        """
+        with self._lock:
+            self._inflight[tier] += 1
+        try:
+            yield
+        except Exception as e:
+            if is_overload_error(e):
+                self.overload_errors += 1
+                with self._lock:
+                    self._overloaded_until[tier] = self.clock() + self.overload_cooldown
+                logger.warning(f"Model tier {tier} is rate limited, avoiding it for {self.overload_cooldown}s: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight[tier] -= 1
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'turns': dict(self.turns),
+            'reasons': dict(self.reasons),
+            'inflight': dict(self._inflight),
+            'fallbacks': self.fallbacks,
+            'retries': self.retries,
+            'overload_errors': self.overload_errors,
+        }
+
+
+# Shared by every chat handled in this process
+model_router = ModelRouter()
@@ -0,0 +1,91 @@
+# retrieval_benchmark.py
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+from chat import knowledge
+from utils.metrics import percentile
+from utils.pg_pool import retrieval_pool
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+MODES = {'vector': False, 'hybrid': True}
+
+
+def is_relevant(chunk: Dict[str, Any], expected: str) -> bool:
+    """
+    Whether a chunk is the expected document: its id, its source or its name.
+    """
+    meta_data = chunk.get('meta_data') or {}
+    return expected in (chunk.get('id'), meta_data.get('source')) or expected in (chunk.get('name') or '')
+
+
+def recall(chunks: List[Dict[str, Any]], relevant: List[str]) -> float:
+    """
+    Share of the expected documents found among the chunks.
+    """
+    return sum(any(is_relevant(chunk, expected) for chunk in chunks) for expected in relevant) / len(relevant)
+
+
+async def run(queries: List[Dict[str, Any]], limit: int, rounds: int) -> Dict[str, dict]:
+    """
+    Compare vector-only and hybrid retrieval on the same queries and embeddings.
+
+    Args:
+        queries (List[Dict[str, Any]]): Items with 'query', optional 'owner_id' / 'chat_id' scope and
+            optional 'relevant' (ids, sources or names of the documents that answer it).
+        limit (int): Chunks retrieved per query.
+        rounds (int): Times each query is run per mode; latency is measured over all of them.
+
+    Returns:
+        Dict[str, dict]: Latency percentiles and recall per mode, and the overlap of their results.
+    """
+    kb = knowledge.knowledge_base
+    # Embeddings are computed once and shared, so only the database query is timed
+    embeddings = [await asyncio.to_thread(kb.vector_db.embedder.get_embedding, item['query']) for item in queries]
+
+    report, results = {}, {}
+    for mode, hybrid in MODES.items():
+        latencies, recalls = [], []
+        for _ in range(rounds):
+            for index, (item, embedding) in enumerate(zip(queries, embeddings)):
+                started = time.monotonic()
+                chunks = await kb.asearch_chunks(
+                    item['query'], limit, query_embedding=embedding, owner_id=item.get('owner_id'),
+                    chat_id=item.get('chat_id'), hybrid=hybrid,
+                )
+                latencies.append((time.monotonic() - started) * 1000)
+                results[(mode, index)] = [chunk['id'] for chunk in chunks]
+                if item.get('relevant'):
+                    recalls.append(recall(chunks, item['relevant']))
+        report[mode] = {
+            'queries': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            f'recall@{limit}': round(sum(recalls) / len(recalls), 4) if recalls else None,
+        }
+
+    overlaps = [
+        len(set(results[('vector', index)]) & set(results[('hybrid', index)])) / limit for index in range(len(queries))
+    ]
+    report['overlap'] = round(sum(overlaps) / len(overlaps), 4) if overlaps else None
+    await retrieval_pool.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and recall of vector-only and hybrid retrieval.")
+    parser.add_argument('queries', help='JSON lines file: {"query": ..., "owner_id": ..., "relevant": [...]}')
+    parser.add_argument('--limit', type=int, default=5, help="chunks retrieved per query")
+    parser.add_argument('--rounds', type=int, default=3, help="runs of each query per mode")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with open(args.queries) as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    print(json.dumps(asyncio.run(run(items, args.limit, args.rounds)), indent=2))
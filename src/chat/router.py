@@ -1,84 +1,229 @@
 # router.py
 
+import asyncio
 import logging
+import time
 
-from phi.agent import Agent, RunResponse, AgentMemory
-from phi.memory.db.postgres import PgMemoryDb
-from phi.storage.agent.postgres import PgAgentStorage
-from phi.tools.duckduckgo import DuckDuckGo
-from utils.llm_helper import get_embedder
-from chat import prompts, knowledge
-from chat.token_limit_agent import TokenLimitAgent
+from phi.agent import Agent, RunResponse
+from chat import knowledge
+from chat.custom_knowledge_base import clean_query, format_knowledge_context, knowledge_scope, scope_filters
+from chat.agent_pool import agent_pool
+from chat.agent_runner import agent_runner
+from chat.model_router import model_router
+from chat.memory_pipeline import memory_pipeline
 from chat.prompts.prompts_medium import ABOUT, BACKGROUND
-from config import POSTGRES_CONNECTION, MAX_HISTORY
-from utils.llm_helper import get_llm_model
-import psycopg2
-import json
-import hashlib
+from config import KNOWLEDGE_CHUNKS, KNOWLEDGE_MAX_DISTANCE, RESPONSE_CACHE_CONTEXT_TURNS
 from utils.get_applications import save_response
+from utils.pagerduty import sendAlert
+from utils.response_cache import response_cache, context_digest
+from utils.tracing import span, record_span
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-async def next_action(msg: str, user_id: str, chat_id: str, mongo, reply_function=None, processing_id=None):
+TIMEOUT_NOTICE = "⌛ Sorry, that took too long to answer. Please try again."
+ERROR_NOTICE = "⚠️ Sorry, something went wrong while answering. Please try again."
+
+def record_run_spans(agent: Agent):
+    """
+    Record a span for every model call and tool call of the agent's last run, from the
+    timings phidata keeps in the run messages.
+    """
+    if agent.run_response is None:
+        return
+    for message in agent.run_response.messages or []:
+        duration = (message.metrics or {}).get('time')
+        if duration is None:
+            continue
+        if message.role == 'assistant':
+            record_span('llm.call', duration, model=agent.model.id if agent.model else None)
+        elif message.role == 'tool':
+            record_span(f"tool.{message.tool_name}", duration)
+
+
+async def next_action(msg: str, user_id: str, chat_id: str, mongo, reply_function=None, processing_id=None,
+                      stream_reply=None, has_attachment: bool = False):
     logger.info(f"Starting next action for user {user_id} with message: {msg[:50]}...")
 
-    # Get knowledge first
-    logger.info("Retrieving relevant knowledge...")
-    try:
-        relevant_knowledge = knowledge.knowledge_base.get_relevant_knowledge(msg)
-        logger.info(f"Retrieved knowledge length: {len(relevant_knowledge) if relevant_knowledge else 0}")
-        
-        # Create context with the retrieved knowledge
+    started = time.monotonic()
+    query = clean_query(msg)
+    description = f"{ABOUT}\n\nBackground Information:\n{BACKGROUND}"
+    # Only the documents of this user (or chat) are searched and cached answers are kept per scope
+    filters = scope_filters(user_id, chat_id)
+    scope = knowledge_scope(filters)
+    tier = model_router.choose(msg, chat_id, has_attachment=has_attachment)
+    agent = agent_pool.get_agent(user_id, chat_id, description=description, tier=tier)
+
+    # Prefetch everything the run needs concurrently, so the wait before the model call
+    # is the slowest dependency instead of the sum of all of them
+    timings = {}
+
+    async def timed(name, func, *args, **kwargs):
+        step_started = time.monotonic()
+        try:
+            with span(name):
+                return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            timings[name] = time.monotonic() - step_started
+
+    # The session is needed early: the response cache key depends on the recent answers
+    session_task = asyncio.ensure_future(timed('session', agent.prefetch_session))
+    cacheable = response_cache.enabled and response_cache.cacheable(msg, query)
+
+    async def fetch_knowledge():
+        # The query embedding serves both the response cache and the knowledge search
+        embedding = None
+        try:
+            embedding = await timed('embedding', knowledge.embedder.get_embedding, query)
+        except Exception as e:
+            logger.error(f"Query embedding failed: {str(e)}")
+
+        context = None
+        if embedding and cacheable:
+            await asyncio.wait([session_task])
+            if not session_task.cancelled() and session_task.exception() is None:
+                context = context_digest(agent.recent_responses(RESPONSE_CACHE_CONTEXT_TURNS))
+                cached = await response_cache.lookup(scope, embedding, context)
+                if cached:
+                    return embedding, context, cached, []
+
+        # Single retrieval pass: the knowledge goes into the user message once, stamped with its provenance
+        found = []
+        retrieval_started = time.monotonic()
+        try:
+            with span('retrieval'):
+                found = await knowledge.knowledge_base.asearch_chunks(
+                    msg, KNOWLEDGE_CHUNKS, query_embedding=embedding, **filters
+                )
+        except Exception as e:
+            logger.error(f"Knowledge retrieval failed: {str(e)}")
+        timings['retrieval'] = time.monotonic() - retrieval_started
+        return embedding, context, None, found
+
+    fetched, memories, session = await asyncio.gather(
+        fetch_knowledge(),
+        timed('memories', agent.prefetch_memories),
+        session_task,
+        return_exceptions=True,
+    )
+    if isinstance(fetched, BaseException):
+        # Answer without prefetched knowledge or the cache rather than failing the turn
+        logger.error(f"Prefetching knowledge failed, answering without it: {fetched!r}")
+        fetched = (None, None, None, [])
+    query_embedding, cache_context, cached, chunks = fetched
+    for name, result in (('memories', memories), ('session', session)):
+        if isinstance(result, BaseException):
+            logger.warning(f"Prefetching {name} failed, the run will read it itself: {result!r}")
+    logger.info(
+        "Prefetch timings: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items())
+        + f", total {time.monotonic() - started:.3f}s"
+    )
+
+    if cached:
+        content = cached['response']
+        if reply_function:
+            await reply_function(content)
+        # No model ran, but the turn still belongs to the conversation: history, memories and saved response
+        try:
+            await asyncio.to_thread(agent.record_turn, msg, content)
+            memory_pipeline.record_turn(agent, msg)
+        except Exception as e:
+            logger.error(f"Recording the cached turn failed for user {user_id}: {str(e)}")
+        if reply_function:
+            with span('save_response'):
+                await save_response(content, user_id, chat_id)
+        return
+
+    relevant_knowledge = format_knowledge_context(chunks)
+    logger.info(f"Retrieved knowledge length: {len(relevant_knowledge)}")
+
+    if relevant_knowledge:
         context = f"""
         Available Information about the user's project:
         {relevant_knowledge}
 
         User Query: {msg}
         """
-        logger.info(f"Created context with knowledge and query")
-        
-    except Exception as e:
-        logger.error(f"Knowledge retrieval failed: {str(e)}")
-        context = msg  # Fallback to just the message if knowledge retrieval fails
-
-    agent = TokenLimitAgent(
-        name="Chat Agent",
-        model=get_llm_model(),
-        session_id=f"{user_id}_{chat_id}",  # Unique per chat
-        user_id=user_id,
-        memory=AgentMemory(
-             db=PgMemoryDb(table_name="agent_memory", db_url=POSTGRES_CONNECTION), 
-             create_user_memories=True, 
-             create_session_summary=True,
-             num_memories=10,
-        ),
-        storage=PgAgentStorage(table_name="agent_sessions", db_url=POSTGRES_CONNECTION),
-        num_history_responses=MAX_HISTORY,
-        description=f"{ABOUT}\n\nBackground Information:\n{BACKGROUND}\n\nContext:\n{relevant_knowledge}",
-        add_datetime_to_instructions=True,
-        add_history_to_messages=True,
-        read_chat_history=True,
-        knowledge=knowledge.knowledge_base,
-        search_knowledge=True,
-        tools=[DuckDuckGo()],
-        telemetry=False,
+    else:
+        context = msg  # Fallback to just the message if there is no knowledge
+
+    # The knowledge search tool costs an extra model round trip, so only offer it when the prefetched context is weak
+    distances = [chunk['distance'] for chunk in chunks if chunk.get('distance') is not None]
+    search_knowledge = not distances or min(distances) > KNOWLEDGE_MAX_DISTANCE
+    agent.search_knowledge = search_knowledge
+    logger.info(
+        f"Prompt estimate: ~{(len(description) + len(context)) // 4} tokens "
+        f"(knowledge ~{len(relevant_knowledge) // 4} tokens from {len(chunks)} chunks, search_knowledge={search_knowledge})"
     )
-    
+
+    async def generate(agent: Agent, tier: str) -> str:
+        with span('llm.generation', stream=bool(stream_reply), tier=tier), model_router.track(tier):
+            if reply:
+                content = await agent_runner.stream(agent, context, reply.update)
+            else:
+                response: RunResponse = await agent_runner.run(agent, context)
+                content = response.get_content_as_string()
+            record_run_spans(agent)
+        return content
+
+    reply = None
+    delivered = False  # Once the user has seen the answer or a failure notice, the turn must not be retried
     try:
         logger.info("Running agent with retrieved knowledge in context")
-        response: RunResponse = agent.run(context)
-        logger.info(f"Agent response generated successfully for user {user_id}.")
-        logger.info(f"Agent response: {response.get_content_as_string()}")
-        
+        if stream_reply:
+            # Show the answer while it is generated instead of after the whole run
+            reply = stream_reply()
+            await reply.start()
+        try:
+            content = await generate(agent, tier)
+        except Exception as e:
+            # A rate limited turn is retried once on the other tier, unless part of it is already shown
+            retry_tier = model_router.retry_tier(tier, e)
+            if retry_tier is None or (reply and reply.text):
+                raise
+            tier = retry_tier
+            agent = agent_pool.get_agent(user_id, chat_id, description=description, tier=tier)
+            agent.search_knowledge = search_knowledge
+            content = await generate(agent, tier)
+        if reply:
+            await reply.finish(content)
+            reply = None  # Delivered; a later failure must not touch it
+            delivered = True
+        input_tokens = agent.run_response.metrics.get('input_tokens', []) if agent.run_response else []
+        logger.info(f"Agent response generated successfully for user {user_id} "
+                    f"({len(input_tokens)} model calls, {sum(input_tokens)} input tokens).")
+        logger.info(f"Agent response: {content}")
+        memory_pipeline.record_turn(agent, msg)
+
+        if query_embedding and cache_context:
+            await response_cache.store(scope, query, query_embedding, content, input_tokens=sum(input_tokens),
+                                       latency=time.monotonic() - started, context=cache_context)
+
         if reply_function:
-            #save the response to the database
-            await save_response(response.get_content_as_string(), user_id, chat_id)
-            await reply_function(response.get_content_as_string())
+            if not stream_reply:
+                await reply_function(content)
+                delivered = True
+            # Save the response to the database once the user has it (written in the background)
+            with span('save_response'):
+                await save_response(content, user_id, chat_id)
         
         return
+    except asyncio.TimeoutError:
+        if reply:
+            await reply.fail(TIMEOUT_NOTICE)
+        elif reply_function:
+            await reply_function(TIMEOUT_NOTICE)
+        return
     except Exception as e:
         logger.error(f"Error during agent action for user {user_id}: {str(e)}")
+        if reply:
+            # Never leave the placeholder of a failed stream in the chat
+            await reply.fail(ERROR_NOTICE)
+            delivered = True
+        if delivered:
+            # Raising would retry the update, posting the answer or the notice again: alert here instead
+            await sendAlert(f"next_action for user {user_id}: {msg[:100]} | error: {str(e)}")
+            return
         raise
 
 
@@ -4,7 +4,8 @@ import logging
 from typing import Any, List, Optional, Tuple, Union, Dict
 from collections import deque
 from phi.model.message import Message
-from phi.agent import Agent
+from phi.agent import Agent, RunResponse
+from phi.memory.agent import AgentRun
 from config import TOKEN_LIMIT, TOOL_MESSAGE_CHAR_TRUNCATE_LIMIT, MAX_HISTORY
 
 # Setup logging
@@ -17,8 +18,70 @@ class TokenLimitAgent(Agent):
     An Agent that enforces a token limit on the messages sent to the model when first loading chat history.
     It truncates the content of the oldest 'tool' messages to the first 1000 characters
     until the total token count is within the specified limit.
+
+    The session and user memories can be read ahead of the run (prefetch_session,
+    prefetch_memories), concurrently with other work; the run then uses them instead
+    of reading storage again.
     """
 
+    _session_prefetched: bool = False
+    _memories_prefetched: bool = False
+
+    def prefetch_session(self) -> None:
+        """Read the AgentSession from storage ahead of the run. Blocking."""
+        if self.storage is not None and self.session_id is not None:
+            self._agent_session = self.storage.read(session_id=self.session_id)
+        self._session_prefetched = True
+
+    def prefetch_memories(self) -> None:
+        """Load the user memories ahead of the run. Blocking."""
+        self.load_user_memories()
+        self._memories_prefetched = True
+
+    def read_from_storage(self):
+        """
+        Use the prefetched session and memories for the first read of the run, and read
+        storage as usual for anything that was not prefetched.
+        """
+        if not (self._session_prefetched or self._memories_prefetched):
+            return super().read_from_storage()
+
+        if self._session_prefetched:
+            if self._agent_session is not None:
+                self.from_agent_session(session=self._agent_session)
+        elif self.storage is not None and self.session_id is not None:
+            self._agent_session = self.storage.read(session_id=self.session_id)
+            if self._agent_session is not None:
+                self.from_agent_session(session=self._agent_session)
+
+        if not self._memories_prefetched:
+            self.load_user_memories()
+
+        self._session_prefetched = False
+        self._memories_prefetched = False
+        return self._agent_session
+
+    def recent_responses(self, turns: int) -> List[str]:
+        """The last `turns` answers of the prefetched session, oldest first."""
+        session = self._agent_session
+        runs = ((session.memory or {}).get('runs') or []) if session is not None else []
+        responses = [str((run.get('response') or {}).get('content') or '') for run in runs]
+        return responses[-turns:] if turns > 0 else []
+
+    def record_turn(self, message: str, response: str) -> None:
+        """
+        Add a turn answered without running the model (e.g. from the response cache) to the
+        session, so the history stays complete. Blocking.
+        """
+        self.read_from_storage()
+        user_message = Message(role=self.user_message_role, content=message)
+        assistant_message = Message(role="assistant", content=response)
+        self.run_response = RunResponse(content=response, messages=[user_message, assistant_message],
+                                        session_id=self.session_id, agent_id=self.agent_id)
+        self.memory.add_messages(messages=[user_message, assistant_message])
+        self.memory.add_run(AgentRun(message=user_message, response=self.run_response))
+        self.write_to_storage()
+
     def get_messages_for_run(
         self,
         *,
@@ -0,0 +1,290 @@
+# vector_index.py
+
+import argparse
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from config import (
+    POSTGRES_CONNECTION, VECTOR_INDEX_TYPE, VECTOR_DISTANCE, VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION,
+    VECTOR_IVFFLAT_LISTS, VECTOR_EF_SEARCH, VECTOR_PROBES, VECTOR_PLAN_CHECK_EVERY, VECTOR_ITERATIVE_SCAN,
+    VECTOR_FILTERED_EF_SEARCH,
+)
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Distance metric -> (query operator, operator class of the index)
+DISTANCE_OPS = {
+    'cosine': ('<=>', 'vector_cosine_ops'),
+    'l2': ('<->', 'vector_l2_ops'),
+    'inner_product': ('<#>', 'vector_ip_ops'),
+}
+INDEX_TYPES = ('hnsw', 'ivfflat')
+
+
+def find_seq_scans(plan: Dict[str, Any], table: str) -> List[Dict[str, Any]]:
+    """
+    Return the sequential scans of a table in an EXPLAIN (FORMAT JSON) plan node and its children.
+    """
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') == table:
+        scans.append(plan)
+    for child in plan.get('Plans', []):
+        scans.extend(find_seq_scans(child, table))
+    return scans
+
+
+class VectorIndexManager:
+    """
+    Owns the ANN index on the embedding column of the knowledge table.
+
+    The index type (HNSW or IVFFlat) and distance metric are configured together with the
+    query operator, so the similarity queries always match an index that can serve them
+    (an index built for one metric is ignored by queries ordering by another). Recall is
+    tuned per query with hnsw.ef_search and ivfflat.probes.
+
+    HNSW applies WHERE filters after the index scan: of the ef_search nearest candidates, only
+    those of the filtered scope are kept, so a selective filter (one owner's documents) can
+    return fewer rows than the LIMIT. Filtered queries therefore use iterative index scans
+    (hnsw.iterative_scan, pgvector >= 0.8), which keep scanning until enough rows pass, or on
+    older pgvector a larger candidate list (filtered_ef_search).
+    """
+
+    def __init__(
+        self,
+        schema: str = "ai",
+        table: str = "documents",
+        column: str = "embedding",
+        index_type: str = VECTOR_INDEX_TYPE,
+        distance: str = VECTOR_DISTANCE,
+        hnsw_m: int = VECTOR_HNSW_M,
+        hnsw_ef_construction: int = VECTOR_HNSW_EF_CONSTRUCTION,
+        ivfflat_lists: int = VECTOR_IVFFLAT_LISTS,
+        ef_search: int = VECTOR_EF_SEARCH,
+        probes: int = VECTOR_PROBES,
+        iterative_scan: str = VECTOR_ITERATIVE_SCAN,
+        filtered_ef_search: int = VECTOR_FILTERED_EF_SEARCH,
+        plan_check_every: int = VECTOR_PLAN_CHECK_EVERY,
+        db_url: str = POSTGRES_CONNECTION,
+    ):
+        """
+        Args:
+            schema (str): Schema of the knowledge table.
+            table (str): The knowledge table.
+            column (str): The vector column.
+            index_type (str): 'hnsw' or 'ivfflat'.
+            distance (str): 'cosine', 'l2' or 'inner_product'.
+            hnsw_m (int): HNSW connections per node.
+            hnsw_ef_construction (int): HNSW candidate list size while building.
+            ivfflat_lists (int): IVFFlat lists, 0 to derive them from the row count.
+            ef_search (int): Default HNSW candidate list size per query.
+            probes (int): Default IVFFlat lists probed per query.
+            iterative_scan (str): hnsw.iterative_scan mode ('strict_order', 'relaxed_order'), empty
+                for pgvector versions before 0.8.
+            filtered_ef_search (int): HNSW candidate list size of filtered queries without iterative scans.
+            plan_check_every (int): Searches between two plan checks, 0 to never check.
+            db_url (str): SQLAlchemy database URL used for index maintenance.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported vector index type '{index_type}', use one of {INDEX_TYPES}.")
+        if distance not in DISTANCE_OPS:
+            raise ValueError(f"Unsupported vector distance '{distance}', use one of {tuple(DISTANCE_OPS)}.")
+        self.schema = schema
+        self.table = table
+        self.column = column
+        self.index_type = index_type
+        self.distance = distance
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ivfflat_lists = ivfflat_lists
+        self.ef_search = ef_search
+        self.probes = probes
+        self.iterative_scan = iterative_scan
+        self.filtered_ef_search = filtered_ef_search
+        self.plan_check_every = plan_check_every
+        self.db_url = db_url
+        self._engine: Optional[Engine] = None
+
+        self.searches = 0
+        self.plan_checks = 0
+        self.seq_scans = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+            self._engine = create_engine(self.db_url, isolation_level="AUTOCOMMIT", pool_pre_ping=True)
+        return self._engine
+
+    @property
+    def operator(self) -> str:
+        return DISTANCE_OPS[self.distance][0]
+
+    @property
+    def opclass(self) -> str:
+        return DISTANCE_OPS[self.distance][1]
+
+    @property
+    def index_name(self) -> str:
+        return f"idx_{self.table}_{self.column}_{self.index_type}_{self.distance}"
+
+    def query_settings(self, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                       filtered: bool = False) -> Dict[str, str]:
+        """
+        Planner settings for a similarity query, defaulting to the configured recall.
+
+        Args:
+            ef_search (Optional[int]): HNSW candidate list size, defaults to the configured one.
+            probes (Optional[int]): IVFFlat lists probed, defaults to the configured number.
+            filtered (bool): Whether the query has a WHERE filter; without iterative scans it then
+                searches at least filtered_ef_search candidates.
+
+        Returns:
+            Dict[str, str]: Server settings for the query.
+        """
+        if filtered and not self.iterative_scan:
+            ef_search = max(ef_search or self.ef_search, self.filtered_ef_search)
+        settings = {
+            'hnsw.ef_search': str(ef_search or self.ef_search),
+            'ivfflat.probes': str(probes or self.probes),
+        }
+        if self.iterative_scan:
+            settings['hnsw.iterative_scan'] = self.iterative_scan
+        return settings
+
+    def create_index_sql(self, name: Optional[str] = None, lists: Optional[int] = None) -> str:
+        if self.index_type == 'hnsw':
+            options = f"m = {self.hnsw_m}, ef_construction = {self.hnsw_ef_construction}"
+        else:
+            options = f"lists = {lists or self.ivfflat_lists or 100}"
+        return (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name or self.index_name} "
+            f"ON {self.schema}.{self.table} USING {self.index_type} ({self.column} {self.opclass}) WITH ({options})"
+        )
+
+    def vector_indexes(self) -> List[Dict[str, Any]]:
+        """
+        The ANN indexes on the vector column, with whether they serve the configured metric.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT indexname, indexdef, pg_relation_size(format('%I.%I', schemaname, indexname)::regclass) AS bytes
+                FROM pg_indexes
+                WHERE schemaname = :schema AND tablename = :table
+                  AND (indexdef ILIKE '%USING hnsw%' OR indexdef ILIKE '%USING ivfflat%')
+            """), {'schema': self.schema, 'table': self.table}).mappings().all()
+        return [
+            {**row, 'matches': f"USING {self.index_type}" in row['indexdef'] and self.opclass in row['indexdef']}
+            for row in rows
+        ]
+
+    def _auto_lists(self) -> int:
+        # pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) above
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT count(*) FROM {self.schema}.{self.table}")).scalar() or 0
+        return max(10, rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5))
+
+    def ensure(self):
+        """
+        Create the configured index if the table has none serving the configured metric.
+        """
+        if any(index['matches'] for index in self.vector_indexes()):
+            return
+        self._create(self.index_name)
+
+    def _create(self, name: str):
+        lists = self._auto_lists() if self.index_type == 'ivfflat' and not self.ivfflat_lists else None
+        sql = self.create_index_sql(name, lists=lists)
+        logger.info(f"Building vector index: {sql}")
+        with self.engine.connect() as conn:
+            conn.execute(text(sql))
+        logger.info(f"Vector index {name} is ready.")
+
+    def rebuild(self):
+        """
+        Build a fresh index next to the current one, then swap it in and drop the old ANN
+        indexes, all CONCURRENTLY, so queries keep being served during the rebuild.
+        """
+        existing = self.vector_indexes()
+        building = f"{self.index_name}_new"
+        with self.engine.connect() as conn:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.schema}.{building}"))  # left by a failed rebuild
+        self._create(building)
+        with self.engine.connect() as conn:
+            for index in existing:
+                logger.info(f"Dropping vector index {index['indexname']}.")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.schema}.{index['indexname']}"))
+            conn.execute(text(f"ALTER INDEX {self.schema}.{building} RENAME TO {self.index_name}"))
+
+    def should_check_plan(self) -> bool:
+        """
+        Count a search; True for the first one and then every plan_check_every searches.
+        """
+        self.searches += 1
+        return self.plan_check_every > 0 and (self.searches - 1) % self.plan_check_every == 0
+
+    def record_plan(self, plan: Dict[str, Any]) -> bool:
+        """
+        Count a similarity query plan and warn if it reads the table sequentially.
+
+        Args:
+            plan (Dict[str, Any]): The top 'Plan' node of EXPLAIN (FORMAT JSON).
+
+        Returns:
+            bool: True if the plan has a sequential scan of the table.
+        """
+        self.plan_checks += 1
+        if not find_seq_scans(plan, self.table):
+            return False
+        self.seq_scans += 1
+        logger.warning(
+            f"Similarity search on {self.schema}.{self.table} fell back to a sequential scan. "
+            f"Check that a {self.index_type} {self.opclass} index exists (python -m chat.vector_index status)."
+        )
+        return True
+
+    def check(self):
+        """
+        Warn if no ANN index serves the configured metric. Blocking; call it from a thread.
+        """
+        indexes = self.vector_indexes()
+        if not any(index['matches'] for index in indexes):
+            logger.warning(
+                f"No {self.index_type} index with {self.opclass} on {self.schema}.{self.table}.{self.column}; "
+                f"similarity searches scan the whole table. Run: python -m chat.vector_index ensure"
+            )
+
+    def stats(self) -> dict:
+        return {
+            'index_type': self.index_type,
+            'distance': self.distance,
+            'ef_search': self.ef_search,
+            'probes': self.probes,
+            'searches': self.searches,
+            'plan_checks': self.plan_checks,
+            'seq_scans': self.seq_scans,
+        }
+
+
+# Shared by the knowledge base of this process
+vector_index = VectorIndexManager()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the ANN index of the knowledge table.")
+    parser.add_argument('command', choices=['status', 'ensure', 'rebuild'],
+                        help="status: list the vector indexes; ensure: create the configured index if missing; "
+                             "rebuild: build a fresh index concurrently and swap it in")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'ensure':
+        vector_index.ensure()
+    elif args.command == 'rebuild':
+        vector_index.rebuild()
+    for index in vector_index.vector_indexes():
+        print(f"{index['indexname']}: {index['bytes'] / 1e6:.1f} MB, "
+              f"{'serves' if index['matches'] else 'does not serve'} {vector_index.distance} queries\n  {index['indexdef']}")
@@ -0,0 +1,167 @@
+"""
+Multi-process deployment entry point.
+
+With WEB_WORKERS=1 this simply serves main:app. With more workers it starts one
+main:app process per worker on an internal port (WORKER_BASE_PORT + index) and
+serves a thin router on PORT that forwards every Telegram update to the worker
+owning its chat (crc32(chat_id) % WEB_WORKERS). Each worker builds its own
+Telegram, Mongo and Postgres clients, and a chat always lands on the same
+process, so per-chat ordering and in-process caches stay valid.
+"""
+# cluster.py
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from contextlib import asynccontextmanager
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from config import PORT, WEB_WORKERS, WORKER_BASE_PORT
+from utils.logging_helper import setup_logging
+from utils.sharding import shard_for
+from utils.telegram_helper import get_update_chat_id
+
+logger = logging.getLogger(__name__)
+
+SUPERVISE_INTERVAL = 5  # seconds between worker liveness checks
+FORWARD_TIMEOUT = aiohttp.ClientTimeout(total=60 * 10)
+
+processes = {}
+
+
+def worker_url(index: int, path: str) -> str:
+    return f"http://127.0.0.1:{WORKER_BASE_PORT + index}{path}"
+
+
+def run_worker(port: int):
+    """
+    Serve main:app in this process. Imported fresh, so all singletons belong to this worker.
+    """
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_config=None)
+
+
+def start_worker(index: int):
+    context = multiprocessing.get_context("spawn")
+    # Spawned children inherit the environment at start time
+    os.environ["WORKER_ID"] = str(index)
+    try:
+        process = context.Process(target=run_worker, args=(WORKER_BASE_PORT + index,), name=f"worker-{index}")
+        process.start()
+    finally:
+        os.environ.pop("WORKER_ID", None)
+    processes[index] = process
+    logger.info(f"Started worker {index} (pid {process.pid}) on port {WORKER_BASE_PORT + index}.")
+
+
+async def supervise():
+    """
+    Restart worker processes that exited.
+    """
+    while True:
+        await asyncio.sleep(SUPERVISE_INTERVAL)
+        for index, process in list(processes.items()):
+            if not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting.")
+                start_worker(index)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for index in range(WEB_WORKERS):
+        start_worker(index)
+    app.state.session = aiohttp.ClientSession(timeout=FORWARD_TIMEOUT)
+    supervisor = asyncio.create_task(supervise())
+    try:
+        yield
+    finally:
+        supervisor.cancel()
+        await app.state.session.close()
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=30)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.post("/agent/")
+async def route_update(request: Request):
+    """
+    Forward a Telegram update to the worker that owns its chat.
+    """
+    body = await request.body()
+    try:
+        update_data = await request.json()
+        chat_id = get_update_chat_id(update_data)
+        key = chat_id if chat_id is not None else update_data.get('update_id')
+    except Exception as e:
+        logger.warning(f"Could not read chat id from update: {e}")
+        key = None
+
+    index = shard_for(key, WEB_WORKERS)
+    try:
+        async with request.app.state.session.post(
+            worker_url(index, "/agent/"), data=body, headers={"Content-Type": "application/json"}
+        ) as response:
+            return JSONResponse(await response.json(), status_code=response.status)
+    except Exception as e:
+        # Let Telegram redeliver; the worker may be restarting
+        logger.error(f"Forwarding update to worker {index} failed: {e}")
+        return JSONResponse({"status": "error"}, status_code=503)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(request: Request):
+    out, ready = {}, True
+    for index in range(WEB_WORKERS):
+        try:
+            async with request.app.state.session.get(worker_url(index, "/readyz")) as response:
+                out[f"worker_{index}"] = await response.json()
+                ready = ready and response.status == 200
+        except Exception as e:
+            out[f"worker_{index}"] = {"error": str(e)}
+            ready = False
+    return JSONResponse({"ready": ready, "workers": out}, status_code=200 if ready else 503)
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    out = {}
+    for index in range(WEB_WORKERS):
+        try:
+            async with request.app.state.session.get(worker_url(index, "/metrics")) as response:
+                out[f"worker_{index}"] = await response.json()
+        except Exception as e:
+            out[f"worker_{index}"] = {"error": str(e)}
+    return out
+
+
+@app.get("/traces/summary")
+async def traces_summary(request: Request):
+    out = {}
+    for index in range(WEB_WORKERS):
+        try:
+            async with request.app.state.session.get(worker_url(index, "/traces/summary")) as response:
+                out[f"worker_{index}"] = await response.json()
+        except Exception as e:
+            out[f"worker_{index}"] = {"error": str(e)}
+    return out
+
+
+if __name__ == "__main__":
+    setup_logging(log_file='logs/cluster.log', level=logging.INFO)
+    if WEB_WORKERS <= 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, log_config=None)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT, log_config=None)
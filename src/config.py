@@ -23,6 +23,7 @@ POSTGRES_CONNECTION = os.getenv("POSTGRES_CONNECTION", "postgresql+psycopg://ai:
 TELEGRAM_BOT = os.getenv("TELEGRAM_BOT", "")
 TELEGRAM_BOT_ID = os.getenv("TELEGRAM_BOT_ID", "")  # todo
 TELEGRAM_BOT_HANDLE = os.getenv("TELEGRAM_BOT_HANDLE", "@supgrantsBot")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # e.g. a local Bot API server
 
 # PagerDuty & Support
 PAGERDUTY_INACTIVE = os.getenv("PAGERDUTY_INACTIVE", 0)
@@ -31,7 +32,10 @@ PAGERDUTY = os.getenv("PAGERDUTY", "")
 # AI
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # fast tier
+OPENAI_STRONG_MODEL = os.getenv("OPENAI_STRONG_MODEL", "gpt-4o")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")  # fast tier
+GEMINI_STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", "gemini-1.5-pro")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 GROK_API_KEY = os.getenv("GROK_API_KEY", "")
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY", "")
@@ -43,4 +47,104 @@ GITHUB_ACCESS_TOKEN = os.getenv("GITHUB_ACCESS_TOKEN", "")
 # Chat
 TOKEN_LIMIT = int(os.getenv("TOKEN_LIMIT", 28000))
 TOOL_MESSAGE_CHAR_TRUNCATE_LIMIT = int(os.getenv("TOOL_MESSAGE_CHAR_TRUNCATE_LIMIT", 400))
-MAX_HISTORY = int(os.getenv("MAX_HISTORY", 50))
\ No newline at end of file
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", 50))
+
+# Update queue
+UPDATE_QUEUE_ENABLED = os.getenv("UPDATE_QUEUE_ENABLED", "0") == "1"
+UPDATE_QUEUE_MAX_IN_FLIGHT = int(os.getenv("UPDATE_QUEUE_MAX_IN_FLIGHT", 64))  # updates processed at once, across chats
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.getenv("UPDATE_QUEUE_MAX_ATTEMPTS", 3))
+
+# Per-chat ordered execution
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", 32))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 20))
+
+# Deployment
+PORT = int(os.getenv("PORT", 8080))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 1))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", 6100))
+WORKER_ID = int(os.getenv("WORKER_ID", 0))  # set by cluster.py for each worker process
+READINESS_WAIT_TIMEOUT = float(os.getenv("READINESS_WAIT_TIMEOUT", 10))  # seconds a webhook waits for warmup
+
+# Long polling (polling.py)
+POLLING_BATCH_SIZE = int(os.getenv("POLLING_BATCH_SIZE", 100))
+POLLING_CONCURRENCY = int(os.getenv("POLLING_CONCURRENCY", 32))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", 30))
+
+# Grant submission
+FUNDER_SUBMIT_URL = os.getenv("FUNDER_SUBMIT_URL", "https://supagrant-funder-production.up.railway.app/submit/")
+FUNDER_TIMEOUT = float(os.getenv("FUNDER_TIMEOUT", 30))
+FUNDER_MAX_ATTEMPTS = int(os.getenv("FUNDER_MAX_ATTEMPTS", 5))
+
+# Admission control for agent runs
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 16))
+# At most CHAT_MAX_CONCURRENCY updates are handled at once, so the queue limit must stay below the headroom to ever shed
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", max(1, (CHAT_MAX_CONCURRENCY - ADMISSION_MAX_IN_FLIGHT) // 2)))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 120))  # seconds
+
+# Agent execution (thread pool, separate from the crawler)
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 16))
+AGENT_RUN_TIMEOUT = float(os.getenv("AGENT_RUN_TIMEOUT", 300))  # seconds
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"  # edit a placeholder as tokens arrive
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.5))  # seconds between edits
+
+# Knowledge retrieval
+KNOWLEDGE_CHUNKS = int(os.getenv("KNOWLEDGE_CHUNKS", 5))  # chunks prefetched per message
+KNOWLEDGE_MAX_DISTANCE = float(os.getenv("KNOWLEDGE_MAX_DISTANCE", 0.5))  # in VECTOR_DISTANCE units; above this the agent may search itself
+KNOWLEDGE_SCOPE = os.getenv("KNOWLEDGE_SCOPE", "user").lower()  # "user": a user's own documents, "chat": the chat's documents
+KNOWLEDGE_HYBRID = os.getenv("KNOWLEDGE_HYBRID", "1") == "1"  # fuse full-text and vector search
+KNOWLEDGE_TS_CONFIG = os.getenv("KNOWLEDGE_TS_CONFIG", "english")  # text search configuration of content_tsv
+KNOWLEDGE_RRF_K = int(os.getenv("KNOWLEDGE_RRF_K", 60))  # reciprocal rank fusion constant
+KNOWLEDGE_HYBRID_CANDIDATES = int(os.getenv("KNOWLEDGE_HYBRID_CANDIDATES", 20))  # candidates per ranking
+RETRIEVAL_POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", 10))  # async connections per process
+RETRIEVAL_POOL_OVERFLOW = int(os.getenv("RETRIEVAL_POOL_OVERFLOW", 5))
+RETRIEVAL_POOL_TIMEOUT = float(os.getenv("RETRIEVAL_POOL_TIMEOUT", 5))  # seconds to wait for a connection
+RETRIEVAL_QUERY_TIMEOUT = float(os.getenv("RETRIEVAL_QUERY_TIMEOUT", 5))  # seconds per query
+RETRIEVAL_PREPARE = os.getenv("RETRIEVAL_PREPARE", "1") == "1"  # disable behind a transaction-mode pgbouncer
+
+# Vector index (python -m chat.vector_index status|ensure|rebuild)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()  # hnsw or ivfflat
+VECTOR_DISTANCE = os.getenv("VECTOR_DISTANCE", "cosine").lower()  # cosine, l2 or inner_product
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", 16))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", 64))
+VECTOR_IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", 0))  # 0: derived from the row count
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", 40))  # higher: better recall, slower queries
+VECTOR_PROBES = int(os.getenv("VECTOR_PROBES", 10))
+# Filtered HNSW searches search VECTOR_FILTERED_EF_SEARCH candidates. On pgvector >= 0.8 set strict_order
+# (or relaxed_order) instead to scan on until LIMIT rows pass the filter; older versions reject the setting
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "")
+VECTOR_FILTERED_EF_SEARCH = int(os.getenv("VECTOR_FILTERED_EF_SEARCH", 200))
+VECTOR_PLAN_CHECK_EVERY = int(os.getenv("VECTOR_PLAN_CHECK_EVERY", 1000))  # queries between plan checks, 0 to disable
+
+# Embedding cache (in memory, plus an optional store shared across restarts)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2000))  # embeddings kept in memory (~6 KB each), 0 to disable
+EMBEDDING_CACHE_STORE = os.getenv("EMBEDDING_CACHE_STORE", "").lower()  # "", "postgres" (scripts/database_schema_embedding_cache.sql) or "disk"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")  # SQLite file of the "disk" store
+
+# Semantic response cache (opt-in, tables in scripts/database_schema_response_cache.sql)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.95))  # cosine similarity
+RESPONSE_CACHE_TTL_HOURS = int(os.getenv("RESPONSE_CACHE_TTL_HOURS", 24))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+RESPONSE_CACHE_MIN_WORDS = int(os.getenv("RESPONSE_CACHE_MIN_WORDS", 4))  # shorter messages are follow-ups, never cached
+RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", 2))  # recent answers the key depends on
+
+# Background user-memory and session-summary updates
+MEMORY_MAX_CONCURRENCY = int(os.getenv("MEMORY_MAX_CONCURRENCY", 2))
+MEMORY_SUMMARY_TURNS = int(os.getenv("MEMORY_SUMMARY_TURNS", 5))  # update after this many turns...
+MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", 60))  # ...or once a chat is idle this long
+
+# Write-behind persistence of agent responses (ai.applications)
+RESPONSE_WRITE_BATCH = int(os.getenv("RESPONSE_WRITE_BATCH", 20))
+RESPONSE_WRITE_INTERVAL = float(os.getenv("RESPONSE_WRITE_INTERVAL", 1.0))  # seconds a batch waits to fill
+
+# Tracing (per-stage summary at /traces/summary)
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # e.g. logs/traces.jsonl
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")  # e.g. http://localhost:4318
+
+# Model routing (fast tier for short turns, strong tier for drafting and long inputs). Off by default:
+# every turn then uses the fast tier model as before; enabling it sends some turns to the costlier strong tier
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "0") == "1"
+MODEL_LONG_MESSAGE = int(os.getenv("MODEL_LONG_MESSAGE", 600))  # characters
+MODEL_TIER_MAX_INFLIGHT = int(os.getenv("MODEL_TIER_MAX_INFLIGHT", 8))
+MODEL_OVERLOAD_COOLDOWN = float(os.getenv("MODEL_OVERLOAD_COOLDOWN", 30))  # seconds
+MODEL_STICKY_SECONDS = float(os.getenv("MODEL_STICKY_SECONDS", 180))  # follow-ups of a draft stay on the strong tier
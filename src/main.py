@@ -5,26 +5,51 @@ Ben Lai: https://github.com/laichunpongben/
 """
 # main.py
 
+import time
+import functools
 import traceback
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-import requests
+from typing import Optional
 import uvicorn
 from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from telegram.ext import Application
 from dotenv import load_dotenv
 import json
-from chat import router, knowledge, crawler
-from utils.telegram_helper import TelegramHelper
+from chat import router, knowledge
+from chat.agent_pool import agent_pool
+from chat.agent_runner import agent_runner
+from chat.model_router import model_router
+from chat.custom_knowledge_base import scope_filters
+from chat.vector_index import vector_index
+from chat.memory_pipeline import memory_pipeline
+from utils.response_cache import response_cache
+from utils.pg_pool import retrieval_pool
+from utils.embedding_cache import embedding_cache
+from utils.telegram_helper import TelegramHelper, get_update_chat_id
+from utils.send_scheduler import PRIORITY_INTERACTIVE, PRIORITY_BULK
 from utils.mongo_aio import Mongo
+from utils.update_queue import UpdateQueue
+from utils.dedup import UpdateDeduplicator
+from utils.keyed_executor import KeyedExecutor, ShardQueueFull
+from utils.health import Readiness
+from utils.grant_submitter import GrantSubmitter
+from utils.admission import AdmissionController, DEFER, SHED
 from utils.pagerduty import sendAlert
 from utils.url_helper import normalize_url
 from utils.logging_helper import setup_logging
-from config import TELEGRAM_BOT, TELEGRAM_BOT_HANDLE
+from utils.tracing import tracer, span, record_span, start_trace
+from config import (
+    TELEGRAM_BOT, TELEGRAM_BOT_HANDLE, TELEGRAM_API_URL, UPDATE_QUEUE_ENABLED, UPDATE_QUEUE_MAX_IN_FLIGHT, UPDATE_QUEUE_MAX_ATTEMPTS,
+    CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE, WORKER_ID, READINESS_WAIT_TIMEOUT,
+    FUNDER_SUBMIT_URL, FUNDER_TIMEOUT, FUNDER_MAX_ATTEMPTS,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUED, ADMISSION_MAX_WAIT, STREAM_RESPONSES, STREAM_EDIT_INTERVAL,
+)
 from telegram import ReplyKeyboardMarkup
-from utils.get_applications import get_applications
+from utils.get_applications import get_applications, response_writer
 load_dotenv()
 
 # Setup logging
@@ -34,6 +59,8 @@ logger = setup_logging(log_file='logs/main.log', level=logging.INFO)
 application = (
     Application.builder()
     .token(TELEGRAM_BOT)
+    .base_url(f"{TELEGRAM_API_URL}/bot")
+    .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
     .connection_pool_size(100)
     .build()
 )
@@ -41,9 +68,53 @@ application = (
 # Initialize TelegramHelper with the Application's Bot instance
 tg = TelegramHelper(application.bot)
 
+
+# Only files with a registered handler are ever downloaded
+async def index_pdf(file_info):
+    await knowledge.knowledge_base.handle_pdf_file(file_info)
+
+
+async def index_txt(file_info):
+    await knowledge.knowledge_base.handle_txt_file(file_info)
+
+
+tg.register_file_handler(['application/pdf'], index_pdf)
+tg.register_file_handler(['text/plain'], index_txt)
+
 # Initialize MongoDB without connecting on startup
 mongo = Mongo()
 
+# Skip Telegram redeliveries of updates we already accepted
+deduplicator = UpdateDeduplicator(mongo)
+
+# Process updates in order per chat, different chats in parallel
+chat_executor = KeyedExecutor(max_concurrency=CHAT_MAX_CONCURRENCY, max_queue_per_key=CHAT_MAX_QUEUE)
+
+# Delivers grant applications to the funder service in the background
+grant_submitter = GrantSubmitter(
+    mongo,
+    FUNDER_SUBMIT_URL,
+    timeout=FUNDER_TIMEOUT,
+    max_attempts=FUNDER_MAX_ATTEMPTS,
+    shard=WORKER_ID,
+)
+
+# Bounds concurrent agent runs and sheds load beyond the queue limits
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_queued=ADMISSION_MAX_QUEUED,
+    max_wait=ADMISSION_MAX_WAIT,
+)
+if ADMISSION_MAX_IN_FLIGHT + ADMISSION_MAX_QUEUED >= CHAT_MAX_CONCURRENCY:
+    logger.warning(
+        f"ADMISSION_MAX_IN_FLIGHT + ADMISSION_MAX_QUEUED ({ADMISSION_MAX_IN_FLIGHT} + {ADMISSION_MAX_QUEUED}) is not "
+        f"below CHAT_MAX_CONCURRENCY ({CHAT_MAX_CONCURRENCY}): the admission queue can never fill, "
+        f"only ADMISSION_MAX_WAIT sheds load."
+    )
+
+# Dependencies warmed up in the background after startup
+readiness = Readiness(['telegram', 'mongo', 'knowledge'])
+
 
 class TelegramUpdate(BaseModel):
     update_id: int
@@ -54,6 +125,35 @@ class ApiCall(BaseModel):
     token: str
 
 
+def startup() -> asyncio.Task:
+    """
+    Start warming dependencies in the background, so requests (or polling) can begin right away.
+    Shared by the webhook lifespan and polling.py.
+    """
+    logger.info("Starting up the application.")
+    return asyncio.create_task(warmup())
+
+
+async def shutdown(warmup_task: Optional[asyncio.Task] = None):
+    """
+    Stop background work and flush the write-behind components. Shared by the webhook lifespan and polling.py.
+    """
+    logger.info("Shutting down the application.")
+    if warmup_task:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    if UPDATE_QUEUE_ENABLED:
+        await update_queue.stop()
+    await grant_submitter.close()
+    agent_runner.shutdown()
+    await memory_pipeline.close()
+    await response_writer.close()
+    await retrieval_pool.close()
+    if application.running:
+        await application.stop()
+    await application.shutdown()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -61,17 +161,41 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events.
     """
     print("Starting up the application.")
+    warmup_task = None
     try:
-        logger.info("Starting up the application.")
+        warmup_task = startup()
+        yield
+    finally:
+        await shutdown(warmup_task)
 
-        # Properly start the Telegram bot
+
+async def warmup():
+    """
+    Start the Telegram bot, check Mongo and probe the vector DB, retrying each until it succeeds.
+    Queue workers start once Telegram and Mongo are ready.
+    """
+    async def start_telegram():
         await application.initialize()
         await application.start()
-        yield
-    finally:
-        logger.info("Shutting down the application.")
-        await application.stop()
-        await application.shutdown()
+
+    async def start_mongo():
+        await mongo.ping()
+        await deduplicator.start()
+        await grant_submitter.start()
+
+    async def warm_knowledge():
+        await asyncio.to_thread(knowledge.warmup)
+        await asyncio.to_thread(agent_pool.warmup)
+
+    async def start_workers():
+        await asyncio.gather(
+            readiness.warm_up('telegram', start_telegram),
+            readiness.warm_up('mongo', start_mongo),
+        )
+        if UPDATE_QUEUE_ENABLED:
+            await update_queue.start()
+
+    await asyncio.gather(start_workers(), readiness.warm_up('knowledge', warm_knowledge))
 
 
 # Assign the lifespan handler to the FastAPI app
@@ -108,18 +232,21 @@ async def handle_menu(params, reply_function):
         #find the user's project id
         logger.info(f"Getting applications for user {params['user']}")
         application = await get_applications(params['user'])
-        
+        if not application:
+            await reply_function("We couldn't find an application to submit yet. Use /apply to get started.")
+            return True
+
         # Convert application data to JSON-serializable format
         json_data = {
             "application": json.dumps(application, default=str)  # Use default=str to handle datetime
         }
-        
-        url = "https://supagrant-funder-production.up.railway.app/submit/"
-        response = requests.post(url, json=json_data)
-        logger.info(f"Response from funder agent: {response.json()}")
+
+        # Delivered in the background; progress is visible through /status
+        await grant_submitter.submit(params['user'], params['chat_id'], json_data)
         await reply_function(
                 """
                 Awesome! We're submitting your grant application.
+                Use /status to check on its progress.
                 """
             )
         return True
@@ -141,7 +268,20 @@ async def handle_menu(params, reply_function):
         return True
 
     if content in ["📊 check application status", "/status"]:
-        await reply_function("You selected 'Check Application Status'. Please provide your application ID.")
+        submission = await grant_submitter.latest(params['user'])
+        if not submission:
+            await reply_function("You haven't submitted an application yet. Use /submit when it's ready.")
+            return True
+        status_text = {
+            'queued': "⏳ queued for submission",
+            'delivering': "🚚 being submitted",
+            'delivered': "✅ submitted successfully",
+            'failed': "❌ submission failed, please try /submit again",
+        }.get(submission['status'], submission['status'])
+        await reply_function(
+            f"📊 Application {submission['_id'][:8]} "
+            f"(sent {submission['created_at']:%Y-%m-%d %H:%M} UTC): {status_text}"
+        )
         return True
 
     if content in ["ℹ️ about supagrants", "/about"]:
@@ -179,26 +319,54 @@ async def handle_menu(params, reply_function):
     return False  #
 
 
-@app.post("/agent/")
-async def mentor(request: Request, background_tasks: BackgroundTasks):
+# Background tasks spawned outside of a request (queue workers), kept referenced until done
+background_jobs = set()
+
+
+def schedule_background(background_tasks: Optional[BackgroundTasks], func, *args):
+    """
+    Schedule a coroutine function to run in the background.
+    Uses FastAPI's BackgroundTasks when called from a request, otherwise a tracked asyncio task.
+    """
+    if background_tasks is not None:
+        background_tasks.add_task(func, *args)
+        return
+    task = asyncio.create_task(func(*args))
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+
+async def handle_update(json_data: dict, background_tasks: Optional[BackgroundTasks] = None, raise_errors: bool = False):
+    """
+    Run a raw Telegram update through the full pipeline: parse, menu, ingestion and next action.
+
+    Errors are alerted and swallowed, unless raise_errors is set (queue workers retry failed updates).
+    """
     text = ''
+    handle = TELEGRAM_BOT_HANDLE
+    # Queue workers and shard drains run in their own contexts; the trace id follows from the update id
+    start_trace(json_data.get('update_id'))
     try:
-        handle = TELEGRAM_BOT_HANDLE
-        json_data = await request.json()
-        params = await tg.process_update(json_data, handle=handle)
+        with span('process_update'):
+            params = await tg.process_update(json_data, handle=handle)
         if not params:
-            return {"status": "ok"}
+            return
+
+        async def telegram_reply(msg, reply_markup=None, priority=PRIORITY_INTERACTIVE):
+            await tg.send_message_with_retry(params['chat_id'], msg, reply_markup=reply_markup, priority=priority)
 
-        async def telegram_reply(msg, reply_markup=None):
-            await tg.send_message_with_retry(params['chat_id'], msg, reply_markup=reply_markup)
+        def stream_reply():
+            return tg.stream_reply(params['chat_id'], edit_interval=STREAM_EDIT_INTERVAL)
 
         # Ignore if message is from bot or no content
         if not params or params['is_bot'] or (not params['content'] and not params['file']):
-            return {"status": "ok"}
+            return
 
         # Check if input is a recognized command and handle the menu
-        if await handle_menu(params, telegram_reply):
-            return {"status": "ok"}  # Command handled; stop further processing
+        with span('handle_menu'):
+            handled = await handle_menu(params, telegram_reply)
+        if handled:
+            return  # Command handled; stop further processing
 
         # Handle other inputs like URLs or files
         text = f"@{params['username']}: {params['content']}"
@@ -208,27 +376,41 @@ async def mentor(request: Request, background_tasks: BackgroundTasks):
         # Handle document uploads
         if params['file']:
             file_info = params['file']
-            mime_type = file_info.get('mime_type')
-            if mime_type == 'application/pdf':
-                await knowledge.knowledge_base.handle_pdf_file(file_info)
-            elif mime_type == 'text/plain':
-                await knowledge.knowledge_base.handle_txt_file(file_info)
+            file_info.update(owner_id=params['user'], chat_id=params['chat_id'])
+            try:
+                dispatched = await tg.dispatch_file(file_info)
+            except Exception as e:
+                # Tell the user instead of confirming a document that was not stored
+                logger.error(f"Adding {file_info['file_name']} to the knowledge base failed: {e}")
+                text = f"SYSTEM: Failed to add document to knowledge base {file_info['file_name']}"
             else:
-                logger.warning(f"Unsupported MIME type: {mime_type}")
-            text = f"SYSTEM: Document added to knowledge base {file_info['file_name']}"
+                if dispatched:
+                    text = f"SYSTEM: Document added to knowledge base {file_info['file_name']}"
+                else:
+                    logger.warning(f"Unsupported MIME type: {file_info.get('mime_type')}")
+                    if not params['content']:
+                        return  # Nothing to answer; the file itself is ignored
 
         # Handle URLs
         if params.get('urls'):
+            from chat import crawler  # imported on first use, crawl4ai is slow to import
             crawl_tool = crawler.Crawl4aiTools()
+            scope = scope_filters(params['user'], params['chat_id'])
 
             async def check_duplicate(url: str) -> bool:
-                return await knowledge.knowledge_base.is_source_indexed(url)
-
-            async def index_page(url: str, content: str):
-                await knowledge.knowledge_base.handle_url(url, content)
+                return await knowledge.knowledge_base.is_source_indexed(url, **scope)
 
             async def crawl_and_process(url: str):
                 page_count = 0
+                failed_count = 0
+
+                async def index_page(page_url: str, content: str):
+                    nonlocal failed_count
+                    try:
+                        await knowledge.knowledge_base.handle_url(page_url, content, owner_id=params['user'],
+                                                                  chat_id=params['chat_id'])
+                    except Exception:
+                        failed_count += 1  # Logged by handle_url; the crawl goes on with the next page
 
                 try:
                     # Create an asynchronous generator for crawling
@@ -255,31 +437,173 @@ async def mentor(request: Request, background_tasks: BackgroundTasks):
 
                 finally:
                     # Send a single summary message after crawling completes or fails
-                    if page_count > 0:
-                        await telegram_reply(f"Total {page_count} pages from the URL: {url} are indexed successfully.")
+                    indexed_count = page_count - failed_count
+                    if indexed_count > 0:
+                        await telegram_reply(f"Total {indexed_count} pages from the URL: {url} are indexed successfully.",
+                                             priority=PRIORITY_BULK)
                     else:
-                        await telegram_reply(f"No new pages were indexed from the URL: {url}")
+                        await telegram_reply(f"No new pages were indexed from the URL: {url}", priority=PRIORITY_BULK)
+                    if failed_count:
+                        await telegram_reply(f"{failed_count} pages from the URL: {url} could not be added to the knowledge base.",
+                                             priority=PRIORITY_BULK)
 
-                    logger.info(f"Crawling completed for URL: {url} with {page_count} pages indexed.")
+                    logger.info(f"Crawling completed for URL: {url} with {indexed_count} pages indexed, {failed_count} failed.")
 
             # Schedule all crawl tasks to run concurrently in the background
             for url in params['urls']:
                 normalized_url = normalize_url(url)
-                background_tasks.add_task(crawl_and_process, normalized_url)
+                schedule_background(background_tasks, crawl_and_process, normalized_url)
 
             all_urls = ",".join(params['urls'])
             text = f"SYSTEM: URLs are being crawled and added to knowledge base: {all_urls}"
 
-        # Proceed with general next action
-        await router.next_action(text, params['user'], params['chat_id'], mongo,
-                                 reply_function=telegram_reply,
-                                 processing_id=params['message_id'])
-
-        return {"status": "ok"}
+        # Proceed with general next action, if there is capacity for another agent run
+        decision = admission.try_admit()
+        if decision == SHED:
+            await telegram_reply("🚦 I'm very busy right now. Please send your message again in a few minutes.")
+            return
+        if decision == DEFER:
+            try:
+                await telegram_reply("⏳ I'm busy right now, your message is queued and I'll reply shortly.")
+            except BaseException:
+                # The turn will not reach slot(): a leaked reservation would count as queued forever
+                admission.release()
+                raise
+
+        async with admission.slot():
+            await router.next_action(text, params['user'], params['chat_id'], mongo,
+                                     reply_function=telegram_reply,
+                                     processing_id=params['message_id'],
+                                     stream_reply=stream_reply if STREAM_RESPONSES else None,
+                                     has_attachment=bool(params['file'] or params.get('urls')))
     except Exception as e:
         await sendAlert(f"{handle}: {text} | error: {str(e)}")
         traceback.print_exc()
+        if raise_errors:
+            raise
+
+
+def submit_update(json_data: dict, *args, handler=handle_update) -> asyncio.Future:
+    """
+    Queue handler(json_data, *args) on the chat's shard, or start it right away for updates without a chat.
+    Nothing is awaited, so updates submitted in order reach their shard in order.
+
+    Raises:
+        ShardQueueFull: If the chat already has too many updates waiting.
+    """
+    chat_id = get_update_chat_id(json_data)
+    if chat_id is None:
+        return asyncio.ensure_future(handler(json_data, *args))
+    return chat_executor.submit(chat_id, handler, json_data, *args)
+
+
+async def reject_update(json_data: dict):
+    """
+    Tell the chat that an update was dropped because its shard is full.
+    """
+    chat_id = get_update_chat_id(json_data)
+    logger.warning(f"Too many pending updates for chat {chat_id}, dropping update {json_data.get('update_id')}.")
+    await tg.send_message_with_retry(chat_id, "⏳ I'm still working on your previous messages, please wait a moment.")
+
+
+async def dispatch_update(json_data: dict, background_tasks: Optional[BackgroundTasks] = None, raise_errors: bool = False):
+    """
+    Run handle_update on the chat's shard so messages of one chat never overlap.
+    The update is submitted before the first await, so calls started in order reach the shard in order.
+    """
+    try:
+        future = submit_update(json_data, background_tasks, raise_errors)
+    except ShardQueueFull:
+        await reject_update(json_data)
+        return
+    await future
+
+
+# Durable queue used when UPDATE_QUEUE_ENABLED: the webhook only stores the update
+update_queue = UpdateQueue(
+    mongo,
+    functools.partial(dispatch_update, raise_errors=True),
+    max_in_flight=UPDATE_QUEUE_MAX_IN_FLIGHT,
+    max_attempts=UPDATE_QUEUE_MAX_ATTEMPTS,
+    shard=WORKER_ID,
+)
+
+
+@app.post("/agent/")
+async def mentor(request: Request, background_tasks: BackgroundTasks):
+    update_id = None
+    try:
+        parse_started = time.monotonic()
+        json_data = await request.json()
+        if not isinstance(json_data, dict) or not isinstance(json_data.get('update_id'), int):
+            logger.warning("Received malformed update, ignoring.")
+            return {"status": "ok"}
+        start_trace(json_data['update_id'])
+        record_span('mentor.parse', time.monotonic() - parse_started)
+
+        # Right after startup, ask Telegram to redeliver if what this mode needs is not warm yet
+        required = 'mongo' if UPDATE_QUEUE_ENABLED else 'telegram'
+        if not await readiness.wait_for(required, timeout=READINESS_WAIT_TIMEOUT):
+            return JSONResponse({"status": "starting"}, status_code=503)
+
+        # Acknowledge redeliveries without doing any work
+        if await deduplicator.is_duplicate(json_data['update_id']):
+            return {"status": "ok"}
+        update_id = json_data['update_id']
+
+        if UPDATE_QUEUE_ENABLED:
+            # Acknowledge once stored; queue workers run the pipeline
+            await update_queue.enqueue(json_data)
+            return {"status": "ok"}
+
+        await dispatch_update(json_data, background_tasks)
         return {"status": "ok"}
+    except Exception as e:
+        await sendAlert(f"{TELEGRAM_BOT_HANDLE}: webhook error: {str(e)}")
+        traceback.print_exc()
+        # The update was not accepted: let Telegram's redelivery through the dedup check
+        if update_id is not None:
+            await deduplicator.forget(update_id)
+        return JSONResponse({"status": "error"}, status_code=500)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot['ready'] else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "dedup": deduplicator.stats(),
+        "chat_executor": chat_executor.stats(),
+        "update_queue": update_queue.stats(),
+        "admission": admission.stats(),
+        "telegram_send": tg.scheduler.stats(),
+        "agent_pool": agent_pool.stats(),
+        "agent_runner": agent_runner.stats(),
+        "model_router": model_router.stats(),
+        "response_cache": response_cache.stats(),
+        "memory_pipeline": memory_pipeline.stats(),
+        "response_writer": response_writer.stats(),
+        "retrieval_pool": retrieval_pool.stats(),
+        "vector_index": vector_index.stats(),
+        "embedding_cache": embedding_cache.stats(),
+    }
+
+
+@app.get("/traces/summary")
+async def traces_summary():
+    """
+    Latency percentiles (ms) per pipeline stage over the latest spans of this worker.
+    """
+    return {"stages": tracer.summary(), "dropped": tracer.dropped}
 
 
 if __name__ == "__main__":
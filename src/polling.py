@@ -0,0 +1,98 @@
+"""
+Long-polling entry point.
+
+Pulls updates in batches with getUpdates instead of receiving webhooks and runs
+each one through the same pipeline as /agent/ (process_update -> handle_menu ->
+router.next_action). Set TELEGRAM_API_URL to point it at a local Bot API server
+for load testing.
+"""
+# polling.py
+
+import asyncio
+import logging
+import time
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+import main
+from utils.keyed_executor import ShardQueueFull
+from config import POLLING_BATCH_SIZE, POLLING_CONCURRENCY, POLLING_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+async def poll():
+    """
+    Fetch batches of updates and dispatch them with bounded concurrency.
+    """
+    # Same startup and shutdown as the webhook app: warmup, grant delivery, write-behind flushes
+    warmup_task = main.startup()
+    slots = asyncio.Semaphore(POLLING_CONCURRENCY)
+    in_flight = set()
+
+    async def run(update_data: dict):
+        # A slot is taken once the update reaches the front of its chat's shard, not while it waits there
+        async with slots:
+            await main.handle_update(update_data)
+
+    def track(task: asyncio.Future):
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    try:
+        await main.readiness.wait_for('telegram', timeout=None)
+        bot = main.application.bot
+
+        # getUpdates is refused while a webhook is set
+        await bot.delete_webhook()
+        logger.info(f"Polling for updates (batch {POLLING_BATCH_SIZE}, concurrency {POLLING_CONCURRENCY}).")
+
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    limit=POLLING_BATCH_SIZE,
+                    timeout=POLLING_TIMEOUT,
+                    read_timeout=POLLING_TIMEOUT + 10,
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TimedOut, NetworkError) as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not updates:
+                continue
+
+            started = time.monotonic()
+            for update in sorted(updates, key=lambda update: update.update_id):
+                offset = update.update_id + 1
+                update_data = update.to_dict()
+                # Updates of the last batch are re-sent after a restart until their offset is confirmed
+                if await main.deduplicator.is_duplicate(update.update_id):
+                    continue
+                # Submitted one by one, in update_id order, so each chat's shard receives its updates in order
+                try:
+                    track(main.submit_update(update_data, handler=run))
+                except ShardQueueFull:
+                    track(asyncio.create_task(main.reject_update(update_data)))
+
+            elapsed = time.monotonic() - started
+            logger.info(f"Dispatched batch of {len(updates)} updates in {elapsed:.3f}s ({len(in_flight)} in flight).")
+
+            # Backpressure: stop pulling while POLLING_CONCURRENCY updates are running
+            async with slots:
+                pass
+    finally:
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        await main.shutdown(warmup_task)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(poll())
+    except KeyboardInterrupt:
+        logger.info("Polling stopped.")
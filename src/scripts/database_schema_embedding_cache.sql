@@ -0,0 +1,12 @@
+-- database_schema_embedding_cache.sql
+-- Persistent embedding cache (EMBEDDING_CACHE_STORE=postgres), shared by all workers and kept across restarts.
+
+CREATE TABLE IF NOT EXISTS ai.embedding_cache (
+    key TEXT PRIMARY KEY,  -- md5 of model, dimensions, task type and normalized text
+    model TEXT NOT NULL,
+    embedding REAL[] NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Rows are never read by age; this only helps pruning, e.g. DELETE ... WHERE created_at < NOW() - INTERVAL '90 days'
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created_at ON ai.embedding_cache (created_at);
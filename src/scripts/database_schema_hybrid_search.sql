@@ -0,0 +1,11 @@
+-- database_schema_hybrid_search.sql
+-- Adds the full-text column used by hybrid search (KNOWLEDGE_HYBRID=1) to an existing ai.documents table.
+-- New chunks get it on insert; existing ones are filled here. Use the KNOWLEDGE_TS_CONFIG value instead of 'english' if it differs.
+
+ALTER TABLE ai.documents ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR;
+
+UPDATE ai.documents
+SET content_tsv = to_tsvector('english', coalesce(name, '') || E'\n' || content)
+WHERE content_tsv IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_documents_content_tsv ON ai.documents USING gin (content_tsv);
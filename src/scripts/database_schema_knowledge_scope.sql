@@ -0,0 +1,12 @@
+-- database_schema_knowledge_scope.sql
+-- Adds the owner and chat scope to an existing ai.documents table.
+-- Documents indexed before this have no owner or chat: they stay shared with every user and chat.
+-- To make them private instead, backfill them, e.g. UPDATE ai.documents SET owner_id = '<telegram user id>' WHERE ...;
+
+ALTER TABLE ai.documents ADD COLUMN IF NOT EXISTS owner_id TEXT;
+ALTER TABLE ai.documents ADD COLUMN IF NOT EXISTS chat_id TEXT;
+
+-- Scoped retrieval and duplicate checks only read the rows of one owner or chat
+CREATE INDEX IF NOT EXISTS idx_documents_owner ON ai.documents (owner_id, document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_chat ON ai.documents (chat_id, document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_owner_source ON ai.documents (owner_id, (meta_data->>'source'));
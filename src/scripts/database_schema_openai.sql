@@ -13,11 +13,20 @@ CREATE TABLE ai.documents (
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW(),
     content_hash TEXT,
-    filters JSONB DEFAULT '{}'::jsonb
+    filters JSONB DEFAULT '{}'::jsonb,
+    owner_id TEXT,  -- Telegram user who added the document
+    chat_id TEXT,   -- chat it was added in
+    content_tsv TSVECTOR  -- full-text index of name and content (KNOWLEDGE_TS_CONFIG), for hybrid search
 );
 
 -- Recreate indexes
-CREATE INDEX IF NOT EXISTS idx_documents_embedding ON ai.documents USING ivfflat (embedding vector_cosine_ops);
+-- Managed by chat/vector_index.py (VECTOR_INDEX_TYPE, VECTOR_DISTANCE); the operator class must match the query operator
+CREATE INDEX IF NOT EXISTS idx_documents_embedding_hnsw_cosine ON ai.documents USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 CREATE INDEX IF NOT EXISTS idx_documents_source ON ai.documents USING btree ((meta_data->>'source'));
 CREATE INDEX IF NOT EXISTS idx_documents_type ON ai.documents USING btree (document_type);
-CREATE INDEX IF NOT EXISTS idx_documents_content_hash_source ON ai.documents (content_hash, (meta_data->>'source'));
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash_source ON ai.documents (content_hash, (meta_data->>'source'));
+-- Scoped retrieval and duplicate checks only read the rows of one owner or chat
+CREATE INDEX IF NOT EXISTS idx_documents_owner ON ai.documents (owner_id, document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_chat ON ai.documents (chat_id, document_type);
+CREATE INDEX IF NOT EXISTS idx_documents_owner_source ON ai.documents (owner_id, (meta_data->>'source'));
+CREATE INDEX IF NOT EXISTS idx_documents_content_tsv ON ai.documents USING gin (content_tsv);
\ No newline at end of file
@@ -0,0 +1,34 @@
+-- database_schema_response_cache.sql
+-- Semantic response cache (RESPONSE_CACHE_ENABLED=1), shared by all workers.
+
+CREATE TABLE IF NOT EXISTS ai.response_cache (
+    id TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    scope_version BIGINT NOT NULL,
+    context_hash TEXT NOT NULL DEFAULT '',  -- digest of the recent answers of the conversation
+    query TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding VECTOR(1536),  -- gemini dim 768, openai dim 1536
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_used_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Tables created before the context key: their entries no longer match any conversation and expire
+ALTER TABLE ai.response_cache ADD COLUMN IF NOT EXISTS context_hash TEXT NOT NULL DEFAULT '';
+
+-- Bumped whenever documents are added to a knowledge scope, which retires its cached answers
+CREATE TABLE IF NOT EXISTS ai.knowledge_scope_versions (
+    scope TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Cosine index to match the <=> lookups in utils/response_cache.py
+CREATE INDEX IF NOT EXISTS idx_response_cache_embedding ON ai.response_cache USING hnsw (embedding vector_cosine_ops);
+DROP INDEX IF EXISTS ai.idx_response_cache_scope;
+CREATE INDEX IF NOT EXISTS idx_response_cache_scope_context ON ai.response_cache (scope, scope_version, context_hash);
+CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON ai.response_cache (last_used_at);
@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+
+from utils.admission import AdmissionController, ADMIT, DEFER, SHED
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+
+    async def test_admit_defer_shed(self):
+        admission = AdmissionController(max_in_flight=1, max_queued=1)
+        release = asyncio.Event()
+
+        async def run():
+            async with admission.slot():
+                await release.wait()
+
+        self.assertEqual(admission.try_admit(), ADMIT)
+        first = asyncio.create_task(run())
+        await asyncio.sleep(0)
+        self.assertEqual(admission.in_flight, 1)
+
+        self.assertEqual(admission.try_admit(), DEFER)
+        second = asyncio.create_task(run())
+        await asyncio.sleep(0)
+        self.assertEqual(admission.queued, 1)
+
+        self.assertEqual(admission.try_admit(), SHED)
+
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(admission.in_flight, 0)
+        self.assertEqual(admission.queued, 0)
+        self.assertEqual(admission.stats()["decisions"], {ADMIT: 1, DEFER: 1, SHED: 1})
+
+    async def test_sheds_when_estimated_wait_is_too_long(self):
+        admission = AdmissionController(max_in_flight=1, max_queued=10, max_wait=5)
+        admission.latencies.extend([10, 10, 10])
+        admission.in_flight = 1
+        self.assertEqual(admission.try_admit(), SHED)
+
+    async def test_release_returns_the_reservation(self):
+        admission = AdmissionController(max_in_flight=1, max_queued=1)
+        admission.in_flight = 1
+        self.assertEqual(admission.try_admit(), DEFER)
+        admission.release()
+        self.assertEqual(admission.queued, 0)
+        self.assertEqual(admission.try_admit(), DEFER)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from chat.agent_runner import AgentRunner
+
+class FakeAgent:
+    session_id = "session"
+
+    def __init__(self, chunks: int, delay: float):
+        self.chunks = chunks
+        self.delay = delay
+        self.saved = False
+        self.run_response = None
+
+    def run(self, message, stream=False):
+        for i in range(self.chunks):
+            time.sleep(self.delay)
+            yield SimpleNamespace(content=f"{i} ")
+        # phidata writes the session to storage once the stream is consumed
+        self.saved = True
+        self.run_response = SimpleNamespace(content=message)
+
+class TestAgentRunner(unittest.IsolatedAsyncioTestCase):
+
+    async def test_run_returns_final_response(self):
+        runner = AgentRunner(max_concurrency=1)
+        agent = FakeAgent(chunks=3, delay=0)
+        response = await runner.run(agent, "hello")
+        self.assertEqual(response.content, "hello")
+        self.assertTrue(agent.saved)
+
+    async def test_timed_out_run_stops_before_saving(self):
+        runner = AgentRunner(max_concurrency=1)
+        agent = FakeAgent(chunks=100, delay=0.01)
+        with self.assertRaises(asyncio.TimeoutError):
+            await runner.run(agent, "hello", timeout=0.05)
+        # Released only once the thread is done, and the session was never written
+        self.assertEqual(runner.running, 0)
+        self.assertFalse(agent.saved)
+        runner.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
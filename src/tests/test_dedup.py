@@ -0,0 +1,37 @@
+import unittest
+
+from pymongo.errors import DuplicateKeyError
+
+from utils.dedup import UpdateDeduplicator
+
+class FakeMongo:
+    def __init__(self):
+        self.ids = set()
+
+    async def insert(self, item, collection):
+        if item['_id'] in self.ids:
+            raise DuplicateKeyError("duplicate")
+        self.ids.add(item['_id'])
+
+    async def delete(self, query, collection):
+        self.ids.discard(query['_id'])
+
+class TestUpdateDeduplicator(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redelivery_is_duplicate(self):
+        deduplicator = UpdateDeduplicator(FakeMongo())
+        self.assertFalse(await deduplicator.is_duplicate(1))
+        self.assertTrue(await deduplicator.is_duplicate(1))
+
+        # Another process (empty memory) still sees it through Mongo
+        other = UpdateDeduplicator(deduplicator.mongo)
+        self.assertTrue(await other.is_duplicate(1))
+
+    async def test_forgotten_update_is_processed_again(self):
+        deduplicator = UpdateDeduplicator(FakeMongo())
+        await deduplicator.is_duplicate(1)
+        await deduplicator.forget(1)
+        self.assertFalse(await deduplicator.is_duplicate(1))
+
+if __name__ == '__main__':
+    unittest.main()
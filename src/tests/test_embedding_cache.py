@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from phi.embedder.base import Embedder
+
+from utils.embedding_cache import CachedEmbedder, EmbeddingCache, normalize_text
+
+class CountingEmbedder(Embedder):
+    model: str = "test-embedding"
+    dimensions: int = 3
+    calls: int = 0
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embedding_and_usage(text)[0]
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        self.calls += 1
+        return [float(len(text)), 0.0, 1.0], {'total_tokens': 1}
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  Solana\n\tgrants  "), "Solana grants")
+        self.assertEqual(normalize_text("café"), "café")
+        self.assertNotEqual(normalize_text("SOL"), normalize_text("sol"))
+
+    def test_hit_skips_the_provider(self):
+        inner = CountingEmbedder()
+        embedder = CachedEmbedder(inner, cache=EmbeddingCache(max_size=10))
+        self.assertEqual(embedder.dimensions, 3)
+
+        embedding, usage = embedder.get_embedding_and_usage("Which grants fit my project?")
+        self.assertIsNotNone(usage)
+        self.assertEqual(embedder.get_embedding(" Which grants  fit my project? "), embedding)
+        self.assertEqual(inner.calls, 1)
+        self.assertEqual(embedder.get_embedding_and_usage("Which grants fit my project?")[1], None)
+
+        stats = embedder._cache.stats()
+        self.assertEqual((stats['memory_hits'], stats['misses']), (2, 1))
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3, places=3)
+
+    def test_key_includes_model(self):
+        cache = EmbeddingCache(max_size=10)
+        small = CachedEmbedder(CountingEmbedder(), cache=cache)
+        large = CachedEmbedder(CountingEmbedder(model="other-embedding"), cache=cache)
+        small.get_embedding("hello")
+        large.get_embedding("hello")
+        self.assertEqual((small.embedder.calls, large.embedder.calls), (1, 1))
+
+    def test_batch_embeds_only_misses(self):
+        inner = CountingEmbedder()
+        embedder = CachedEmbedder(inner, cache=EmbeddingCache(max_size=10))
+        embedder.get_embedding("a")
+        embeddings = embedder.get_embeddings(["a", "bb", "ccc"])
+        self.assertEqual([embedding[0] for embedding in embeddings], [1.0, 2.0, 3.0])
+        self.assertEqual(inner.calls, 3)
+
+    def test_disk_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "embeddings.db")
+            CachedEmbedder(CountingEmbedder(), cache=EmbeddingCache(max_size=10, store="disk", path=path)).get_embedding("hello")
+
+            inner = CountingEmbedder()
+            cache = EmbeddingCache(max_size=10, store="disk", path=path)
+            self.assertEqual(CachedEmbedder(inner, cache=cache).get_embedding("hello"), [5.0, 0.0, 1.0])
+            self.assertEqual(inner.calls, 0)
+            self.assertEqual(cache.stats()['store_hits'], 1)
+            cache.store.conn.close()
+
+    def test_memory_holds_float32_arrays(self):
+        cache = EmbeddingCache(max_size=10)
+        cache.put("key", "test-embedding", [0.5, 0.25, 1.0])
+        self.assertIsInstance(cache.memory.get("key"), array)
+        self.assertEqual(cache.memory.get("key").itemsize, 4)
+        self.assertEqual(cache.get("key"), [0.5, 0.25, 1.0])
+
+    def test_disk_store_reads_json_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = EmbeddingCache(max_size=10, store="disk", path=os.path.join(directory, "embeddings.db")).store
+            store.conn.execute("INSERT INTO embedding_cache VALUES ('old', 'test-embedding', '[1.0, 2.0]')")
+            store.put("new", "test-embedding", [3.0, 4.0])
+            self.assertEqual((store.get("old"), store.get("new")), ([1.0, 2.0], [3.0, 4.0]))
+            store.conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
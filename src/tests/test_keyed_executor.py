@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+
+from utils.keyed_executor import KeyedExecutor, ShardQueueFull
+
+class TestKeyedExecutor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_same_key_runs_in_order(self):
+        executor = KeyedExecutor(max_concurrency=4)
+        events = []
+
+        async def job(name, delay):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        await asyncio.gather(
+            executor.submit("chat", job, "a", 0.02),
+            executor.submit("chat", job, "b", 0),
+        )
+        self.assertEqual(events, ["start a", "end a", "start b", "end b"])
+
+    async def test_different_keys_run_in_parallel(self):
+        executor = KeyedExecutor(max_concurrency=4)
+        started = asyncio.Event()
+
+        async def waiter():
+            await asyncio.wait_for(started.wait(), timeout=1)
+
+        async def starter():
+            started.set()
+
+        # Would time out if the second key waited for the first
+        await asyncio.gather(executor.submit(1, waiter), executor.submit(2, starter))
+
+    async def test_global_concurrency_cap(self):
+        executor = KeyedExecutor(max_concurrency=2)
+        peak = 0
+
+        async def job():
+            nonlocal peak
+            peak = max(peak, executor.running)
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(executor.submit(key, job) for key in range(6)))
+        self.assertEqual(peak, 2)
+
+    async def test_queue_depth_limit(self):
+        executor = KeyedExecutor(max_queue_per_key=1)
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+
+        first = executor.submit("chat", job)
+        await asyncio.sleep(0)  # first job leaves the queue and starts running
+        second = executor.submit("chat", job)
+        with self.assertRaises(ShardQueueFull):
+            executor.submit("chat", job)
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(executor.stats()["shards"], 0)
+
+    async def test_exception_is_returned_to_caller(self):
+        executor = KeyedExecutor()
+
+        async def job():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await executor.submit("chat", job)
+
+if __name__ == "__main__":
+    unittest.main()
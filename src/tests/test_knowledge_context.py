@@ -0,0 +1,43 @@
+import unittest
+
+from chat.custom_knowledge_base import format_knowledge_context, knowledge_scope, scope_conditions, scope_filters
+
+class TestFormatKnowledgeContext(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(format_knowledge_context([]), "")
+
+    def test_deduplicates_and_stamps_provenance(self):
+        chunks = [
+            {'name': 'Pitch', 'content': 'We build on Solana.', 'content_hash': 'a', 'distance': 0.21,
+             'meta_data': {'source': 'https://example.com', 'chunk': 1, 'total_chunks': 2}},
+            {'name': 'Pitch copy', 'content': 'We build on Solana.', 'content_hash': 'a', 'distance': 0.25,
+             'meta_data': {}},
+            {'name': 'Budget', 'content': 'We need 10k.', 'content_hash': None, 'distance': 0.4, 'meta_data': None},
+        ]
+        context = format_knowledge_context(chunks)
+
+        self.assertEqual(context.count('We build on Solana.'), 1)
+        self.assertIn("[1] document 'Pitch', source https://example.com, part 1/2, distance 0.210", context)
+        self.assertIn("[2] document 'Budget', distance 0.400\nWe need 10k.", context)
+
+class TestKnowledgeScope(unittest.TestCase):
+
+    def test_user_scope(self):
+        filters = scope_filters(42, -100123)
+        self.assertEqual(filters, {'owner_id': '42'})
+        self.assertEqual(knowledge_scope(filters), 'owner_id=42')
+
+    def test_unscoped(self):
+        self.assertEqual(scope_filters(None, None), {})
+        self.assertEqual(knowledge_scope({}), 'global')
+
+    def test_unscoped_documents_are_shared(self):
+        params = {}
+        conditions = scope_conditions('42', None, params)
+        self.assertEqual(conditions, ["(owner_id = :owner_id OR (owner_id IS NULL AND chat_id IS NULL))"])
+        self.assertEqual(params, {'owner_id': '42'})
+        self.assertEqual(scope_conditions(None, None, {}), [])
+
+if __name__ == '__main__':
+    unittest.main()
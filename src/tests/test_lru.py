@@ -0,0 +1,39 @@
+import unittest
+
+from utils.lru import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("missing"))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")  # "b" is now the oldest
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_contains_refreshes_entry(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a")
+        cache.put("b")
+        self.assertIn("a", cache)
+        cache.put("c")
+        self.assertNotIn("b", cache)
+
+    def test_pop(self):
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertEqual(len(cache), 0)
+
+if __name__ == "__main__":
+    unittest.main()
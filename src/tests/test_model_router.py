@@ -0,0 +1,61 @@
+import unittest
+
+from chat.model_router import ModelRouter
+from utils.llm_helper import TIER_FAST, TIER_STRONG
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class TestModelRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.router = ModelRouter(enabled=True, long_message=200, max_inflight=1, overload_cooldown=30,
+                                  sticky_seconds=600, clock=lambda: self.now)
+
+    def test_classification(self):
+        self.assertEqual(self.router.classify("@alice: thanks!", "c1"), (TIER_FAST, 'small_talk'))
+        self.assertEqual(self.router.classify("@alice: which grants fit us?", "c1"), (TIER_FAST, 'short_message'))
+        self.assertEqual(self.router.classify("@alice: draft our application", "c1"), (TIER_STRONG, 'drafting'))
+        self.assertEqual(self.router.classify("@bob: " + "x " * 150, "c2"), (TIER_STRONG, 'long_message'))
+        self.assertEqual(self.router.classify("@bob: hi", "c2", has_attachment=True), (TIER_STRONG, 'attachment'))
+
+    def test_drafting_needs_a_verb_and_a_document(self):
+        for question in ("@alice: when is the application deadline?", "@alice: how do I write well?",
+                         "@alice: what budget do they fund?", "@alice: can this improve our odds?"):
+            self.assertEqual(self.router.classify(question, "c1"), (TIER_FAST, 'short_message'), question)
+        for request in ("@alice: write the budget section", "@alice: please improve our proposal",
+                        "@alice: can you rewrite my executive summary?"):
+            self.assertEqual(self.router.classify(request, "c1"), (TIER_STRONG, 'drafting'), request)
+
+    def test_drafting_follow_ups_stay_strong(self):
+        self.router.classify("@alice: write the budget section", "c1")
+        self.assertEqual(self.router.classify("@alice: make it shorter", "c1"), (TIER_STRONG, 'drafting_follow_up'))
+        self.now += 601
+        self.assertEqual(self.router.classify("@alice: make it shorter", "c1"), (TIER_FAST, 'short_message'))
+
+    def test_falls_back_when_tier_busy(self):
+        with self.router.track(TIER_STRONG):
+            self.assertEqual(self.router.choose("@alice: draft the pitch", "c1"), TIER_FAST)
+        self.assertEqual(self.router.choose("@alice: draft the pitch", "c1"), TIER_STRONG)
+        self.assertEqual(self.router.fallbacks, 1)
+
+    def test_rate_limit_puts_tier_in_cooldown(self):
+        with self.assertRaises(RateLimitError):
+            with self.router.track(TIER_FAST):
+                raise RateLimitError()
+        self.assertEqual(self.router.choose("@alice: what is the deadline?", "c1"), TIER_STRONG)
+        self.now += 31
+        self.assertEqual(self.router.choose("@alice: what is the deadline?", "c1"), TIER_FAST)
+
+    def test_retry_on_other_tier_after_rate_limit(self):
+        self.assertEqual(self.router.choose("@alice: draft the pitch", "c1"), TIER_STRONG)
+        self.assertEqual(self.router.retry_tier(TIER_STRONG, RateLimitError()), TIER_FAST)
+        self.assertEqual(self.router.stats()['turns'], {TIER_FAST: 0, TIER_STRONG: 1})
+        self.assertIsNone(self.router.retry_tier(TIER_STRONG, ValueError()))
+        with self.router.track(TIER_FAST):
+            self.assertIsNone(self.router.retry_tier(TIER_STRONG, RateLimitError()))
+        self.assertEqual(self.router.retries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from phi.agent import AgentSession
+from phi.storage.agent.base import AgentStorage
+
+from chat.token_limit_agent import TokenLimitAgent
+from utils.response_cache import ResponseCache, context_digest
+
+class MemoryStorage(AgentStorage):
+    def __init__(self):
+        self.sessions = {}
+
+    def create(self):
+        pass
+
+    def read(self, session_id, user_id=None):
+        return self.sessions.get(session_id)
+
+    def get_all_session_ids(self, user_id=None, agent_id=None):
+        return list(self.sessions)
+
+    def get_all_sessions(self, user_id=None, agent_id=None):
+        return list(self.sessions.values())
+
+    def upsert(self, session: AgentSession):
+        self.sessions[session.session_id] = session
+        return session
+
+    def delete_session(self, session_id=None):
+        self.sessions.pop(session_id, None)
+
+    def drop(self):
+        self.sessions = {}
+
+    def upgrade_schema(self):
+        pass
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_only_self_contained_turns_are_cacheable(self):
+        cache = ResponseCache("postgresql://localhost/test", min_words=4)
+        self.assertTrue(cache.cacheable("@ana: Which grants fund Solana tooling?", "Which grants fund Solana tooling?"))
+        self.assertFalse(cache.cacheable("@ana: make it shorter", "make it shorter"))
+        self.assertFalse(cache.cacheable("@ana: Can you expand on this part? REPLYING TO: ...",
+                                         "Can you expand on this part? REPLYING TO: ..."))
+        self.assertFalse(cache.cacheable("SYSTEM: URLs are being crawled and added to knowledge base: https://a.example",
+                                         "URLs are being crawled and added to knowledge base: https://a.example"))
+
+    def test_cached_turn_joins_the_session(self):
+        storage = MemoryStorage()
+        agent = TokenLimitAgent(session_id="1_1", storage=storage, telemetry=False)
+        agent.prefetch_session()
+        before = context_digest(agent.recent_responses(2))
+
+        agent.record_turn("@ana: Which grants fund Solana tooling?", "The Solana Foundation grants.")
+
+        agent = TokenLimitAgent(session_id="1_1", storage=storage, telemetry=False)
+        agent.prefetch_session()
+        self.assertEqual(agent.recent_responses(2), ["The Solana Foundation grants."])
+        # The same question asked later in the conversation has another key
+        self.assertNotEqual(context_digest(agent.recent_responses(2)), before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from utils.get_applications import ResponseWriter, record_id
+
+class TestResponseWriter(unittest.IsolatedAsyncioTestCase):
+
+    def test_record_id_is_per_user(self):
+        self.assertNotEqual(record_id("1", "Thanks!"), record_id("2", "Thanks!"))
+        self.assertEqual(record_id("1", "Thanks!"), record_id("1", "Thanks!"))
+
+    async def test_failed_rows_are_retried(self):
+        writer = ResponseWriter(max_attempts=3, backoff=0)
+        calls = []
+
+        def write_sync(items):
+            calls.append([item['user_id'] for item in items])
+            # The row of user 2 fails once; the rest of the batch is committed
+            return [(item, RuntimeError("deadlock")) for item in items if item['user_id'] == "2" and len(calls) == 1]
+
+        with patch.object(writer, '_write_sync', side_effect=write_sync):
+            await writer._write([{'user_id': "1", 'response': "a"}, {'user_id': "2", 'response': "b"}])
+        self.assertEqual(calls, [["1", "2"], ["2"]])
+        self.assertEqual((writer.written, writer.failed), (2, 0))
+
+    async def test_alerts_after_last_attempt(self):
+        writer = ResponseWriter(max_attempts=2, backoff=0)
+        with patch.object(writer, '_write_sync', side_effect=ConnectionError("down")), \
+                patch('utils.get_applications.sendAlert', new_callable=AsyncMock) as alert:
+            await writer._write([{'user_id': "1", 'response': "a"}])
+        self.assertEqual((writer.written, writer.failed), (0, 1))
+        alert.assert_awaited_once()
+
+if __name__ == '__main__':
+    unittest.main()
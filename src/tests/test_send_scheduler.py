@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from utils.send_scheduler import TokenBucket, SendScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+        self.assertTrue(bucket.try_take())
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+        self.assertAlmostEqual(bucket.time_until_token(), 1.0)
+
+        clock.now = 1.0
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock)
+        bucket.pause(5)
+        self.assertFalse(bucket.try_take())
+        self.assertAlmostEqual(bucket.time_until_token(), 5.0)
+
+        clock.now = 5.0
+        self.assertTrue(bucket.try_take())
+
+class TestSendScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_interactive_overtakes_bulk(self):
+        scheduler = SendScheduler(global_rate=20, chat_rate=100, chat_burst=100)
+        scheduler.global_bucket.tokens = 0
+        order = []
+
+        async def send(name):
+            order.append(name)
+
+        bulk = [asyncio.create_task(scheduler.send(i, lambda i=i: send(f"bulk-{i}"), priority=PRIORITY_BULK))
+                for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(scheduler.send(99, lambda: send("interactive"), priority=PRIORITY_INTERACTIVE))
+        await asyncio.gather(interactive, *bulk)
+
+        self.assertEqual(order[0], "interactive")
+        self.assertEqual(scheduler.stats()['sent'], 4)
+
+    async def test_same_chat_in_order_and_locks_released(self):
+        scheduler = SendScheduler(global_rate=100, chat_rate=100, chat_burst=100)
+        order = []
+
+        async def send(name, delay):
+            await asyncio.sleep(delay)
+            order.append(name)
+
+        await asyncio.gather(
+            scheduler.send(1, lambda: send("first", 0.01)),
+            scheduler.send(1, lambda: send("second", 0)),
+        )
+        self.assertEqual(order, ["first", "second"])
+        self.assertEqual((scheduler._chat_locks, scheduler._chat_senders), ({}, {}))
+
+if __name__ == '__main__':
+    unittest.main()
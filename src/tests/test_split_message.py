@@ -0,0 +1,24 @@
+import unittest
+
+from utils.telegram_helper import split_message
+
+class TestSplitMessage(unittest.TestCase):
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(split_message("hello"), ["hello"])
+        self.assertEqual(split_message(""), [""])
+
+    def test_splits_at_newline(self):
+        text = "a" * 6 + "\n" + "b" * 6
+        self.assertEqual(split_message(text, limit=10), ["aaaaaa", "bbbbbb"])
+
+    def test_hard_split_without_newline(self):
+        self.assertEqual(split_message("x" * 25, limit=10), ["x" * 10, "x" * 10, "x" * 5])
+
+    def test_boundaries_stable_while_text_grows(self):
+        text = "line one\nline two\n"
+        first = split_message(text, limit=12)[0]
+        self.assertEqual(split_message(text + "more text\n" * 5, limit=12)[0], first)
+
+if __name__ == '__main__':
+    unittest.main()
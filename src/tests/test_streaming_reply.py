@@ -0,0 +1,38 @@
+import unittest
+from types import SimpleNamespace
+
+from utils.telegram_helper import StreamingReply
+
+class FakeHelper:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_plain(self, chat_id, text):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def edit_message(self, chat_id, message_id, text, formatted=False):
+        self.edits.append((message_id, text))
+
+class TestStreamingReply(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fail_replaces_placeholder(self):
+        helper = FakeHelper()
+        reply = StreamingReply(helper, 1)
+        await reply.start()
+        await reply.fail("timed out")
+        self.assertEqual(helper.sent, [StreamingReply.PLACEHOLDER])
+        self.assertEqual(helper.edits, [(1, "timed out")])
+
+    async def test_fail_after_partial_text_follows_it(self):
+        helper = FakeHelper()
+        reply = StreamingReply(helper, 1, edit_interval=0)
+        await reply.start()
+        await reply.update("Half an answer")
+        await reply.fail("timed out")
+        self.assertEqual(helper.edits, [(1, "Half an answer")])
+        self.assertEqual(helper.sent, [StreamingReply.PLACEHOLDER, "timed out"])
+
+if __name__ == '__main__':
+    unittest.main()
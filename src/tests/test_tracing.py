@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from utils import tracing
+from utils.tracing import Tracer, span, start_trace, trace_id_for
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer()
+        self.spans = []
+        record = self.tracer.record
+        self.tracer.record = lambda s: (self.spans.append(s), record(s))
+        patcher = mock.patch.object(tracing, 'tracer', self.tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_spans_nest_under_the_update_trace(self):
+        def work():
+            with span('inner'):
+                pass
+
+        async def handle():
+            start_trace(42)
+            with span('outer'):
+                await asyncio.to_thread(work)
+
+        asyncio.run(handle())
+        inner, outer = self.spans
+        self.assertEqual(outer['trace_id'], trace_id_for(42))
+        self.assertEqual(inner['trace_id'], trace_id_for(42))
+        self.assertEqual(inner['parent_id'], outer['span_id'])
+        self.assertIsNone(outer['parent_id'])
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(ValueError):
+            with span('failing'):
+                raise ValueError("boom")
+        self.assertEqual(self.spans[0]['error'], "ValueError: boom")
+
+    def test_summary_percentiles(self):
+        for ms in range(1, 101):
+            self.tracer.record({'name': 'stage', 'duration_ms': ms})
+        summary = self.tracer.summary()['stage']
+        self.assertEqual(summary['count'], 100)
+        self.assertLessEqual(summary['p50'], summary['p95'])
+        self.assertLessEqual(summary['p95'], summary['p99'])
+
+if __name__ == '__main__':
+    unittest.main()
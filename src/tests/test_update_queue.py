@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+
+from utils.update_queue import UpdateQueue, STATUS_DONE, STATUS_FAILED
+
+class FakeMongo:
+    def __init__(self):
+        self.items = {}
+        self.failed_writes = 0  # updateFields calls that fail, like the wrapper, by returning None
+
+    async def insert(self, item, collection):
+        self.items[item['_id']] = dict(item)
+
+    async def createIndex(self, keys, collection, **kwargs):
+        pass
+
+    async def updateMany(self, query, field, value, collection):
+        pass
+
+    async def updateFields(self, id, fields, collection):
+        if self.failed_writes:
+            self.failed_writes -= 1
+            return None
+        self.items[id].update(fields)
+        return True
+
+    async def findOneAndUpdate(self, query, update, collection, sort=None):
+        pending = sorted(_id for _id, item in self.items.items() if item['status'] == query['status'])
+        if not pending:
+            return None
+        item = self.items[pending[0]]
+        item.update(update['$set'])
+        item['attempts'] += 1
+        return dict(item)
+
+class TestUpdateQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def test_slow_update_does_not_hold_up_others(self):
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(update):
+            if update['chat'] == 'slow':
+                await release.wait()
+            handled.append(update['update_id'])
+
+        mongo = FakeMongo()
+        queue = UpdateQueue(mongo, handler, max_in_flight=4, poll_interval=0.01)
+        await queue.start()
+        await queue.enqueue({'update_id': 1, 'chat': 'slow'})
+        await queue.enqueue({'update_id': 2, 'chat': 'fast'})
+        await queue.enqueue({'update_id': 3, 'chat': 'fast'})
+        await asyncio.sleep(0.05)
+        self.assertEqual(handled, [2, 3])
+        self.assertEqual(mongo.items[2]['status'], STATUS_DONE)
+
+        release.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(mongo.items[1]['status'], STATUS_DONE)
+        await queue.stop()
+
+    async def test_failed_update_is_retried_then_marked_failed(self):
+        async def handler(update):
+            raise RuntimeError("boom")
+
+        mongo = FakeMongo()
+        queue = UpdateQueue(mongo, handler, max_attempts=2, poll_interval=0.01)
+        await queue.start()
+        await queue.enqueue({'update_id': 1})
+        await asyncio.sleep(0.05)
+        self.assertEqual(mongo.items[1]['attempts'], 2)
+        self.assertEqual(mongo.items[1]['status'], STATUS_FAILED)
+        self.assertEqual(mongo.items[1]['last_error'], "boom")
+        await queue.stop()
+
+    async def test_failed_outcome_write_is_retried(self):
+        async def handler(update):
+            pass
+
+        mongo = FakeMongo()
+        queue = UpdateQueue(mongo, handler, poll_interval=0.01)
+        await queue.start()
+        mongo.failed_writes = 2
+        await queue.enqueue({'update_id': 1})
+        await asyncio.sleep(0.1)
+        self.assertEqual((mongo.items[1]['status'], mongo.failed_writes), (STATUS_DONE, 0))
+        await queue.stop()
+
+if __name__ == '__main__':
+    unittest.main()
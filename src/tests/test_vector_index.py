@@ -0,0 +1,105 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from chat import custom_knowledge_base
+from chat.custom_knowledge_base import CustomKnowledgeBase
+from chat.vector_index import VectorIndexManager, find_seq_scans
+
+class TestVectorIndex(unittest.TestCase):
+
+    def test_index_matches_query_operator(self):
+        manager = VectorIndexManager(index_type='hnsw', distance='cosine', hnsw_m=16, hnsw_ef_construction=64)
+        self.assertEqual(manager.operator, '<=>')
+        self.assertEqual(
+            manager.create_index_sql(),
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_embedding_hnsw_cosine ON ai.documents "
+            "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)",
+        )
+
+        manager = VectorIndexManager(index_type='ivfflat', distance='l2', ivfflat_lists=200)
+        self.assertEqual(manager.operator, '<->')
+        self.assertIn("USING ivfflat (embedding vector_l2_ops) WITH (lists = 200)", manager.create_index_sql())
+
+    def test_rejects_unknown_settings(self):
+        with self.assertRaises(ValueError):
+            VectorIndexManager(index_type='flat')
+        with self.assertRaises(ValueError):
+            VectorIndexManager(distance='manhattan')
+
+    def test_query_settings(self):
+        manager = VectorIndexManager(ef_search=40, probes=10, iterative_scan='')
+        self.assertEqual(manager.query_settings(), {'hnsw.ef_search': '40', 'ivfflat.probes': '10'})
+        self.assertEqual(manager.query_settings(ef_search=100)['hnsw.ef_search'], '100')
+
+    def test_filtered_query_settings(self):
+        # Without iterative scans a filtered query searches a larger candidate list
+        manager = VectorIndexManager(ef_search=40, iterative_scan='', filtered_ef_search=200)
+        self.assertEqual(manager.query_settings(filtered=True)['hnsw.ef_search'], '200')
+        self.assertEqual(manager.query_settings(ef_search=400, filtered=True)['hnsw.ef_search'], '400')
+
+        manager = VectorIndexManager(ef_search=40, iterative_scan='strict_order', filtered_ef_search=200)
+        settings = manager.query_settings(filtered=True)
+        self.assertEqual((settings['hnsw.ef_search'], settings['hnsw.iterative_scan']), ('40', 'strict_order'))
+
+    def test_detects_seq_scan(self):
+        index_plan = {'Node Type': 'Limit', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'documents', 'Index Name': 'idx_documents_embedding_hnsw_cosine'},
+        ]}
+        seq_plan = {'Node Type': 'Limit', 'Plans': [
+            {'Node Type': 'Sort', 'Plans': [{'Node Type': 'Seq Scan', 'Relation Name': 'documents'}]},
+        ]}
+        manager = VectorIndexManager(plan_check_every=2)
+        self.assertFalse(manager.record_plan(index_plan))
+        with self.assertLogs('chat.vector_index', level='WARNING'):
+            self.assertTrue(manager.record_plan(seq_plan))
+        self.assertEqual(len(find_seq_scans(seq_plan, 'documents')), 1)
+        self.assertEqual(manager.seq_scans, 1)
+
+        self.assertEqual([manager.should_check_plan() for _ in range(4)], [True, False, True, False])
+
+class TestFilteredSearch(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.kb = CustomKnowledgeBase.model_construct(vector_db=SimpleNamespace(schema='ai', table_name='documents'))
+        self.fetch = mock.AsyncMock(return_value=[])
+        patcher = mock.patch.object(custom_knowledge_base.retrieval_pool, 'fetch', self.fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use_index(self, **kwargs):
+        patcher = mock.patch.object(custom_knowledge_base, 'vector_index',
+                                    VectorIndexManager(ef_search=40, plan_check_every=0, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_owner_filter_is_in_the_similarity_query(self):
+        self.use_index(iterative_scan='strict_order')
+        await self.kb.asearch_chunks("budget", limit=5, query_embedding=[0.1, 0.2], owner_id=42, hybrid=False)
+
+        sql, params = self.fetch.call_args.args
+        self.assertIn("WHERE (owner_id = :owner_id OR (owner_id IS NULL AND chat_id IS NULL))", sql)
+        self.assertLess(sql.index("WHERE (owner_id"), sql.index("ORDER BY embedding <=>"))
+        self.assertEqual((params['owner_id'], params['limit']), ('42', 5))
+        # Iterative scans are a connection setting of the pool: no extra round trip
+        self.assertIsNone(self.fetch.call_args.kwargs['settings'])
+
+    async def test_hybrid_query_ors_the_query_lexemes(self):
+        self.use_index(iterative_scan='')
+        await self.kb.asearch_chunks("@alice: Solana grants", limit=5, query_embedding=[0.1], owner_id=42, hybrid=True)
+
+        sql, params = self.fetch.call_args.args
+        self.assertIn("string_agg(quote_literal(lexeme), ' | ')", sql)
+        self.assertNotIn("replace(", sql)
+        self.assertEqual(params['query_text'], "Solana grants")
+
+    async def test_filtered_query_raises_ef_search_without_iterative_scan(self):
+        self.use_index(iterative_scan='', filtered_ef_search=200)
+        await self.kb.asearch_chunks("budget", limit=5, query_embedding=[0.1], owner_id=42, hybrid=False)
+        self.assertEqual(self.fetch.call_args.kwargs['settings']['hnsw.ef_search'], '200')
+
+        await self.kb.asearch_chunks("budget", limit=5, query_embedding=[0.1], hybrid=False)
+        self.assertIsNone(self.fetch.call_args.kwargs['settings'])
+
+if __name__ == '__main__':
+    unittest.main()
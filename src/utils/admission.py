@@ -0,0 +1,105 @@
+# utils/admission.py
+
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+from utils.metrics import percentile
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+ADMIT = 'admit'
+DEFER = 'defer'
+SHED = 'shed'
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 16, max_queued: int = 64, max_wait: float = 120, window: int = 200):
+        """
+        Bound the number of agent runs in flight and decide what to do with work beyond it.
+
+        New work is admitted while a slot is free, deferred (queued behind the running
+        work) while the queue is short enough, and shed once the queue is full or the
+        estimated wait, based on recent run latency, exceeds max_wait.
+
+        Args:
+            max_in_flight (int): Maximum number of runs executing at once.
+            max_queued (int): Maximum number of runs waiting for a slot.
+            max_wait (float): Maximum estimated queue wait in seconds before work is shed.
+            window (int): Number of recent run latencies kept for estimates.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        self.latencies = deque(maxlen=window)
+        self.decisions = Counter()
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    def estimated_wait(self) -> float:
+        """
+        Seconds a newly queued run would wait, from the queue depth and the median run latency.
+        """
+        median = percentile(self.latencies, 50) or 0
+        return (self.queued + 1) / self.max_in_flight * median
+
+    def try_admit(self) -> str:
+        """
+        Decide whether new work runs now, waits, or is rejected. Unless shed, the caller
+        must then run it inside `slot()`, or give the reservation back with `release()`.
+
+        Returns:
+            str: ADMIT, DEFER or SHED.
+        """
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            decision = ADMIT
+        elif self.queued >= self.max_queued or self.estimated_wait() > self.max_wait:
+            decision = SHED
+        else:
+            decision = DEFER
+
+        self.decisions[decision] += 1
+        if decision != SHED:
+            self.queued += 1
+        else:
+            logger.warning(f"Shedding work: {self.in_flight} in flight, {self.queued} queued.")
+        return decision
+
+    def release(self):
+        """
+        Give back the reservation of an admitted or deferred call that will not enter `slot()`.
+        """
+        self.queued -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Wait for a free slot, then run the body while counting it as in flight.
+        """
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.latencies.append(time.monotonic() - started)
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'decisions': dict(self.decisions),
+            'latency_p50': percentile(self.latencies, 50),
+            'latency_p95': percentile(self.latencies, 95),
+            'estimated_wait': self.estimated_wait(),
+        }
@@ -0,0 +1,86 @@
+# utils/dedup.py
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from utils.lru import LRUCache
+from utils.mongo_aio import Mongo
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    def __init__(self, mongo: Mongo, collection: str = 'processed_updates', max_size: int = 10000, ttl_hours: int = 24):
+        """
+        Detect Telegram redeliveries so the same update is only processed once.
+
+        Recently seen update ids are kept in an in-memory LRU; the Mongo collection
+        (expired by a TTL index) covers restarts and other processes.
+
+        Args:
+            mongo (Mongo): The shared Mongo wrapper.
+            collection (str): Collection recording processed update ids.
+            max_size (int): Number of update ids kept in memory.
+            ttl_hours (int): Hours an update id is remembered in Mongo.
+        """
+        self.mongo = mongo
+        self.collection = collection
+        self.ttl = timedelta(hours=ttl_hours)
+        self.seen = LRUCache(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self):
+        await self.mongo.createIndex('expire_at', self.collection, expireAfterSeconds=0)
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """
+        Record update_id as seen and report whether it was seen before.
+
+        Args:
+            update_id (int): The Telegram update_id.
+
+        Returns:
+            bool: True if the update was already processed or is being processed.
+        """
+        if update_id in self.seen:
+            self.hits += 1
+            return True
+
+        try:
+            await self.mongo.insert({
+                '_id': update_id,
+                'expire_at': datetime.now(timezone.utc) + self.ttl,
+            }, self.collection)
+        except DuplicateKeyError:
+            self.seen.put(update_id)
+            self.hits += 1
+            logger.info(f"Duplicate update {update_id} skipped.")
+            return True
+        except Exception as e:
+            # Fail open: processing twice is better than dropping an update
+            logger.error(f"Dedup check failed for update {update_id}: {e}")
+
+        self.seen.put(update_id)
+        self.misses += 1
+        return False
+
+    async def forget(self, update_id: int):
+        """
+        Drop update_id so a redelivery is processed, e.g. when it could not be accepted.
+
+        Args:
+            update_id (int): The Telegram update_id.
+        """
+        self.seen.pop(update_id)
+        await self.mongo.delete({'_id': update_id}, self.collection)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'cached': len(self.seen),
+        }
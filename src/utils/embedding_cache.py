@@ -0,0 +1,228 @@
+# utils/embedding_cache.py
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from phi.embedder.base import Embedder
+from pydantic import PrivateAttr
+from sqlalchemy import create_engine, text
+
+from config import POSTGRES_CONNECTION, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_STORE, EMBEDDING_CACHE_PATH
+from utils.lru import LRUCache
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as it is embedded and cached: Unicode NFC with whitespace runs collapsed.
+    Case is kept, it matters for names and tickers.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class PostgresEmbeddingStore:
+    """
+    Persistent tier in ai.embedding_cache, shared by every worker.
+    """
+
+    def __init__(self, db_url: str):
+        self.db_url = db_url
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = create_engine(self.db_url, pool_pre_ping=True)
+        return self._engine
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT embedding FROM ai.embedding_cache WHERE key = :key"), {'key': key}).scalar()
+
+    def put(self, key: str, model: str, embedding: List[float]):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO ai.embedding_cache (key, model, embedding) VALUES (:key, :model, :embedding)
+                ON CONFLICT (key) DO NOTHING
+            """), {'key': key, 'model': model, 'embedding': embedding})
+
+
+class DiskEmbeddingStore:
+    """
+    Persistent tier in a local SQLite file, for single-host deployments. Embeddings are
+    stored as float32 bytes; rows written as JSON by earlier versions are still read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, model TEXT, embedding BLOB)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self.conn.execute("SELECT embedding FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if isinstance(row[0], str):
+            return json.loads(row[0])
+        return array('f', row[0]).tolist()
+
+    def put(self, key: str, model: str, embedding: List[float]):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO embedding_cache (key, model, embedding) VALUES (?, ?, ?)",
+                (key, model, array('f', embedding).tobytes()),
+            )
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = 10000, store: str = "", path: str = "embedding_cache.db",
+                 db_url: str = POSTGRES_CONNECTION):
+        """
+        Two-tier cache of embeddings, shared by every embedder of the process: a bounded
+        in-memory LRU in front of an optional persistent store.
+
+        The LRU holds float32 arrays, about 6 KB for a 1536-dimension embedding instead of
+        about 50 KB as a list of Python floats; lookups return lists again.
+
+        Args:
+            max_size (int): Entries kept in memory.
+            store (str): Persistent tier: "" for none, "postgres" (ai.embedding_cache) or "disk" (SQLite at path).
+            path (str): SQLite file of the "disk" store.
+            db_url (str): SQLAlchemy database URL of the "postgres" store.
+        """
+        self.memory = LRUCache(max_size=max_size)
+        self._lock = threading.Lock()
+        if store == "postgres":
+            self.store = PostgresEmbeddingStore(db_url)
+        elif store == "disk":
+            self.store = DiskEmbeddingStore(path)
+        else:
+            self.store = None
+
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            compact = self.memory.get(key)
+        if compact is not None:
+            self.memory_hits += 1
+            return compact.tolist()
+        if self.store is not None:
+            embedding = None
+            try:
+                embedding = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"Embedding cache store lookup failed: {e}")
+            if embedding is not None:
+                embedding = list(embedding)
+                self.store_hits += 1
+                with self._lock:
+                    self.memory.put(key, array('f', embedding))
+                return embedding
+        self.misses += 1
+        return None
+
+    def put(self, key: str, model: str, embedding: List[float]):
+        with self._lock:
+            self.memory.put(key, array('f', embedding))
+        if self.store is not None:
+            try:
+                self.store.put(key, model, embedding)
+            except Exception as e:
+                logger.warning(f"Embedding cache store write failed: {e}")
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.store_hits
+        total = hits + self.misses
+        return {
+            'size': len(self.memory),
+            'store': type(self.store).__name__ if self.store is not None else None,
+            'memory_hits': self.memory_hits,
+            'store_hits': self.store_hits,
+            'misses': self.misses,
+            'hit_rate': round(hits / total, 4) if total else None,
+        }
+
+
+# Shared by every embedder of this process; keys include the model, so providers never mix
+embedding_cache = EmbeddingCache(max_size=EMBEDDING_CACHE_SIZE, store=EMBEDDING_CACHE_STORE, path=EMBEDDING_CACHE_PATH)
+
+
+class CachedEmbedder(Embedder):
+    """
+    Embedder wrapper that answers repeated texts from the embedding cache. Only misses
+    reach the wrapped embedder, and with it the provider.
+    """
+
+    embedder: Embedder
+    _cache: EmbeddingCache = PrivateAttr(default=None)
+
+    def __init__(self, embedder: Embedder, cache: Optional[EmbeddingCache] = None, **kwargs):
+        super().__init__(embedder=embedder, dimensions=embedder.dimensions, **kwargs)
+        self._cache = cache or embedding_cache
+
+    @property
+    def model_id(self) -> str:
+        return str(getattr(self.embedder, 'model', type(self.embedder).__name__))
+
+    def cache_key(self, text: str) -> str:
+        # Task type changes Gemini embeddings for the same text
+        task_type = getattr(self.embedder, 'task_type', '')
+        return hashlib.md5(f"{self.model_id}:{self.dimensions}:{task_type}:{text}".encode()).hexdigest()
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embedding_and_usage(text)[0]
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        text = normalize_text(text)
+        key = self.cache_key(text)
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            return embedding, None
+        embedding, usage = self.embedder.get_embedding_and_usage(text)
+        if embedding:
+            self._cache.put(key, self.model_id, embedding)
+        return embedding, usage
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts, sending only the uncached ones to the provider, in one request when it supports it.
+        """
+        texts = [normalize_text(text) for text in texts]
+        keys = [self.cache_key(text) for text in texts]
+        embeddings: List[Any] = [self._cache.get(key) for key in keys]
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+
+        if hasattr(self.embedder, 'response'):
+            # OpenAIEmbedder passes the input through, and the API embeds a list in one request
+            response = self.embedder.response(text=[texts[index] for index in missing])
+            fetched = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        else:
+            fetched = [self.embedder.get_embedding(texts[index]) for index in missing]
+        for index, embedding in zip(missing, fetched):
+            embeddings[index] = embedding
+            if embedding:
+                self._cache.put(keys[index], self.model_id, embedding)
+        return embeddings
@@ -1,75 +1,196 @@
+import asyncio
+import contextvars
 import psycopg2
 import json
 import hashlib
 import logging
+from typing import List, Optional, Tuple
 
-from config import POSTGRES_CONNECTION
+from config import POSTGRES_CONNECTION, RESPONSE_WRITE_BATCH, RESPONSE_WRITE_INTERVAL
 from utils.llm_helper import get_embedder
+from utils.pagerduty import sendAlert
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 
-async def save_response(response: str, user_id: str, chat_id: str):
+def record_id(user_id: str, response: str) -> str:
     """
-    Save response directly to ai.applications table.
-    Updates existing record if user_id exists.
+    Id of a new ai.applications record, unique per user: two users given the same reply get a record each.
     """
-    try:
-        # Get embedding for the response
-        embedder = get_embedder()
-        embedding = embedder.get_embedding(response)
-        
-        # Generate a content hash
-        response_bytes = response.encode('utf-8')
-        content_hash = hashlib.md5(response_bytes).hexdigest()
-        
-        # Basic metadata
-        meta_data = {
-            "source": f"chat_{chat_id}",
-            "user_id": user_id,
-            "chat_id": chat_id
-        }
+    return hashlib.md5(f"{user_id}:{response}".encode('utf-8')).hexdigest()
+
+
+class ResponseWriter:
+    def __init__(self, batch_size: int = 20, flush_interval: float = 1.0, max_attempts: int = 3, backoff: float = 1):
+        """
+        Write-behind persistence of agent responses to ai.applications.
+
+        save() only queues the response. A background task collects queued responses
+        for up to flush_interval seconds (or batch_size responses), keeps the latest one
+        per user, embeds them in one request and upserts them in a single transaction,
+        each row under its own savepoint. Failed rows are retried; responses still
+        failing after max_attempts raise an alert.
+
+        Args:
+            batch_size (int): Maximum responses per batch.
+            flush_interval (float): Seconds a batch waits to fill up.
+            max_attempts (int): Write attempts per response.
+            backoff (float): Initial delay between attempts, doubled after each failure.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._embedder = None
+
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    def save(self, response: str, user_id: str, chat_id: str) -> str:
+        """
+        Queue a response for saving.
+
+        Args:
+            response (str): The agent response.
+            user_id (str): Telegram user ID.
+            chat_id (str): Telegram chat ID.
+
+        Returns:
+            str: The content hash of the response.
+        """
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            # A fresh context: batches mix updates and must not join the trace of the first one.
+            # Context().run instead of create_task(context=...), which needs Python 3.11
+            self._task = contextvars.Context().run(asyncio.create_task, self._run())
+        content_hash = hashlib.md5(response.encode('utf-8')).hexdigest()
+        self._queue.put_nowait({'response': response, 'user_id': user_id, 'chat_id': chat_id,
+                                'content_hash': content_hash})
+        self.queued += 1
+        return content_hash
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: List[dict]):
+        # Only the latest response of a user survives the upsert anyway
+        latest = list({item['user_id']: item for item in batch}.values())
+        pending, error, delay = latest, None, self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with span('save_response.batch', responses=len(pending), attempt=attempt):
+                    failures = await asyncio.to_thread(self._write_sync, pending)
+            except Exception as e:
+                # Embedding or connection failure: the whole batch is retried
+                failures = [(item, e) for item in pending]
+            pending = [item for item, _ in failures]
+            if not pending:
+                break
+            error = failures[0][1]
+            logger.warning(f"Saving {len(pending)} responses failed (attempt {attempt}): {error}")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+                delay *= 2  # Exponential backoff
+
+        self.written += len(latest) - len(pending)
+        self.batches += 1
+        logger.info(f"Saved {len(latest) - len(pending)} responses ({len(batch)} queued) in one batch")
+        if pending:
+            self.failed += len(pending)
+            users = ", ".join(item['user_id'] for item in pending)
+            logger.error(f"Error saving application responses of {users}: {error}")
+            await sendAlert(f"Saving application responses failed for {users}: {error}")
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self._embedder is None:
+            self._embedder = get_embedder()
+        if hasattr(self._embedder, 'get_embeddings'):
+            # Responses already embedded (e.g. the same answer saved twice) come from the cache
+            return self._embedder.get_embeddings(texts)
+        if hasattr(self._embedder, 'response'):
+            # OpenAIEmbedder passes the input through, and the API embeds a list in one request
+            response = self._embedder.response(text=texts)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return [self._embedder.get_embedding(text) for text in texts]
+
+    def _write_sync(self, items: List[dict]) -> List[Tuple[dict, Exception]]:
+        """
+        Upsert the items in one transaction. A failing row is rolled back to its savepoint
+        and returned with its error; the other rows are committed.
+        """
+        embeddings = self._embed([item['response'] for item in items])
+        failures = []
 
         # Create connection
         conn = psycopg2.connect(POSTGRES_CONNECTION)
-        cur = conn.cursor()
+        try:
+            with conn:  # One transaction for the whole batch
+                with conn.cursor() as cur:
+                    for item, embedding in zip(items, embeddings):
+                        cur.execute("SAVEPOINT save_response")
+                        try:
+                            self._upsert(cur, item, embedding)
+                        except Exception as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT save_response")
+                            failures.append((item, e))
+                        else:
+                            cur.execute("RELEASE SAVEPOINT save_response")
+        finally:
+            conn.close()
+        return failures
 
-        # First check if user_id exists
-        check_query = """
-        SELECT id FROM ai.applications 
-        WHERE meta_data->>'user_id' = %s 
-        ORDER BY created_at DESC 
-        LIMIT 1
-        """
-        cur.execute(check_query, (user_id,))
-        existing_record = cur.fetchone()
-
-        if existing_record:
-            # Update existing record
-            update_query = """
-            UPDATE ai.applications 
-            SET 
-                content = %s,
-                meta_data = %s,
-                embedding = %s,
-                content_hash = %s,
-                updated_at = NOW()
-            WHERE id = %s
-            """
-            
-            update_values = (
-                response,                          # content
-                json.dumps(meta_data),             # meta_data
-                embedding,                         # embedding
-                content_hash,                      # content_hash
-                existing_record[0]                 # id
-            )
-            
-            cur.execute(update_query, update_values)
-            logger.info(f"Updated existing application for user {user_id}")
-        else:
-            # Insert new record
-            insert_query = """
+    @staticmethod
+    def _upsert(cur, item: dict, embedding: List[float]):
+        # Basic metadata
+        meta_data = json.dumps({
+            "source": f"chat_{item['chat_id']}",
+            "user_id": item['user_id'],
+            "chat_id": item['chat_id']
+        })
+
+        # Update the latest record of the user, if there is one
+        cur.execute("""
+        UPDATE ai.applications
+        SET
+            content = %s,
+            meta_data = %s,
+            embedding = %s,
+            content_hash = %s,
+            updated_at = NOW()
+        WHERE id = (
+            SELECT id FROM ai.applications
+            WHERE meta_data->>'user_id' = %s
+            ORDER BY created_at DESC
+            LIMIT 1
+        )
+        """, (item['response'], meta_data, embedding, item['content_hash'], item['user_id']))
+
+        if cur.rowcount == 0:
+            cur.execute("""
             INSERT INTO ai.applications (
                 id,
                 name,
@@ -79,35 +200,55 @@ async def save_response(response: str, user_id: str, chat_id: str):
                 document_type,
                 content_hash
             ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            insert_values = (
-                content_hash,                      # id
-                f"Application Response - {user_id}",  # name
-                response,                          # content
-                json.dumps(meta_data),             # meta_data
-                embedding,                         # embedding
-                "application",                     # document_type
-                content_hash                       # content_hash
-            )
-            
-            cur.execute(insert_query, insert_values)
-            logger.info(f"Inserted new application for user {user_id}")
-
-        conn.commit()
-        cur.close()
-        conn.close()
-            
-        return content_hash
-        
-    except Exception as e:
-        logger.error(f"Error saving application response: {str(e)}")
-        raise
+            ON CONFLICT (id) DO NOTHING
+            """, (
+                record_id(item['user_id'], item['response']),  # id
+                f"Application Response - {item['user_id']}",   # name
+                item['response'],                              # content
+                meta_data,                                     # meta_data
+                embedding,                                     # embedding
+                "application",                                 # document_type
+                item['content_hash']                           # content_hash
+            ))
+
+    async def close(self, timeout: float = 30):
+        """
+        Write everything still queued, waiting at most `timeout` seconds.
+        """
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out saving {self._queue.qsize()} queued responses on shutdown")
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queued,
+            'pending': self._queue.qsize() if self._queue else 0,
+            'written': self.written,
+            'batches': self.batches,
+            'failed': self.failed,
+        }
+
+
+response_writer = ResponseWriter(batch_size=RESPONSE_WRITE_BATCH, flush_interval=RESPONSE_WRITE_INTERVAL)
+
+
+async def save_response(response: str, user_id: str, chat_id: str):
+    """
+    Save response to ai.applications table.
+    Updates the latest record of the user if there is one. The write happens in the
+    background (see ResponseWriter), so this returns right away.
+    """
+    return response_writer.save(response, user_id, chat_id)
 
 
 async def get_applications(user_id: str):
     """
     Get the latest application for a specific user.
+    The query runs in a worker thread so it does not block the event loop.
     
     Args:
         user_id (str): Telegram user ID
@@ -115,6 +256,10 @@ async def get_applications(user_id: str):
     Returns:
         dict: Details of the latest application
     """
+    return await asyncio.to_thread(_get_applications_sync, user_id)
+
+
+def _get_applications_sync(user_id: str):
     try:
         # Create connection
         conn = psycopg2.connect(POSTGRES_CONNECTION)
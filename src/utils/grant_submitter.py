@@ -0,0 +1,173 @@
+# utils/grant_submitter.py
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+import aiohttp
+
+from utils.mongo_aio import Mongo
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_DELIVERING = 'delivering'
+STATUS_DELIVERED = 'delivered'
+STATUS_FAILED = 'failed'
+
+
+class GrantSubmitter:
+    def __init__(
+        self,
+        mongo: Mongo,
+        url: str,
+        collection: str = 'grant_submissions',
+        timeout: float = 30,
+        max_attempts: int = 5,
+        backoff: float = 2,
+        pool_size: int = 20,
+        shard: int = 0,
+    ):
+        """
+        Deliver grant applications to the funder service in the background.
+
+        Submissions are saved with their status before delivery starts, delivered over a
+        pooled aiohttp session with retries and exponential backoff, and resumed on restart.
+
+        Args:
+            mongo (Mongo): The shared Mongo wrapper.
+            url (str): The funder service submit endpoint.
+            collection (str): Collection storing submission status.
+            timeout (float): Timeout in seconds for each delivery attempt.
+            max_attempts (int): Delivery attempts before a submission is marked as failed.
+            backoff (float): Initial delay between attempts, doubled after each failure.
+            pool_size (int): Maximum number of pooled connections to the funder service.
+            shard (int): Worker process owning the submissions it creates and resumes.
+        """
+        self.mongo = mongo
+        self.url = url
+        self.collection = collection
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.shard = shard
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+            )
+        return self._session
+
+    async def start(self):
+        """
+        Resume deliveries interrupted by a restart.
+        """
+        await self.mongo.createIndex([('user_id', 1), ('created_at', -1)], self.collection)
+        pending = await self.mongo.search(
+            {'shard': self.shard, 'status': {'$in': [STATUS_QUEUED, STATUS_DELIVERING]}}, self.collection, limit=1000
+        ) or []
+        for submission in pending:
+            self._spawn(submission)
+        if pending:
+            logger.info(f"Resumed {len(pending)} grant submissions.")
+
+    async def close(self):
+        """
+        Stop in-flight deliveries (they resume on next start) and close the HTTP session.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    async def submit(self, user_id: str, chat_id: int, payload: dict) -> str:
+        """
+        Save a submission and deliver it in the background.
+
+        Args:
+            user_id (str): Telegram user ID.
+            chat_id (int): Chat the submission was requested from.
+            payload (dict): JSON body for the funder service.
+
+        Returns:
+            str: The submission id.
+        """
+        now = datetime.now(timezone.utc)
+        submission = {
+            '_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'payload': payload,
+            'shard': self.shard,
+            'status': STATUS_QUEUED,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+        }
+        await self.mongo.insert(submission, self.collection)
+        self._spawn(submission)
+        logger.info(f"Queued grant submission {submission['_id']} for user {user_id}")
+        return submission['_id']
+
+    async def latest(self, user_id: str) -> Optional[dict]:
+        """
+        Return the most recent submission of a user, or None.
+        """
+        res = await self.mongo.search({'user_id': user_id}, self.collection, limit=1, sort=[('created_at', -1)])
+        return res[0] if res else None
+
+    def _spawn(self, submission: dict):
+        task = asyncio.create_task(self._deliver(submission))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _set_status(self, submission_id: str, status: str, **fields):
+        fields.update({'status': status, 'updated_at': datetime.now(timezone.utc)})
+        await self.mongo.updateFields(submission_id, fields, self.collection)
+
+    async def _deliver(self, submission: dict):
+        submission_id = submission['_id']
+        attempts = submission.get('attempts', 0)
+        delay = self.backoff
+        while attempts < self.max_attempts:
+            attempts += 1
+            await self._set_status(submission_id, STATUS_DELIVERING, attempts=attempts)
+            try:
+                async with self._get_session().post(self.url, json=submission['payload']) as response:
+                    try:
+                        body = await response.json(content_type=None)
+                    except Exception:
+                        body = await response.text()
+                    if response.status < 300:
+                        await self._set_status(submission_id, STATUS_DELIVERED, response=body)
+                        logger.info(f"Grant submission {submission_id} delivered: {body}")
+                        return
+                    error = f"HTTP {response.status}: {body}"
+                    # Client errors other than rate limiting will not succeed on retry
+                    if 400 <= response.status < 500 and response.status != 429:
+                        await self._set_status(submission_id, STATUS_FAILED, last_error=error)
+                        logger.error(f"Grant submission {submission_id} rejected: {error}")
+                        return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+            logger.warning(f"Grant submission {submission_id} attempt {attempts} failed: {error}")
+            await self._set_status(submission_id, STATUS_DELIVERING, attempts=attempts, last_error=error)
+            if attempts < self.max_attempts:
+                await asyncio.sleep(delay)
+                delay *= 2  # Exponential backoff
+
+        await self._set_status(submission_id, STATUS_FAILED)
+        logger.error(f"Grant submission {submission_id} failed after {attempts} attempts.")
@@ -0,0 +1,77 @@
+# utils/health.py
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self, dependencies: Iterable[str]):
+        """
+        Track which dependencies have been warmed up.
+
+        Args:
+            dependencies (Iterable[str]): Names of the dependencies that must be warm for the service to be ready.
+        """
+        self.dependencies = list(dependencies)
+        self._state: Dict[str, dict] = {
+            name: {'ready': False, 'error': None, 'warmup_seconds': None} for name in self.dependencies
+        }
+        self._events: Dict[str, asyncio.Event] = {name: asyncio.Event() for name in self.dependencies}
+
+    def mark_ready(self, name: str, seconds: Optional[float] = None):
+        self._state[name].update({'ready': True, 'error': None, 'warmup_seconds': seconds})
+        self._events[name].set()
+
+    def mark_failed(self, name: str, error: Exception):
+        self._state[name].update({'ready': False, 'error': str(error)})
+
+    def is_ready(self, name: Optional[str] = None) -> bool:
+        if name is not None:
+            return self._state[name]['ready']
+        return all(state['ready'] for state in self._state.values())
+
+    async def wait_for(self, name: str, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds for a dependency to become ready.
+        """
+        try:
+            await asyncio.wait_for(self._events[name].wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.is_ready(name)
+
+    async def warm_up(self, name: str, func: Callable[[], Awaitable[None]], retry_delay: float = 1, max_delay: float = 30):
+        """
+        Run func until it succeeds, backing off between attempts, then mark the dependency ready.
+
+        Args:
+            name (str): The dependency name.
+            func (Callable): Coroutine function warming up the dependency.
+            retry_delay (float): Initial delay between attempts.
+            max_delay (float): Maximum delay between attempts.
+        """
+        delay = retry_delay
+        while True:
+            started = time.monotonic()
+            try:
+                await func()
+                seconds = time.monotonic() - started
+                self.mark_ready(name, seconds)
+                logger.info(f"Dependency '{name}' is ready after {seconds:.2f}s.")
+                return
+            except Exception as e:
+                self.mark_failed(name, e)
+                logger.warning(f"Warmup of '{name}' failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    def snapshot(self) -> dict:
+        return {
+            'ready': self.is_ready(),
+            'dependencies': {name: dict(state) for name, state in self._state.items()},
+        }
@@ -0,0 +1,91 @@
+# utils/keyed_executor.py
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Tuple
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class ShardQueueFull(Exception):
+    """Raised when a key already has the maximum number of tasks waiting."""
+
+
+class KeyedExecutor:
+    def __init__(self, max_concurrency: int = 32, max_queue_per_key: int = 20):
+        """
+        Run coroutines one at a time per key while different keys run in parallel.
+
+        Each key (e.g. a chat_id) gets its own FIFO shard drained by a single task, so
+        tasks for the same key never overlap. A global semaphore caps how many tasks
+        run at once across all shards.
+
+        Args:
+            max_concurrency (int): Maximum number of tasks running at once across all keys.
+            max_queue_per_key (int): Maximum number of tasks waiting per key.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_key = max_queue_per_key
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues: Dict[Hashable, Deque[Tuple[Callable, tuple, asyncio.Future]]] = {}
+        self._drainers: Dict[Hashable, asyncio.Task] = {}
+        self.running = 0
+
+    def submit(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> asyncio.Future:
+        """
+        Queue func(*args) behind any earlier tasks for the same key.
+
+        Args:
+            key (Hashable): The shard key.
+            func (Callable): Coroutine function to run.
+
+        Returns:
+            asyncio.Future: Resolves with the result (or exception) of the task.
+
+        Raises:
+            ShardQueueFull: If the key already has max_queue_per_key tasks waiting.
+        """
+        queue = self._queues.setdefault(key, deque())
+        if len(queue) >= self.max_queue_per_key:
+            raise ShardQueueFull(f"Queue for {key} is full ({len(queue)} waiting).")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append((func, args, future))
+        if key not in self._drainers:
+            self._drainers[key] = asyncio.create_task(self._drain(key))
+        return future
+
+    async def _drain(self, key: Hashable):
+        queue = self._queues[key]
+        try:
+            while queue:
+                func, args, future = queue.popleft()
+                if future.cancelled():
+                    continue
+                async with self._semaphore:
+                    self.running += 1
+                    try:
+                        result = await func(*args)
+                        if not future.cancelled():
+                            future.set_result(result)
+                    except Exception as e:
+                        if not future.cancelled():
+                            future.set_exception(e)
+                    finally:
+                        self.running -= 1
+        finally:
+            del self._queues[key]
+            del self._drainers[key]
+
+    def queue_depth(self, key: Hashable) -> int:
+        return len(self._queues.get(key, ()))
+
+    def stats(self) -> dict:
+        return {
+            'shards': len(self._drainers),
+            'running': self.running,
+            'queued': sum(len(q) for q in self._queues.values()),
+            'max_concurrency': self.max_concurrency,
+        }
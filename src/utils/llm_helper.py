@@ -2,22 +2,28 @@
 
 import logging
 
-from phi.model.openai import OpenAIChat
-from phi.model.google import Gemini
-from phi.embedder.openai import OpenAIEmbedder
-
-from utils.gemini_embedder import GeminiEmbedder
-from config import OPENAI_API_KEY, OPENAI_MODEL, GOOGLE_API_KEY, LLM_PROVIDER
+# Provider SDKs are imported inside the functions below: each one takes close to a
+# second to import, and only the configured provider is ever needed.
+from config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_STRONG_MODEL, GOOGLE_API_KEY, GEMINI_MODEL, GEMINI_STRONG_MODEL, LLM_PROVIDER,
+    EMBEDDING_CACHE_SIZE,
+)
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
-def get_llm_model():
+TIER_FAST = "fast"
+TIER_STRONG = "strong"
+
+def get_llm_model(tier: str = TIER_FAST):
     """
     Returns the appropriate LLM model based on the LLM_PROVIDER configuration.
 
     Defaults to OpenAI if LLM_PROVIDER is not set or unsupported.
 
+    Args:
+        tier (str): TIER_FAST for the cheap, low latency model or TIER_STRONG for the most capable one.
+
     Returns:
         An instance of OpenAIChat or Gemini.
 
@@ -28,42 +34,68 @@ def get_llm_model():
 
     logger.debug(f"Selecting LLM model based on provider: {provider}")
 
+    if provider == "gemini":
+        from phi.model.google import Gemini
+    else:
+        from phi.model.openai import OpenAIChat
+
+    openai_model = OPENAI_STRONG_MODEL if tier == TIER_STRONG else OPENAI_MODEL
+
     if provider == "openai":
         if not OPENAI_API_KEY:
             logger.error("OPENAI_API_KEY is missing.")
             raise ValueError("OPENAI_API_KEY is not set in config.py or environment variables.")
-        logger.info("Using OpenAI LLM model.")
-        return OpenAIChat(id=OPENAI_MODEL, api_key=OPENAI_API_KEY)
+        logger.info(f"Using OpenAI LLM model {openai_model} ({tier} tier).")
+        return OpenAIChat(id=openai_model, api_key=OPENAI_API_KEY)
 
     elif provider == "gemini":
         if not GOOGLE_API_KEY:
             logger.error("GOOGLE_API_KEY is missing.")
             raise ValueError("GOOGLE_API_KEY is not set in config.py or environment variables.")
-        logger.info("Using Gemini LLM model.")
-        return Gemini(id="gemini-2.0-flash-exp", api_key=GOOGLE_API_KEY)
+        gemini_model = GEMINI_STRONG_MODEL if tier == TIER_STRONG else GEMINI_MODEL
+        logger.info(f"Using Gemini LLM model {gemini_model} ({tier} tier).")
+        return Gemini(id=gemini_model, api_key=GOOGLE_API_KEY)
 
     else:
         logger.warning(f"Unsupported LLM_PROVIDER '{LLM_PROVIDER}'. Defaulting to OpenAI.")
         if not OPENAI_API_KEY:
             logger.error("OPENAI_API_KEY is missing.")
             raise ValueError("OPENAI_API_KEY is not set in config.py or environment variables.")
-        return OpenAIChat(id=OPENAI_MODEL, api_key=OPENAI_API_KEY)
+        return OpenAIChat(id=openai_model, api_key=OPENAI_API_KEY)
 
 
-def get_embedder():
+def get_embedder(cached: bool = True):
     """
-    Returns the appropriate embedder based on the LLM_PROVIDER configuration.
+    Returns the appropriate embedder based on the LLM_PROVIDER configuration, behind the
+    shared embedding cache unless EMBEDDING_CACHE_SIZE is 0.
+
+    Args:
+        cached (bool): Put the embedder behind the cache. Use False for texts that are embedded
+            once, like document chunks, so they do not evict the queries.
     """
+    embedder = _provider_embedder()
+    if not cached or EMBEDDING_CACHE_SIZE <= 0:
+        return embedder
+    from utils.embedding_cache import CachedEmbedder
+    return CachedEmbedder(embedder)
+
+
+def _provider_embedder():
     provider = LLM_PROVIDER.lower() if LLM_PROVIDER else "openai"
 
     logger.debug(f"Selecting embedder based on provider: {provider}")
 
+    if provider == "gemini":
+        from utils.gemini_embedder import GeminiEmbedder
+    else:
+        from phi.embedder.openai import OpenAIEmbedder
+
     if provider == "openai":
         if not OPENAI_API_KEY:
             logger.error("OPENAI_API_KEY is missing.")
             raise ValueError("OPENAI_API_KEY is not set in config.py or environment variables.")
         logger.info("Using OpenAI Embedder.")
-        return OpenAIEmbedder(
+        embedder = OpenAIEmbedder(
             api_key=OPENAI_API_KEY,
             model="text-embedding-3-small",  # Add model specification
             dimensions=1536  # Explicitly set dimensions
@@ -85,8 +117,12 @@ def get_embedder():
         if not OPENAI_API_KEY:
             logger.error("OPENAI_API_KEY is missing.")
             raise ValueError("OPENAI_API_KEY is not set in config.py or environment variables.")
-        return OpenAIEmbedder(
+        embedder = OpenAIEmbedder(
             api_key=OPENAI_API_KEY,
             model="text-embedding-3-small",
             dimensions=1536
         )
+
+    # OpenAIEmbedder builds a new client, and a new connection pool, on every request unless one is set
+    embedder.openai_client = embedder.client
+    return embedder
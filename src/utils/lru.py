@@ -0,0 +1,49 @@
+# utils/lru.py
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 1024):
+        """
+        Minimal in-memory least-recently-used cache.
+
+        Args:
+            max_size (int): Maximum number of entries kept before the oldest are evicted.
+        """
+        self.max_size = max_size
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Return the cached value for key and mark it as recently used.
+        """
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key: Hashable, value: Any = True) -> None:
+        """
+        Store a value, evicting the least recently used entries when full.
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        return self._items.pop(key, default)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self._items:
+            self._items.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._items)
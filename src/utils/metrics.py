@@ -0,0 +1,22 @@
+# utils/metrics.py
+
+import math
+from typing import Iterable, Optional
+
+
+def percentile(values: Iterable[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of a set of samples.
+
+    Args:
+        values (Iterable[float]): The samples.
+        q (float): Percentile between 0 and 100.
+
+    Returns:
+        Optional[float]: The percentile, or None when there are no samples.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
@@ -4,7 +4,7 @@
 import logging
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ReplaceOne
+from pymongo import ReplaceOne, ReturnDocument
 
 from config import MONGO_SERVER, MONGO_PORT, MONGO_DB, MONGO_CONNECTION
 
@@ -92,7 +92,7 @@ class Mongo():
         try:
             c = self.mongo[collection]
             query = {"$set": fields}
-            await c.update_one({'_id': id}, query, upsert=True)
+            return await c.update_one({'_id': id}, query, upsert=True)
         except:
             logger.error(f'MONGO: failed on updateFields for {id}')
 
@@ -162,6 +162,25 @@ class Mongo():
         else:
             return await self.insert(item, collection)
 
+    async def findOneAndUpdate(self, query, update, collection, sort=None):
+        try:
+            c = self.mongo[collection]
+            res = await c.find_one_and_update(query, update, sort=sort, return_document=ReturnDocument.AFTER)
+            return res
+        except Exception as e:
+            logger.error(f'MONGO: {e} failed on findOneAndUpdate for {query}')
+
+    async def createIndex(self, keys, collection, **kwargs):
+        try:
+            c = self.mongo[collection]
+            return await c.create_index(keys, **kwargs)
+        except Exception as e:
+            logger.error(f'MONGO: {e} failed on createIndex for {keys}')
+
+    async def ping(self):
+        # Raises on failure so callers can tell whether Mongo is reachable
+        return await self.client.admin.command('ping')
+
     async def getCollections(self):
         out = await self.mongo.list_collection_names()
         return out
@@ -0,0 +1,192 @@
+# utils/pg_pool.py
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config import (
+    POSTGRES_CONNECTION, RETRIEVAL_POOL_SIZE, RETRIEVAL_POOL_OVERFLOW, RETRIEVAL_POOL_TIMEOUT,
+    RETRIEVAL_QUERY_TIMEOUT, RETRIEVAL_PREPARE, VECTOR_EF_SEARCH, VECTOR_PROBES, VECTOR_ITERATIVE_SCAN,
+)
+from utils.metrics import percentile
+from utils.tracing import span
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+def set_config_statement(settings: Dict[str, Any]):
+    """
+    One statement applying server settings to the current transaction only, as (statement, params).
+    """
+    columns = ", ".join(f"set_config(:name_{i}, :value_{i}, true)" for i in range(len(settings)))
+    params = {}
+    for i, (name, value) in enumerate(settings.items()):
+        params[f"name_{i}"] = name
+        params[f"value_{i}"] = str(value)
+    return text(f"SELECT {columns}"), params
+
+
+class AsyncPgPool:
+    def __init__(
+        self,
+        db_url: str,
+        size: int = 10,
+        max_overflow: int = 5,
+        pool_timeout: float = 5,
+        query_timeout: float = 5,
+        prepare: bool = True,
+        settings: Optional[Dict[str, Any]] = None,
+        window: int = 1000,
+    ):
+        """
+        Shared pool of async psycopg 3 connections for read queries on the event loop.
+
+        Statements are prepared server side on first use of each connection, so repeated
+        queries skip parsing and planning. Waiting for a connection is bounded by pool_timeout;
+        each query is bounded by query_timeout, both on the server (statement_timeout) and on
+        the client.
+
+        Args:
+            db_url (str): SQLAlchemy database URL; the driver is switched to async psycopg.
+            size (int): Connections kept open.
+            max_overflow (int): Extra connections opened under load.
+            pool_timeout (float): Seconds to wait for a free connection.
+            query_timeout (float): Default seconds a query may run.
+            prepare (bool): Use prepared statements. Disable behind a transaction-mode pgbouncer.
+            settings (Optional[Dict[str, Any]]): Server settings of every connection, e.g. {'hnsw.ef_search': 40}.
+            window (int): Samples kept for the latency percentiles.
+        """
+        self.db_url = make_url(db_url).set(drivername="postgresql+psycopg")
+        self.size = size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.query_timeout = query_timeout
+        self.prepare = prepare
+        self.settings = settings or {}
+        self._engine: Optional[AsyncEngine] = None
+
+        self.queries = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.wait_ms = deque(maxlen=window)
+        self.query_ms = deque(maxlen=window)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            # statement_timeout is the server side backstop for queries the client stopped waiting for
+            settings = {'statement_timeout': int(self.query_timeout * 1000), **self.settings}
+            connect_args = {
+                'options': " ".join(f"-c {name}={value}" for name, value in settings.items()),
+                # 0 prepares every statement the first time a connection runs it; None disables preparing
+                'prepare_threshold': 0 if self.prepare else None,
+                'connect_timeout': max(1, int(self.pool_timeout)),
+            }
+            self._engine = create_async_engine(
+                self.db_url,
+                pool_size=self.size,
+                max_overflow=self.max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_pre_ping=True,
+                connect_args=connect_args,
+            )
+        return self._engine
+
+    async def fetch(self, sql: str, params: Dict[str, Any], timeout: Optional[float] = None,
+                    settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Run a read query and return its rows.
+
+        Args:
+            sql (str): The query, with :name parameters.
+            params (Dict[str, Any]): Query parameters.
+            timeout (Optional[float]): Seconds the query may run, defaults to query_timeout.
+            settings (Optional[Dict[str, Any]]): Server settings for this query only, on top of the
+                connection settings. Costs one extra round trip.
+
+        Returns:
+            List[Dict[str, Any]]: The rows.
+
+        Raises:
+            asyncio.TimeoutError: If no connection was free in time or the query ran too long.
+        """
+        timeout = timeout or self.query_timeout
+        self.queries += 1
+        started = time.monotonic()
+        try:
+            with span('retrieval.pool_wait'):
+                conn = await self.engine.connect()
+        except exc.TimeoutError as e:
+            self.timeouts += 1
+            self.failed += 1
+            raise asyncio.TimeoutError(f"No database connection free within {self.pool_timeout}s") from e
+        except Exception:
+            self.failed += 1
+            raise
+        try:
+            acquired = time.monotonic()
+            self.wait_ms.append((acquired - started) * 1000)
+            with span('retrieval.sql'):
+                rows = await asyncio.wait_for(self._execute(conn, sql, params, settings), timeout=timeout)
+            self.query_ms.append((time.monotonic() - acquired) * 1000)
+            return rows
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failed += 1
+            logger.error(f"Query timed out after {timeout}s.")
+            # The connection may still be busy with the cancelled query; don't hand it out again
+            await conn.invalidate()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            await conn.close()
+
+    @staticmethod
+    async def _execute(conn, sql: str, params: Dict[str, Any], settings: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if settings:
+            await conn.execute(*set_config_statement(settings))
+        result = await conn.execute(text(sql), params)
+        return [dict(row) for row in result.mappings().all()]
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+
+    def stats(self) -> dict:
+        pool = self._engine.pool if self._engine is not None else None
+        return {
+            'size': self.size,
+            'checked_out': pool.checkedout() if pool is not None else 0,
+            'queries': self.queries,
+            'timeouts': self.timeouts,
+            'failed': self.failed,
+            'pool_wait_ms': {'p50': percentile(self.wait_ms, 50), 'p95': percentile(self.wait_ms, 95),
+                             'max': max(self.wait_ms, default=None)},
+            'query_ms': {'p50': percentile(self.query_ms, 50), 'p95': percentile(self.query_ms, 95),
+                         'max': max(self.query_ms, default=None)},
+        }
+
+
+# Shared by knowledge retrieval in this process
+retrieval_pool = AsyncPgPool(
+    POSTGRES_CONNECTION,
+    size=RETRIEVAL_POOL_SIZE,
+    max_overflow=RETRIEVAL_POOL_OVERFLOW,
+    pool_timeout=RETRIEVAL_POOL_TIMEOUT,
+    query_timeout=RETRIEVAL_QUERY_TIMEOUT,
+    prepare=RETRIEVAL_PREPARE,
+    settings={
+        'hnsw.ef_search': VECTOR_EF_SEARCH, 'ivfflat.probes': VECTOR_PROBES,
+        # Searches are filtered by scope: keep scanning the index until LIMIT rows pass the filter
+        **({'hnsw.iterative_scan': VECTOR_ITERATIVE_SCAN} if VECTOR_ITERATIVE_SCAN else {}),
+    },
+)
@@ -0,0 +1,246 @@
+# utils/response_cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from config import (
+    POSTGRES_CONNECTION, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_TTL_HOURS, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MIN_WORDS,
+    VECTOR_ITERATIVE_SCAN, VECTOR_FILTERED_EF_SEARCH,
+)
+from utils.pg_pool import set_config_statement
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+EVICT_EVERY = 100  # stores between two eviction passes
+# The scope filter is applied after the HNSW scan: scan on until a row passes it (pgvector >= 0.8),
+# or search a larger candidate list
+LOOKUP_SETTINGS = (
+    {'hnsw.iterative_scan': VECTOR_ITERATIVE_SCAN} if VECTOR_ITERATIVE_SCAN
+    else {'hnsw.ef_search': VECTOR_FILTERED_EF_SEARCH}
+)
+
+
+def context_digest(recent_responses: List[str]) -> str:
+    """
+    Digest of the conversation a question is asked in, part of the cache key.
+    """
+    return hashlib.md5(json.dumps(recent_responses).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        db_url: str,
+        enabled: bool = True,
+        threshold: float = 0.95,
+        ttl_hours: int = 24,
+        max_entries: int = 10000,
+        min_words: int = 4,
+    ):
+        """
+        Semantic cache of agent answers in Postgres, shared by every worker.
+
+        An answer is reused for a new question whose embedding has at least `threshold`
+        cosine similarity with a cached question of the same knowledge scope and scope
+        version, asked after the same recent answers (context_digest). Only self-contained
+        questions are cached (see cacheable). Adding documents to a scope bumps its version, so answers based on the
+        old knowledge are no longer served. Entries expire after ttl_hours and the least
+        recently used ones are evicted beyond max_entries.
+
+        Args:
+            db_url (str): SQLAlchemy database URL.
+            enabled (bool): When False every method is a no-op.
+            threshold (float): Minimum cosine similarity for a hit.
+            ttl_hours (int): Hours an answer stays valid.
+            max_entries (int): Maximum number of cached answers.
+            min_words (int): Minimum words of a cacheable question.
+        """
+        self.db_url = db_url
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self.min_words = min_words
+        self._engine: Optional[Engine] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+        self.saved_input_tokens = 0
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = create_engine(self.db_url, pool_pre_ping=True)
+        return self._engine
+
+    def cacheable(self, message: str, query: str) -> bool:
+        """
+        Whether a turn stands on its own. System notices (which differ only by URL or file
+        name), replies and short follow-ups ("yes", "make it shorter") depend on the
+        conversation and are never looked up or stored.
+
+        Args:
+            message (str): The message as built by the router.
+            query (str): The user's text, without the '@username: ' prefix.
+        """
+        if message.startswith("SYSTEM:") or " REPLYING TO: " in message:
+            return False
+        return len(query.split()) >= self.min_words
+
+    async def lookup(self, scope: str, embedding: List[float], context: str = '') -> Optional[dict]:
+        """
+        Return the cached answer closest to the question, if it is similar enough.
+
+        Args:
+            scope (str): Knowledge scope the question is answered from.
+            embedding (List[float]): Embedding of the question.
+            context (str): context_digest of the conversation.
+
+        Returns:
+            Optional[dict]: The entry with 'response' and 'similarity', or None.
+        """
+        if not self.enabled:
+            return None
+        try:
+            entry = await asyncio.to_thread(self._lookup_sync, scope, embedding, context)
+        except Exception as e:
+            logger.error(f"Response cache lookup failed: {e}")
+            return None
+
+        if entry is None or entry['similarity'] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_seconds += entry['latency_ms'] / 1000
+        self.saved_input_tokens += entry['input_tokens']
+        logger.info(f"Response cache hit (similarity {entry['similarity']:.3f}) for scope {scope}.")
+        return entry
+
+    def _lookup_sync(self, scope: str, embedding: List[float], context: str) -> Optional[dict]:
+        with self.engine.begin() as conn:
+            conn.execute(*set_config_statement(LOOKUP_SETTINGS))
+            row = conn.execute(text("""
+                SELECT id, response, input_tokens, latency_ms,
+                       1 - (embedding <=> CAST(:embedding AS vector)) AS similarity
+                FROM ai.response_cache
+                WHERE scope = :scope
+                  AND context_hash = :context
+                  AND scope_version = COALESCE((SELECT version FROM ai.knowledge_scope_versions WHERE scope = :scope), 0)
+                  AND expires_at > NOW()
+                ORDER BY embedding <=> CAST(:embedding AS vector)
+                LIMIT 1
+            """), {'scope': scope, 'context': context, 'embedding': json.dumps(embedding)}).mappings().first()
+            if row is None:
+                return None
+            entry = dict(row)
+            if entry['similarity'] >= self.threshold:
+                conn.execute(text(
+                    "UPDATE ai.response_cache SET hits = hits + 1, last_used_at = NOW() WHERE id = :id"
+                ), {'id': entry['id']})
+            return entry
+
+    async def store(self, scope: str, query: str, embedding: List[float], response: str,
+                    input_tokens: int = 0, latency: float = 0.0, context: str = ''):
+        """
+        Cache an answer.
+
+        Args:
+            scope (str): Knowledge scope the answer was generated from.
+            query (str): The question.
+            embedding (List[float]): Embedding of the question.
+            response (str): The answer.
+            input_tokens (int): Input tokens the answer cost, reported as saved on hits.
+            latency (float): Seconds the answer took, reported as saved on hits.
+            context (str): context_digest of the conversation.
+        """
+        if not self.enabled or not response:
+            return
+        try:
+            self.stores += 1
+            evict = self.stores % EVICT_EVERY == 0
+            await asyncio.to_thread(
+                self._store_sync, scope, query, embedding, response, input_tokens, latency, evict, context
+            )
+        except Exception as e:
+            logger.error(f"Response cache store failed: {e}")
+
+    def _store_sync(self, scope, query, embedding, response, input_tokens, latency, evict, context):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO ai.response_cache (
+                    id, scope, scope_version, context_hash, query, response, embedding, input_tokens, latency_ms, expires_at
+                ) VALUES (
+                    :id, :scope,
+                    COALESCE((SELECT version FROM ai.knowledge_scope_versions WHERE scope = :scope), 0), :context,
+                    :query, :response, CAST(:embedding AS vector), :input_tokens, :latency_ms, :expires_at
+                )
+            """), {
+                'id': uuid.uuid4().hex,
+                'scope': scope,
+                'context': context,
+                'query': query,
+                'response': response,
+                'embedding': json.dumps(embedding),
+                'input_tokens': input_tokens,
+                'latency_ms': int(latency * 1000),
+                'expires_at': datetime.now(timezone.utc).replace(tzinfo=None) + self.ttl,
+            })
+            if evict:
+                result = conn.execute(text("""
+                    DELETE FROM ai.response_cache
+                    WHERE expires_at <= NOW()
+                       OR id IN (SELECT id FROM ai.response_cache ORDER BY last_used_at DESC OFFSET :max_entries)
+                """), {'max_entries': self.max_entries})
+                logger.info(f"Response cache evicted {result.rowcount} entries.")
+
+    async def invalidate(self, scope: str):
+        """
+        Retire every cached answer of a scope by bumping its version.
+        """
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._invalidate_sync, scope)
+        except Exception as e:
+            logger.error(f"Response cache invalidation failed for scope {scope}: {e}")
+
+    def _invalidate_sync(self, scope: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO ai.knowledge_scope_versions (scope, version) VALUES (:scope, 1)
+                ON CONFLICT (scope) DO UPDATE
+                SET version = ai.knowledge_scope_versions.version + 1, updated_at = NOW()
+            """), {'scope': scope})
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'saved_input_tokens': self.saved_input_tokens,
+        }
+
+
+response_cache = ResponseCache(
+    POSTGRES_CONNECTION,
+    enabled=RESPONSE_CACHE_ENABLED,
+    threshold=RESPONSE_CACHE_THRESHOLD,
+    ttl_hours=RESPONSE_CACHE_TTL_HOURS,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    min_words=RESPONSE_CACHE_MIN_WORDS,
+)
@@ -0,0 +1,216 @@
+# utils/send_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram.error import RetryAfter
+
+from utils.lru import LRUCache
+from utils.metrics import percentile
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+LANES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Classic token bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum number of tokens (burst size).
+            clock (Callable): Monotonic clock, injectable for tests.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        """
+        Take one token if available.
+        """
+        if self.clock() < self.paused_until:
+            return False
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self) -> float:
+        """
+        Seconds until try_take can succeed.
+        """
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        return max(wait, self.paused_until - self.clock())
+
+    def pause(self, seconds: float):
+        """
+        Hand out no tokens for the given number of seconds (e.g. after a 429 retry_after).
+        """
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+
+class SendScheduler:
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        max_retries: int = 3,
+    ):
+        """
+        Pace outbound Telegram calls to the Bot API limits.
+
+        Each chat has its own token bucket (about 1 message per second, 20 per minute in
+        groups) and all chats share a global bucket (about 30 per second). Callers waiting
+        on the global bucket are served by priority, so interactive replies overtake bulk
+        notices. A 429 pauses the chat for the retry_after Telegram asks for, then the call
+        is retried.
+
+        Args:
+            global_rate (float): Messages per second across all chats.
+            chat_rate (float): Messages per second per private chat.
+            chat_burst (float): Burst size per chat.
+            group_rate (float): Messages per second per group chat.
+            max_retries (int): Retries after a 429 before giving up.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+
+        self._chat_buckets = LRUCache(max_size=10000)
+        self._chat_locks: Dict[Any, asyncio.Lock] = {}
+        self._chat_senders: Dict[Any, int] = {}  # calls holding or waiting for each chat lock
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._pump_handle: Optional[asyncio.Handle] = None
+
+        self.wait_times = {lane: deque(maxlen=1000) for lane in LANES.values()}
+        self.sent = 0
+        self.rate_limited = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups and channels, which Telegram limits per minute
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+            self._chat_buckets.put(chat_id, bucket)
+        return bucket
+
+    async def send(self, chat_id, func: Callable[[], Awaitable[Any]], priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """
+        Run a Bot API call for chat_id once both the chat and the global bucket allow it.
+        Calls for the same chat run in submission order.
+
+        Args:
+            chat_id: The chat the call targets.
+            func (Callable): Coroutine function performing the call.
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BULK.
+
+        Returns:
+            Any: The result of func.
+        """
+        enqueued = time.monotonic()
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_senders[chat_id] = self._chat_senders.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                for attempt in range(self.max_retries + 1):
+                    bucket = self._chat_bucket(chat_id)
+                    while not bucket.try_take():
+                        await asyncio.sleep(bucket.time_until_token())
+                    await self._acquire_global(priority)
+                    if attempt == 0:
+                        self.wait_times[LANES.get(priority, 'bulk')].append(time.monotonic() - enqueued)
+
+                    try:
+                        result = await func()
+                        self.sent += 1
+                        return result
+                    except RetryAfter as e:
+                        self.rate_limited += 1
+                        retry_after = e.retry_after
+                        seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                        logger.warning(f"Rate limited by Telegram for chat {chat_id}, retrying in {seconds}s.")
+                        bucket.pause(seconds)
+                        if attempt == self.max_retries:
+                            raise
+        finally:
+            self._chat_senders[chat_id] -= 1
+            if not self._chat_senders[chat_id]:
+                # Last call for this chat: drop its lock so idle chats do not accumulate
+                del self._chat_senders[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def _acquire_global(self, priority: int):
+        if not self._waiters and self.global_bucket.try_take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule_pump(0)
+        await future
+
+    def _schedule_pump(self, delay: float):
+        if self._pump_handle is None:
+            self._pump_handle = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def _pump(self):
+        """
+        Hand out global tokens to waiters, highest priority first.
+        """
+        self._pump_handle = None
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self.global_bucket.try_take():
+                self._schedule_pump(self.global_bucket.time_until_token())
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'rate_limited': self.rate_limited,
+            'waiting': len(self._waiters),
+            'queue_wait': {
+                lane: {
+                    'count': len(waits),
+                    'p50': percentile(waits, 50),
+                    'p95': percentile(waits, 95),
+                    'max': max(waits) if waits else None,
+                }
+                for lane, waits in self.wait_times.items()
+            },
+        }
@@ -0,0 +1,21 @@
+# utils/sharding.py
+
+import zlib
+from typing import Hashable
+
+
+def shard_for(key: Hashable, shards: int) -> int:
+    """
+    Map a key (e.g. a chat_id) to a shard index that is stable across processes and restarts.
+    Python's built-in hash() is salted per process, so crc32 is used instead.
+
+    Args:
+        key (Hashable): The key to route.
+        shards (int): Number of shards.
+
+    Returns:
+        int: Shard index in [0, shards).
+    """
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(key).encode('utf-8')) % shards
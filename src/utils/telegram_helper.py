@@ -3,28 +3,104 @@
 import os
 import re
 import logging
-from typing import Optional
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
 import asyncio
 
 from telegram import Update, Bot, MessageEntity
-from telegram.error import TimedOut
-from telegram.constants import ParseMode
+from telegram.error import BadRequest, TimedOut
+from telegram.constants import MessageLimit, ParseMode
 from chatgpt_md_converter import telegram_format
 
 from utils.url_helper import is_valid_url, extract_valid_urls
+from utils.send_scheduler import SendScheduler, PRIORITY_INTERACTIVE
+from utils.tracing import span
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
+MESSAGE_UPDATE_KEYS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'business_message')
+CHAT_UPDATE_KEYS = ('my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def get_update_chat_id(update_data: dict) -> Optional[int]:
+    """
+    Read the chat id straight from a raw update without deserializing it.
+
+    Args:
+        update_data (dict): The update data received from Telegram.
+
+    Returns:
+        Optional[int]: The chat id, or None if the update is not tied to a chat.
+    """
+    for key in MESSAGE_UPDATE_KEYS:
+        if isinstance(update_data.get(key), dict):
+            return update_data[key].get('chat', {}).get('id')
+    callback_query = update_data.get('callback_query')
+    if isinstance(callback_query, dict) and isinstance(callback_query.get('message'), dict):
+        return callback_query['message'].get('chat', {}).get('id')
+    for key in CHAT_UPDATE_KEYS:
+        if isinstance(update_data.get(key), dict):
+            return update_data[key].get('chat', {}).get('id')
+    return None
+
+
+def split_message(text: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> List[str]:
+    """
+    Split text into chunks Telegram accepts, preferring to break at a newline.
+    A chunk boundary only depends on the text before it, so it stays put while a
+    streamed text keeps growing.
+
+    Args:
+        text (str): The text to split.
+        limit (int): Maximum length of a chunk.
+
+    Returns:
+        List[str]: The chunks, at least one.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    parts.append(text)
+    return parts
+
+
+class LazyFile(dict):
+    """
+    File metadata extracted from a message. Behaves like the plain dict process_update
+    used to return, but 'file_url' is only fetched from the Bot API (get_file) when
+    get_url() is called.
+    """
+
+    def __init__(self, bot: Bot, **fields):
+        super().__init__(fields, file_url=None)
+        self._bot = bot
+
+    async def get_url(self) -> str:
+        """
+        Resolve and cache the download URL of the file.
+        """
+        if self['file_url'] is None:
+            with span('get_file'):
+                file = await self._bot.get_file(self['file_id'])
+            self['file_url'] = file.file_path
+        return self['file_url']
+
+
 class TelegramHelper:
-    def __init__(self, bot: Bot, download_dir: str = "./files", rate_limit: int = 20):
+    def __init__(self, bot: Bot, download_dir: str = "./files", global_rate: float = 30, chat_rate: float = 1):
         """
         Initialize TelegramHelper with an existing Bot instance.
 
         Args:
             bot (Bot): An instance of telegram.Bot configured with desired settings.
             download_dir (str): Directory to download files. Defaults to "./files".
-            rate_limit (int): Maximum number of concurrent send_message operations.
+            global_rate (float): Maximum messages per second across all chats.
+            chat_rate (float): Maximum messages per second per chat.
         """
         self.bot = bot
         self.DOWNLOAD_DIR = download_dir
@@ -32,48 +108,91 @@ class TelegramHelper:
             os.makedirs(self.DOWNLOAD_DIR)
             logger.info(f"Created download directory: {self.DOWNLOAD_DIR}")
         
-        # Initialize semaphore for rate limiting
-        self.rate_limiter = asyncio.Semaphore(rate_limit)
-        logger.info(f"Rate limiter initialized with {rate_limit} limit.")
+        # Paces all outbound sends to Telegram's per-chat and global limits
+        self.scheduler = SendScheduler(global_rate=global_rate, chat_rate=chat_rate)
+        logger.info(f"Send scheduler initialized with {global_rate}/s global and {chat_rate}/s per chat.")
+
+        # MIME type -> coroutine function handling files of that type
+        self.file_handlers: Dict[str, Callable[[LazyFile], Awaitable[None]]] = {}
+
+    def register_file_handler(self, mime_types: Iterable[str], handler: Callable[[LazyFile], Awaitable[None]]):
+        """
+        Register a handler for files of the given MIME types.
 
-    async def send_message(self, chat_id: int, text: str, reply_markup) -> None:
+        Args:
+            mime_types (Iterable[str]): MIME types the handler accepts.
+            handler (Callable): Coroutine function receiving the file with its URL resolved.
+        """
+        for mime_type in mime_types:
+            self.file_handlers[mime_type] = handler
+
+    def accepts(self, mime_type: Optional[str]) -> bool:
+        return mime_type in self.file_handlers
+
+    async def dispatch_file(self, file_info: LazyFile) -> bool:
+        """
+        Resolve the file URL and run the registered handler, if one accepts the MIME type.
+
+        Args:
+            file_info (LazyFile): The file returned by process_update.
+
+        Returns:
+            bool: True if a handler processed the file.
+        """
+        handler = self.file_handlers.get(file_info.get('mime_type'))
+        if handler is None:
+            return False
+        await file_info.get_url()
+        await handler(file_info)
+        return True
+
+    async def send_message(self, chat_id: int, text: str, reply_markup, priority: int = PRIORITY_INTERACTIVE) -> None:
         """
         Send a message using the external telegram_format converter with rate limiting.
 
         Args:
             chat_id (int): The chat ID to send the message to.
             text (str): The message text.
+            priority (int): Scheduler lane, PRIORITY_INTERACTIVE or PRIORITY_BULK.
         """
         formatted_text = telegram_format(text)
-        async with self.rate_limiter:
-            try:
-                await self.bot.send_message(
-                    chat_id=chat_id,
-                    text=formatted_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup
+        try:
+            with span('telegram.send', priority=priority):
+                await self.scheduler.send(
+                    chat_id,
+                    lambda: self.bot.send_message(
+                        chat_id=chat_id,
+                        text=formatted_text,
+                        parse_mode=ParseMode.HTML,
+                        reply_markup=reply_markup
+                    ),
+                    priority=priority,
                 )
-                logger.debug(f"Message sent to chat {chat_id}.")
-            except Exception as e:
-                logger.error(f"Failed to send message to chat {chat_id}: {e}")
-                raise
+            logger.debug(f"Message sent to chat {chat_id}.")
+        except Exception as e:
+            logger.error(f"Failed to send message to chat {chat_id}: {e}")
+            raise
 
-    async def send_message_with_timeout(self, chat_id: int, text: str, timeout: int = 30):
+    async def send_message_with_timeout(self, chat_id: int, text: str, timeout: int = 30, priority: int = PRIORITY_INTERACTIVE):
         """
         Send a message with a timeout, retrying in case of a timeout error.
 
         Args:
             chat_id (int): The chat ID to send the message to.
             text (str): The message text.
-            timeout (int): Timeout in seconds.
+            timeout (int): Timeout in seconds, including time spent waiting in the send scheduler.
+            priority (int): Scheduler lane, PRIORITY_INTERACTIVE or PRIORITY_BULK.
         """
         formatted_text = telegram_format(text)
         try:
-            async with self.rate_limiter:
-                await asyncio.wait_for(
-                    self.bot.send_message(chat_id=chat_id, text=formatted_text, parse_mode=ParseMode.HTML),
-                    timeout=timeout
-                )
+            await asyncio.wait_for(
+                self.scheduler.send(
+                    chat_id,
+                    lambda: self.bot.send_message(chat_id=chat_id, text=formatted_text, parse_mode=ParseMode.HTML),
+                    priority=priority,
+                ),
+                timeout=timeout
+            )
             logger.info(f"Message sent to chat {chat_id} within timeout.")
         except asyncio.TimeoutError:
             logger.warning(f"Message to {chat_id} timed out.")
@@ -81,18 +200,21 @@ class TelegramHelper:
             logger.error(f"Failed to send message to chat {chat_id}: {e}")
             raise
 
-    async def send_message_with_retry(self, chat_id: int, text: str, retries: int = 3, reply_markup=None):
+    async def send_message_with_retry(self, chat_id: int, text: str, retries: int = 3, reply_markup=None,
+                                      priority: int = PRIORITY_INTERACTIVE):
         """
-        Attempt to send a message with retries in case of failure.
+        Attempt to send a message with retries in case of failure. Rate limit (429) responses
+        are retried by the send scheduler; this retries timeouts.
 
         Args:
             chat_id (int): The chat ID to send the message to.
             text (str): The message text.
             retries (int): Number of retry attempts in case of failure.
+            priority (int): Scheduler lane, PRIORITY_INTERACTIVE or PRIORITY_BULK.
         """
         for attempt in range(retries):
             try:
-                await self.send_message(chat_id, text, reply_markup)
+                await self.send_message(chat_id, text, reply_markup, priority=priority)
                 logger.info(f"Message successfully sent to chat {chat_id} on attempt {attempt + 1}.")
                 return
             except TimedOut as e:
@@ -106,6 +228,56 @@ class TelegramHelper:
                 logger.error(f"Error sending message to chat {chat_id}: {e}")
                 raise
 
+    async def send_plain(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Send an unformatted message and return it, so it can be edited later.
+        """
+        with span('telegram.send', priority=priority):
+            return await self.scheduler.send(
+                chat_id, lambda: self.bot.send_message(chat_id=chat_id, text=text), priority=priority
+            )
+
+    async def edit_message(self, chat_id: int, message_id: int, text: str, formatted: bool = False,
+                           priority: int = PRIORITY_INTERACTIVE):
+        """
+        Replace the text of a sent message. Edits count against the same per-chat limits as sends.
+
+        Args:
+            chat_id (int): The chat the message is in.
+            message_id (int): The message to edit.
+            text (str): The new text.
+            formatted (bool): Convert markdown with telegram_format and send as HTML,
+                falling back to plain text if Telegram rejects the markup.
+            priority (int): Scheduler lane, PRIORITY_INTERACTIVE or PRIORITY_BULK.
+        """
+        async def edit(new_text: str, parse_mode=None):
+            with span('telegram.edit', priority=priority):
+                await self.scheduler.send(
+                    chat_id,
+                    lambda: self.bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id, text=new_text, parse_mode=parse_mode
+                    ),
+                    priority=priority,
+                )
+
+        try:
+            if formatted:
+                try:
+                    await edit(telegram_format(text), ParseMode.HTML)
+                    return
+                except BadRequest as e:
+                    if 'not modified' in str(e).lower():
+                        return
+                    logger.warning(f"Formatted edit rejected in chat {chat_id}, sending plain text: {e}")
+            await edit(text)
+        except BadRequest as e:
+            # Editing with identical text is an error for Telegram, but not for us
+            if 'not modified' not in str(e).lower():
+                raise
+
+    def stream_reply(self, chat_id: int, edit_interval: float = 1.5) -> "StreamingReply":
+        return StreamingReply(self, chat_id, edit_interval=edit_interval)
+
     async def process_update(self, update_data: dict, handle: str = '') -> Optional[dict]:
         """
         Process a Telegram update and return structured data.
@@ -144,37 +316,35 @@ class TelegramHelper:
             # Use the helper function to extract and validate URLs
             extracted_urls = extract_valid_urls(content, entity_urls)
 
+            # File URLs are resolved lazily, see LazyFile.get_url
             file_info = None
             if message.document:
-                file = await message.document.get_file()
-                file_info = {
-                    'file_id': message.document.file_id,
-                    'file_name': message.document.file_name,
-                    'mime_type': message.document.mime_type,
-                    'file_size': message.document.file_size,
-                    'file_url': file.file_path
-                }
+                file_info = LazyFile(
+                    self.bot,
+                    file_id=message.document.file_id,
+                    file_name=message.document.file_name,
+                    mime_type=message.document.mime_type,
+                    file_size=message.document.file_size,
+                )
                 logger.info(f"Processed document from message: {file_info['file_name']}")
             elif message.photo:
                 photo = message.photo[-1]
-                file = await photo.get_file()
-                file_info = {
-                    'file_id': photo.file_id,
-                    'file_name': f"{photo.file_id}.jpg",
-                    'mime_type': 'image/jpeg',
-                    'file_size': photo.file_size,
-                    'file_url': file.file_path
-                }
+                file_info = LazyFile(
+                    self.bot,
+                    file_id=photo.file_id,
+                    file_name=f"{photo.file_id}.jpg",
+                    mime_type='image/jpeg',
+                    file_size=photo.file_size,
+                )
                 logger.info(f"Processed photo from message: {file_info['file_name']}")
             elif message.video:
-                file = await message.video.get_file()
-                file_info = {
-                    'file_id': message.video.file_id,
-                    'file_name': message.video.file_name,
-                    'mime_type': message.video.mime_type,
-                    'file_size': message.video.file_size,
-                    'file_url': file.file_path
-                }
+                file_info = LazyFile(
+                    self.bot,
+                    file_id=message.video.file_id,
+                    file_name=message.video.file_name,
+                    mime_type=message.video.mime_type,
+                    file_size=message.video.file_size,
+                )
                 logger.info(f"Processed video from message: {file_info['file_name']}")
 
             new_members = [
@@ -203,3 +373,77 @@ class TelegramHelper:
         except Exception as e:
             logger.error(f"Error processing update: {e}")
             return None
+
+
+class StreamingReply:
+    PLACEHOLDER = "✍️ ..."
+
+    def __init__(self, helper: TelegramHelper, chat_id: int, edit_interval: float = 1.5):
+        """
+        A reply that grows as the model generates it: a placeholder message is sent first,
+        then edited with the text so far at most once per edit_interval. Text beyond the
+        Telegram length limit continues in follow-up messages.
+
+        Args:
+            helper (TelegramHelper): Helper used to send and edit the messages.
+            chat_id (int): The chat to reply in.
+            edit_interval (float): Minimum seconds between two edits.
+        """
+        self.helper = helper
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.text = ''
+        self.message_ids: List[int] = []
+        self.shown: List[str] = []
+        self.last_edit = 0.0
+
+    async def start(self):
+        """
+        Send the placeholder message.
+        """
+        message = await self.helper.send_plain(self.chat_id, self.PLACEHOLDER)
+        self.message_ids.append(message.message_id)
+        self.shown.append(self.PLACEHOLDER)
+        self.last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        """
+        Record the text generated so far and show it if the last edit is old enough.
+        """
+        self.text = text
+        if time.monotonic() - self.last_edit >= self.edit_interval:
+            await self._render(final=False)
+
+    async def finish(self, text: str):
+        """
+        Show the complete text, formatted.
+        """
+        self.text = text
+        await self._render(final=True)
+
+    async def fail(self, notice: str):
+        """
+        End a reply that will not complete: the placeholder becomes the notice, or, if some
+        text was already shown, the notice follows it. Never raises, the caller is already handling an error.
+        """
+        try:
+            if self.message_ids and not self.text:
+                await self.helper.edit_message(self.chat_id, self.message_ids[0], notice, formatted=False)
+            else:
+                await self.helper.send_plain(self.chat_id, notice)
+        except Exception as e:
+            logger.error(f"Could not replace the placeholder in chat {self.chat_id}: {e}")
+
+    async def _render(self, final: bool):
+        parts = split_message(self.text) if self.text else [self.PLACEHOLDER]
+        for i, part in enumerate(parts):
+            if i >= len(self.message_ids) and final:
+                await self.helper.send_message(self.chat_id, part, None)
+            elif i >= len(self.message_ids):
+                message = await self.helper.send_plain(self.chat_id, part)
+                self.message_ids.append(message.message_id)
+                self.shown.append(part)
+            elif final or part != self.shown[i]:
+                await self.helper.edit_message(self.chat_id, self.message_ids[i], part, formatted=final)
+                self.shown[i] = part
+        self.last_edit = time.monotonic()
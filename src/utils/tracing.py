@@ -0,0 +1,200 @@
+# utils/tracing.py
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from config import TRACE_FILE, TRACE_OTLP_ENDPOINT
+from utils.metrics import percentile
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "supagrants"
+EXPORT_BATCH = 100  # spans per export
+
+_trace_id: ContextVar[Optional[str]] = ContextVar('trace_id', default=None)
+_span_id: ContextVar[Optional[str]] = ContextVar('span_id', default=None)
+
+
+def trace_id_for(update_id) -> str:
+    """
+    Correlation id of a Telegram update. Derived from the update id, so every stage
+    handling the update gets the same trace id without passing it along.
+    """
+    return hashlib.md5(str(update_id).encode()).hexdigest()
+
+
+def start_trace(update_id):
+    """
+    Make the current context record spans under the trace of this update.
+    """
+    _trace_id.set(trace_id_for(update_id))
+    _span_id.set(None)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+class Tracer:
+    def __init__(self, file_path: str = '', otlp_endpoint: str = '', window: int = 1000):
+        """
+        Collects finished spans: keeps the latest durations per stage for the summary,
+        and exports spans on a background thread as JSON lines and/or OTLP/HTTP JSON.
+
+        Args:
+            file_path (str): JSON lines file to append spans to. Empty to disable.
+            otlp_endpoint (str): Base URL of an OTLP/HTTP collector, e.g. http://localhost:4318. Empty to disable.
+            window (int): Durations kept per stage for the percentiles.
+        """
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint.rstrip('/')
+        self.durations: Dict[str, deque] = {}
+        self.window = window
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    @property
+    def exporting(self) -> bool:
+        return bool(self.file_path or self.otlp_endpoint)
+
+    def record(self, span: dict):
+        self.durations.setdefault(span['name'], deque(maxlen=self.window)).append(span['duration_ms'])
+        if not self.exporting:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=1))
+                except queue.Empty:
+                    break
+            try:
+                if self.file_path:
+                    self._write_jsonl(batch)
+                if self.otlp_endpoint:
+                    self._post_otlp(batch)
+            except Exception as e:
+                logger.error(f"Exporting {len(batch)} spans failed: {e}")
+
+    def _write_jsonl(self, batch):
+        with open(self.file_path, 'a') as f:
+            for span in batch:
+                f.write(json.dumps(span, default=str) + '\n')
+
+    def _post_otlp(self, batch):
+        spans = []
+        for span in batch:
+            otlp_span = {
+                'traceId': span['trace_id'],
+                'spanId': span['span_id'],
+                'name': span['name'],
+                'kind': 1,  # internal
+                'startTimeUnixNano': str(span['start_ns']),
+                'endTimeUnixNano': str(span['end_ns']),
+                'attributes': [
+                    {'key': key, 'value': {'stringValue': str(value)}} for key, value in span['attributes'].items()
+                ],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {'code': 1},
+            }
+            if span['parent_id']:
+                otlp_span['parentSpanId'] = span['parent_id']
+            spans.append(otlp_span)
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }]}
+        request = urllib.request.Request(
+            f"{self.otlp_endpoint}/v1/traces",
+            data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'},
+        )
+        urllib.request.urlopen(request, timeout=10).close()
+
+    def summary(self) -> dict:
+        """
+        Duration percentiles in milliseconds per stage.
+        """
+        return {
+            name: {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+            }
+            for name, values in sorted(self.durations.items())
+        }
+
+
+tracer = Tracer(file_path=TRACE_FILE, otlp_endpoint=TRACE_OTLP_ENDPOINT)
+
+
+def _finish(name: str, start_ns: int, end_ns: int, span_id: str, parent_id: Optional[str], error, attributes):
+    tracer.record({
+        'trace_id': _trace_id.get() or os.urandom(16).hex(),
+        'span_id': span_id,
+        'parent_id': parent_id,
+        'name': name,
+        'start_ns': start_ns,
+        'end_ns': end_ns,
+        'duration_ms': round((end_ns - start_ns) / 1e6, 3),
+        'error': error,
+        'attributes': attributes,
+    })
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage. Works in sync and async code; spans opened inside become its children.
+
+    Args:
+        name (str): Stage name, e.g. 'retrieval.sql'.
+        **attributes: Extra attributes exported with the span.
+    """
+    span_id = os.urandom(8).hex()
+    parent_id = _span_id.get()
+    token = _span_id.set(span_id)
+    start_ns = time.time_ns()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        _span_id.reset(token)
+        _finish(name, start_ns, time.time_ns(), span_id, parent_id, error, attributes)
+
+
+def record_span(name: str, duration: float, **attributes):
+    """
+    Record a stage that was timed elsewhere and just ended, e.g. from an agent's run metrics.
+
+    Args:
+        name (str): Stage name.
+        duration (float): Duration in seconds.
+        **attributes: Extra attributes exported with the span.
+    """
+    end_ns = time.time_ns()
+    _finish(name, end_ns - int(duration * 1e9), end_ns, os.urandom(8).hex(), _span_id.get(), None, attributes)
@@ -0,0 +1,216 @@
+# utils/update_queue.py
+
+import asyncio
+import functools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+from utils.mongo_aio import Mongo
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+RECORD_ATTEMPTS = 3  # writes of an update's outcome before it is left for recovery
+
+
+class UpdateQueue:
+    def __init__(
+        self,
+        mongo: Mongo,
+        handler: Callable[[dict], Awaitable[None]],
+        collection: str = 'update_queue',
+        max_in_flight: int = 64,
+        max_attempts: int = 3,
+        poll_interval: float = 1.0,
+        retention_hours: int = 24,
+        shard: int = 0,
+    ):
+        """
+        Durable queue of raw Telegram updates backed by MongoDB.
+
+        The webhook only persists the update and returns; a dispatcher claims pending
+        updates in order and starts `handler` on each without waiting for it, so a slow
+        chat never holds up the others. Each update is marked done or failed when its
+        handler finishes. Updates left in 'processing' by a crashed process are put back
+        to 'pending' on start.
+
+        Args:
+            mongo (Mongo): The shared Mongo wrapper.
+            handler (Callable): Coroutine function processing one raw update.
+            collection (str): Collection holding the queued updates.
+            max_in_flight (int): Updates being processed at once; claiming pauses beyond it.
+            max_attempts (int): Attempts before an update is marked as failed.
+            poll_interval (float): Seconds the idle dispatcher waits before polling Mongo again.
+            retention_hours (int): Hours finished updates are kept before the TTL index removes them.
+            shard (int): Worker process owning this queue; each process only claims its own updates.
+        """
+        self.mongo = mongo
+        self.handler = handler
+        self.collection = collection
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = timedelta(hours=retention_hours)
+        self.shard = shard
+
+        self._wakeup: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._finishing: Set[asyncio.Task] = set()
+
+    async def enqueue(self, update_data: dict) -> bool:
+        """
+        Persist a raw update so the dispatcher can pick it up.
+
+        Args:
+            update_data (dict): The update data received from Telegram.
+
+        Returns:
+            bool: True if the update was queued, False if it was already queued before.
+        """
+        item = {
+            '_id': update_data['update_id'],
+            'update': update_data,
+            'shard': self.shard,
+            'status': STATUS_PENDING,
+            'attempts': 0,
+            'created_at': datetime.now(timezone.utc),
+        }
+        try:
+            await self.mongo.insert(item, self.collection)
+        except DuplicateKeyError:
+            logger.info(f"Update {item['_id']} already queued, skipping.")
+            return False
+
+        if self._wakeup is not None:
+            self._wakeup.put_nowait(None)
+        logger.debug(f"Queued update {item['_id']}.")
+        return True
+
+    async def start(self):
+        """
+        Recover unfinished updates and start the dispatcher.
+        """
+        await self.mongo.createIndex('expire_at', self.collection, expireAfterSeconds=0)
+        await self.mongo.createIndex([('shard', 1), ('status', 1), ('_id', 1)], self.collection)
+        await self.recover()
+
+        self._wakeup = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logger.info(f"Update queue started on shard {self.shard} ({self.max_in_flight} updates in flight).")
+
+    async def stop(self):
+        """
+        Stop claiming and cancel the updates being processed. They stay in 'processing' and are recovered on next start.
+        """
+        tasks = list(self._in_flight) + ([self._dispatcher] if self._dispatcher else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*self._finishing, return_exceptions=True)
+        self._dispatcher = None
+        logger.info("Update queue stopped.")
+
+    async def recover(self):
+        """
+        Put updates claimed by a previous process back to pending.
+        """
+        await self.mongo.updateMany(
+            {'shard': self.shard, 'status': STATUS_PROCESSING}, 'status', STATUS_PENDING, self.collection
+        )
+        logger.info("Recovered unfinished updates from previous run.")
+
+    async def _claim(self) -> Optional[dict]:
+        """
+        Atomically claim the oldest pending update.
+        """
+        return await self.mongo.findOneAndUpdate(
+            {'shard': self.shard, 'status': STATUS_PENDING},
+            {
+                '$set': {'status': STATUS_PROCESSING, 'claimed_at': datetime.now(timezone.utc)},
+                '$inc': {'attempts': 1},
+            },
+            self.collection,
+            sort=[('_id', 1)],
+        )
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                item = await self._claim()
+            except BaseException:
+                self._slots.release()
+                raise
+            if not item:
+                self._slots.release()
+                try:
+                    await asyncio.wait_for(self._wakeup.get(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Tasks start in creation order, so handlers reach the per-chat shards in update order
+            task = asyncio.create_task(self.handler(item['update']))
+            self._in_flight.add(task)
+            task.add_done_callback(functools.partial(self._on_done, item))
+
+    def _on_done(self, item: dict, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._slots.release()
+        if task.cancelled():
+            return  # Stopping: left in 'processing' and recovered on next start
+        finishing = asyncio.create_task(self._finish(item, task.exception()))
+        self._finishing.add(finishing)
+        finishing.add_done_callback(self._finishing.discard)
+
+    async def _record(self, update_id, fields: dict) -> bool:
+        """
+        Write the outcome of an update, retrying with backoff. The Mongo wrapper logs and
+        swallows its errors, so a failed write shows as a None result, not an exception.
+
+        Returns:
+            bool: True if the outcome was written.
+        """
+        for attempt in range(RECORD_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(self.poll_interval * 2 ** (attempt - 1))
+            if await self.mongo.updateFields(update_id, fields, self.collection) is not None:
+                return True
+        # Left in 'processing'; recovered on next start
+        logger.error(f"Could not record the outcome of update {update_id} after {RECORD_ATTEMPTS} attempts.")
+        return False
+
+    async def _finish(self, item: dict, error: Optional[BaseException]):
+        update_id = item['_id']
+        if error is None:
+            if await self._record(update_id, {
+                'status': STATUS_DONE,
+                'expire_at': datetime.now(timezone.utc) + self.retention,
+            }):
+                logger.debug(f"Processed update {update_id}.")
+            return
+
+        failed = item['attempts'] >= self.max_attempts
+        logger.error(f"Failed on update {update_id} (attempt {item['attempts']}): {error}")
+        fields = {'status': STATUS_FAILED if failed else STATUS_PENDING, 'last_error': str(error)}
+        if failed:
+            fields['expire_at'] = datetime.now(timezone.utc) + self.retention
+        if await self._record(update_id, fields) and not failed and self._wakeup is not None:
+            self._wakeup.put_nowait(None)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._in_flight),
+            'max_in_flight': self.max_in_flight,
+        }